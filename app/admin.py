@@ -1,7 +1,12 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from . import pdf
 from .models import (
     Obra, Fase, Tarea, Personal, AsignacionPersonal, Material, Equipo, 
-    RequerimientoMaterial, ReglaEquipoMaterial, ReglaMaterialMaterial # Añadido Reglas
+    RequerimientoMaterial, ReglaEquipoMaterial, ReglaMaterialMaterial, # Añadido Reglas
+    Cotizacion,
 )
 
 # --- INLINES ---
@@ -69,6 +74,32 @@ class EquipoAdmin(admin.ModelAdmin):
     # Añadimos el nuevo inline de reglas
     inlines = [ReglaEquipoMaterialInline] 
 
+@admin.register(Cotizacion)
+class CotizacionAdmin(admin.ModelAdmin):
+    list_display = ('correlativo', 'nombre', 'cliente', 'fecha_generacion', 'fecha_modificacion')
+    list_filter = ('anio',)
+    date_hierarchy = 'fecha_generacion'
+    search_fields = ('correlativo', 'nombre', 'datos__cliente', 'revision_de__datos__cliente')
+    list_select_related = ('revision_de',)
+    actions = ['exportar_pdf_zip']
+
+    @admin.display(description='Cliente')
+    def cliente(self, obj):
+        return obj.documento.get('cliente', '')
+
+    @admin.action(description='Exportar PDF seleccionados (ZIP)')
+    def exportar_pdf_zip(self, request, queryset):
+        # Mismo proceso que el comando exportar_pdf_cotizaciones, enviado en
+        # streaming. Sin pool: un fork dentro de un worker web hereda sus
+        # hilos y conexiones. Los PDF ya en la caché en disco no se regeneran
+        respuesta = StreamingHttpResponse(
+            pdf.zip_en_streaming(queryset.order_by('anio', 'numero', 'revision'), procesos=1),
+            content_type='application/zip',
+        )
+        nombre = f"cotizaciones_{timezone.localdate():%Y%m%d}.zip"
+        respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return respuesta
+
 # Opcional: Registra los modelos de Regla (si no quieres gestionarlos como inline)
 admin.site.register(ReglaEquipoMaterial)
 admin.site.register(ReglaMaterialMaterial)
@@ -0,0 +1,219 @@
+"""
+Informe de demanda y conversión de cotizaciones: equipos y materiales más
+cotizados, valor cotizado por mes y cuántas cotizaciones terminaron en obra.
+
+Solo cuentan las cotizaciones base: sus revisiones (app.revisiones) son
+versiones de la misma oferta y no se suman aparte. Una base cuenta como
+convertida si de ella o de cualquiera de sus revisiones salió una obra.
+
+Los agregados se calculan en SQL sobre las líneas normalizadas (app.lineas)
+y se guardan por mes en ResumenCotizacionesMes. Cada mes lleva una huella
+del estado de sus cotizaciones; al pedir el informe solo se recalculan los
+meses cuya huella cambió (cotizaciones nuevas, editadas o borradas, u obras
+generadas desde ellas).
+"""
+import hashlib
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DateField, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from . import precios
+from .models import (
+    CorridaLinea, Cotizacion, CotizacionLinea, Equipo, Material, ResumenCotizacionesMes,
+)
+
+CERO = Decimal('0')
+CONVERTIDA = Q(obras__isnull=False) | Q(revisiones__obras__isnull=False)
+
+
+def leer_mes(texto):
+    """'AAAA-MM' -> date del primer día del mes; None si viene vacío."""
+    if not texto:
+        return None
+    try:
+        año, mes = (int(parte) for parte in texto.split('-')[:2])
+        return date(año, mes, 1)
+    except (TypeError, ValueError):
+        raise ValueError(f"Mes inválido: {texto!r} (se espera AAAA-MM).")
+
+
+def _por_mes(queryset, campo_fecha, desde=None, hasta=None):
+    queryset = queryset.annotate(mes=TruncMonth(campo_fecha, output_field=DateField()))
+    if desde:
+        queryset = queryset.filter(mes__gte=desde)
+    if hasta:
+        queryset = queryset.filter(mes__lte=hasta)
+    return queryset
+
+
+def _resumenes(desde=None, hasta=None):
+    resumenes = ResumenCotizacionesMes.objects.all()
+    if desde:
+        resumenes = resumenes.filter(mes__gte=desde)
+    if hasta:
+        resumenes = resumenes.filter(mes__lte=hasta)
+    return resumenes
+
+
+def huellas_por_mes(desde=None, hasta=None):
+    """{mes: huella} de los meses con cotizaciones, en una sola consulta."""
+    bases = Cotizacion.objects.filter(revision_de__isnull=True)
+    filas = _por_mes(bases, 'fecha_generacion', desde, hasta).values('mes').annotate(
+        total=Count('pk', distinct=True),
+        ultima=Max('fecha_modificacion'),
+        total_obras=Count('obras', distinct=True),
+        ultima_obra=Max('obras__pk'),
+        obras_revisiones=Count('revisiones__obras', distinct=True),
+        ultima_obra_revision=Max('revisiones__obras__pk'),
+    ).order_by()
+    return {
+        fila['mes']: hashlib.sha1(
+            f"{fila['total']}|{fila['ultima'].isoformat()}|{fila['total_obras']}|{fila['ultima_obra']}|"
+            f"{fila['obras_revisiones']}|{fila['ultima_obra_revision']}".encode()
+        ).hexdigest()
+        for fila in filas
+    }
+
+
+def _calcular_meses(meses):
+    """Agregados de los meses indicados: {mes: {campo: valor}} con tres consultas."""
+    resumenes = {
+        mes: {'cotizaciones': 0, 'convertidas': 0, 'valor_cotizado': CERO, 'materiales': {}, 'equipos': {}}
+        for mes in meses
+    }
+
+    bases = Cotizacion.objects.filter(revision_de__isnull=True)
+    conteos = _por_mes(bases, 'fecha_generacion').filter(mes__in=meses).values('mes').annotate(
+        total=Count('pk', distinct=True),
+        convertidas=Count('pk', filter=CONVERTIDA, distinct=True),
+    ).order_by()
+    for fila in conteos:
+        resumenes[fila['mes']]['cotizaciones'] = fila['total']
+        resumenes[fila['mes']]['convertidas'] = fila['convertidas']
+
+    materiales = _por_mes(
+        CotizacionLinea.objects.filter(cotizacion__revision_de__isnull=True), 'cotizacion__fecha_generacion'
+    ).filter(mes__in=meses).values('mes', 'material__codigo').annotate(
+        total_cantidad=Sum('cantidad'),
+        # Importes por línea en centavos (CotizacionLinea.importe, ver app.precios)
+        total_importe=Sum('importe'),
+        total_cotizaciones=Count('cotizacion', distinct=True),
+    ).order_by()
+    for fila in materiales:
+        resumen = resumenes[fila['mes']]
+        importe = precios.a_decimal(fila['total_importe'])
+        resumen['valor_cotizado'] += importe
+        resumen['materiales'][fila['material__codigo']] = [
+            str(fila['total_cantidad']), str(importe), fila['total_cotizaciones'],
+        ]
+
+    # Un equipo cuenta una vez por cotización base generada desde su corrida
+    equipos = _por_mes(
+        CorridaLinea.objects.filter(equipo__isnull=False, corrida__cotizacion__revision_de__isnull=True),
+        'corrida__cotizacion__fecha_generacion',
+    ).filter(mes__in=meses).values('mes', 'equipo__modelo').annotate(
+        total_cantidad=Sum('cantidad'),
+        total_cotizaciones=Count('corrida__cotizacion', distinct=True),
+    ).order_by()
+    for fila in equipos:
+        resumenes[fila['mes']]['equipos'][fila['equipo__modelo']] = [
+            fila['total_cantidad'], fila['total_cotizaciones'],
+        ]
+
+    return resumenes
+
+
+def actualizar_resumenes(desde=None, hasta=None, forzar=False):
+    """
+    Recalcula los meses (dentro del rango) cuyas cotizaciones cambiaron desde
+    el último cálculo, o todos con `forzar`, y borra los que se quedaron sin
+    cotizaciones. Devuelve la lista de meses recalculados.
+    """
+    huellas = huellas_por_mes(desde, hasta)
+    guardados = _resumenes(desde, hasta)
+    anteriores = dict(guardados.values_list('mes', 'huella'))
+    pendientes = sorted(mes for mes, huella in huellas.items() if forzar or anteriores.get(mes) != huella)
+
+    with transaction.atomic():
+        guardados.exclude(mes__in=huellas.keys()).delete()
+        if pendientes:
+            calculados = _calcular_meses(pendientes)
+            ResumenCotizacionesMes.objects.bulk_create(
+                [ResumenCotizacionesMes(mes=mes, huella=huellas[mes], **calculados[mes]) for mes in pendientes],
+                update_conflicts=True,
+                unique_fields=['mes'],
+                update_fields=[
+                    'huella', 'cotizaciones', 'convertidas', 'valor_cotizado',
+                    'materiales', 'equipos', 'fecha_calculo',
+                ],
+            )
+    return pendientes
+
+
+def _tasa(convertidas, cotizaciones):
+    return round(convertidas * 100 / cotizaciones, 1) if cotizaciones else 0
+
+
+def informe(desde=None, hasta=None, limite=10):
+    """
+    Informe del rango de meses [desde, hasta] (dates del primer día; None =
+    sin límite). Pone al día los resúmenes antes de leerlos.
+    """
+    recalculados = actualizar_resumenes(desde, hasta)
+    resumenes = list(_resumenes(desde, hasta))
+
+    meses = []
+    materiales, equipos = {}, {}
+    for resumen in resumenes:
+        meses.append({
+            'mes': resumen.mes,
+            'cotizaciones': resumen.cotizaciones,
+            'convertidas': resumen.convertidas,
+            'tasa_conversion': _tasa(resumen.convertidas, resumen.cotizaciones),
+            'valor_cotizado': resumen.valor_cotizado,
+        })
+        for codigo, (cantidad, importe, cotizaciones) in resumen.materiales.items():
+            acumulado = materiales.setdefault(codigo, [CERO, CERO, 0])
+            acumulado[0] += Decimal(cantidad)
+            acumulado[1] += Decimal(importe)
+            acumulado[2] += cotizaciones
+        for modelo, (cantidad, cotizaciones) in resumen.equipos.items():
+            acumulado = equipos.setdefault(modelo, [0, 0])
+            acumulado[0] += cantidad
+            acumulado[1] += cotizaciones
+
+    top_materiales = sorted(materiales.items(), key=lambda item: (-item[1][1], item[0]))[:limite]
+    top_equipos = sorted(equipos.items(), key=lambda item: (-item[1][0], item[0]))[:limite]
+    nombres_materiales = dict(
+        Material.objects.filter(codigo__in=[c for c, _ in top_materiales]).values_list('codigo', 'nombre')
+    )
+    nombres_equipos = dict(
+        Equipo.objects.filter(modelo__in=[m for m, _ in top_equipos]).values_list('modelo', 'nombre')
+    )
+
+    total_cotizaciones = sum(m['cotizaciones'] for m in meses)
+    total_convertidas = sum(m['convertidas'] for m in meses)
+    return {
+        'meses': meses,
+        'totales': {
+            'cotizaciones': total_cotizaciones,
+            'convertidas': total_convertidas,
+            'tasa_conversion': _tasa(total_convertidas, total_cotizaciones),
+            'valor_cotizado': sum((m['valor_cotizado'] for m in meses), CERO),
+        },
+        'materiales': [
+            {
+                'codigo': codigo, 'nombre': nombres_materiales.get(codigo, ''),
+                'cantidad': cantidad, 'importe': importe.quantize(Decimal('0.01')), 'cotizaciones': cotizaciones,
+            }
+            for codigo, (cantidad, importe, cotizaciones) in top_materiales
+        ],
+        'equipos': [
+            {'modelo': modelo, 'nombre': nombres_equipos.get(modelo, ''), 'cantidad': cantidad, 'cotizaciones': cotizaciones}
+            for modelo, (cantidad, cotizaciones) in top_equipos
+        ],
+        'meses_recalculados': recalculados,
+    }
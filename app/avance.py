@@ -0,0 +1,359 @@
+"""
+Mantenimiento de las tablas de resumen (ResumenTarea, ResumenFase, ResumenObra).
+
+Cada cambio en mediciones, requerimientos o costos recalcula solo la rama
+afectada: la tarea a partir de sus filas, la fase a partir de los resúmenes de
+sus tareas y la obra a partir de los resúmenes de sus fases. El número de
+consultas es constante sin importar el tamaño de la obra.
+
+Las operaciones en lote (requerimientos, mediciones) agrupan recálculos y
+registros de eliminación con efectos_diferidos.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Prefetch, Q, Sum, prefetch_related_objects
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import (
+    Obra,
+    Fase,
+    Tarea,
+    RequerimientoMaterial,
+    EliminacionSincronizada,
+    MedicionMaterial,
+    ResumenTarea,
+    ResumenFase,
+    ResumenObra,
+)
+
+CERO = Decimal('0')
+PRECISION_PORCENTAJE = Decimal('0.0001')
+PRECISION_COSTO = Decimal('0.0001')
+
+
+def _porcentaje(parte, total):
+    if total and total > 0:
+        return (parte / total * 100).quantize(PRECISION_PORCENTAJE)
+    return CERO.quantize(PRECISION_PORCENTAJE)
+
+
+def _promedio(suma, cantidad):
+    if cantidad:
+        return (suma / cantidad).quantize(PRECISION_PORCENTAJE)
+    return CERO.quantize(PRECISION_PORCENTAJE)
+
+
+def _ids(valores):
+    return {v for v in valores if v is not None}
+
+
+def _guardar(modelo, campo_pk, filas, crear):
+    """
+    Escribe las filas de resumen con un bulk_update. Con crear=False las filas
+    inexistentes se ignoran (por ejemplo durante un borrado en cascada).
+    """
+    if not filas:
+        return
+    ahora = timezone.now()
+    objetos = [
+        modelo(**{campo_pk: pk}, fecha_actualizacion=ahora, **valores)
+        for pk, valores in filas.items()
+    ]
+    campos = list(next(iter(filas.values())).keys()) + ['fecha_actualizacion']
+
+    if crear:
+        existentes = set(modelo.objects.filter(pk__in=filas.keys()).values_list('pk', flat=True))
+        modelo.objects.bulk_create([o for o in objetos if o.pk not in existentes])
+        objetos = [o for o in objetos if o.pk in existentes]
+
+    if objetos:
+        modelo.objects.bulk_update(objetos, campos)
+
+
+def recalcular_tareas(tarea_ids, crear=False, propagar=True):
+    tarea_ids = _ids(tarea_ids)
+    if not tarea_ids:
+        return
+
+    requeridos = {
+        r['tarea_id']: r for r in RequerimientoMaterial.objects
+        .filter(tarea_id__in=tarea_ids)
+        .values('tarea_id')
+        .annotate(num=Count('id'), total=Sum('cantidad_requerida'))
+    }
+    medidos = {
+        m['tarea_id']: m for m in MedicionMaterial.objects
+        .filter(tarea_id__in=tarea_ids)
+        .values('tarea_id')
+        .annotate(
+            total=Sum('cantidad'),
+            costo=Sum(
+                F('cantidad') * F('material__costo_unitario'),
+                output_field=DecimalField(max_digits=18, decimal_places=4)
+            ),
+        )
+    }
+    tareas = Tarea.objects.filter(pk__in=tarea_ids).values_list('pk', 'fase_id')
+
+    filas = {}
+    fase_ids = set()
+    for tarea_id, fase_id in tareas:
+        req = requeridos.get(tarea_id, {})
+        med = medidos.get(tarea_id, {})
+        total_requerido = req.get('total') or CERO
+        total_instalado = med.get('total') or CERO
+        filas[tarea_id] = {
+            'num_requerimientos': req.get('num', 0),
+            'cantidad_requerida': total_requerido,
+            'cantidad_instalada': total_instalado,
+            'costo_ejecutado': (med.get('costo') or CERO).quantize(PRECISION_COSTO),
+            'porcentaje_avance': _porcentaje(total_instalado, total_requerido),
+        }
+        fase_ids.add(fase_id)
+
+    _guardar(ResumenTarea, 'tarea_id', filas, crear)
+    if propagar:
+        recalcular_fases(fase_ids, crear=crear)
+
+
+def recalcular_fases(fase_ids, crear=False, propagar=True):
+    fase_ids = _ids(fase_ids)
+    if not fase_ids:
+        return
+
+    con_requerimientos = Q(resumen__num_requerimientos__gt=0)
+    agregados = {
+        a['fase_id']: a for a in Tarea.objects
+        .filter(fase_id__in=fase_ids)
+        .values('fase_id')
+        .annotate(
+            num_tareas=Count('id'),
+            con_req=Count('id', filter=con_requerimientos),
+            suma_porcentaje=Sum('resumen__porcentaje_avance', filter=con_requerimientos),
+            costo=Sum('resumen__costo_ejecutado'),
+        )
+    }
+    fases = Fase.objects.filter(pk__in=fase_ids).values_list('pk', 'obra_id', 'costo_mano_de_obra')
+
+    filas = {}
+    obra_ids = set()
+    for fase_id, obra_id, mano_de_obra in fases:
+        agg = agregados.get(fase_id, {})
+        costo = (agg.get('costo') or CERO) + (mano_de_obra or CERO)
+        filas[fase_id] = {
+            'num_tareas': agg.get('num_tareas', 0),
+            'num_tareas_con_requerimientos': agg.get('con_req', 0),
+            'costo_ejecutado': costo.quantize(PRECISION_COSTO),
+            'porcentaje_avance': _promedio(agg.get('suma_porcentaje') or CERO, agg.get('con_req', 0)),
+        }
+        obra_ids.add(obra_id)
+
+    _guardar(ResumenFase, 'fase_id', filas, crear)
+    if propagar:
+        recalcular_obras(obra_ids, crear=crear)
+
+
+def recalcular_obras(obra_ids, crear=False):
+    obra_ids = _ids(obra_ids)
+    if not obra_ids:
+        return
+
+    con_tareas = Q(resumen__num_tareas__gt=0)
+    agregados = {
+        a['obra_id']: a for a in Fase.objects
+        .filter(obra_id__in=obra_ids)
+        .values('obra_id')
+        .annotate(
+            con_tareas=Count('id', filter=con_tareas),
+            suma_porcentaje=Sum('resumen__porcentaje_avance', filter=con_tareas),
+            costo=Sum('resumen__costo_ejecutado'),
+        )
+    }
+
+    filas = {}
+    for obra_id in Obra.objects.filter(pk__in=obra_ids).values_list('pk', flat=True):
+        agg = agregados.get(obra_id, {})
+        filas[obra_id] = {
+            'num_fases_con_tareas': agg.get('con_tareas', 0),
+            'costo_ejecutado': (agg.get('costo') or CERO).quantize(PRECISION_COSTO),
+            'porcentaje_avance': _promedio(agg.get('suma_porcentaje') or CERO, agg.get('con_tareas', 0)),
+        }
+
+    _guardar(ResumenObra, 'obra_id', filas, crear)
+
+
+def recalcular_por_materiales(material_ids):
+    """Recalcula las tareas con mediciones de materiales cuyo costo cambió."""
+    tarea_ids = (
+        MedicionMaterial.objects
+        .filter(material_id__in=_ids(material_ids))
+        .values_list('tarea_id', flat=True)
+        .distinct()
+    )
+    recalcular_tareas(list(tarea_ids))
+
+
+def reconstruir(obras=None):
+    """
+    Reconstruye desde cero los resúmenes de las obras indicadas (todas por
+    defecto). Se procesa obra por obra para acotar el tamaño de cada consulta.
+    """
+    if obras is None:
+        obras = Obra.objects.all()
+    total = 0
+    for obra_id in list(obras.values_list('pk', flat=True)):
+        with transaction.atomic():
+            tarea_ids = Tarea.objects.filter(fase__obra_id=obra_id).values_list('pk', flat=True)
+            fase_ids = Fase.objects.filter(obra_id=obra_id).values_list('pk', flat=True)
+            recalcular_tareas(list(tarea_ids), crear=True, propagar=False)
+            recalcular_fases(list(fase_ids), crear=True, propagar=False)
+            recalcular_obras([obra_id], crear=True)
+        total += 1
+    return total
+
+
+# --- Efectos diferidos ---
+
+_diferidos = threading.local()
+
+
+@contextmanager
+def efectos_diferidos():
+    """
+    Dentro del bloque, los receptores de mediciones y requerimientos (ver
+    app.signals) solo anotan lo que tienen que hacer; al salir se recalculan
+    las tareas afectadas y se registran las eliminaciones de una sola vez.
+    Pensado para operaciones en lote (un queryset.delete() emite post_delete
+    por fila). Devuelve el conjunto de tareas a recalcular, para sumar las
+    que se modificaron con bulk_create/bulk_update, que no emiten señales.
+    """
+    pendientes = pendientes_diferidos()
+    if pendientes is not None:
+        # Bloque anidado: lo resuelve el más externo
+        yield pendientes['tareas']
+        return
+    pendientes = _diferidos.pendientes = {'tareas': set(), 'eliminaciones': []}
+    try:
+        yield pendientes['tareas']
+    finally:
+        _diferidos.pendientes = None
+    guardar_eliminaciones(pendientes['eliminaciones'])
+    recalcular_tareas(pendientes['tareas'])
+
+
+def pendientes_diferidos():
+    """{'tareas', 'eliminaciones'} del bloque efectos_diferidos en curso, o None."""
+    return getattr(_diferidos, 'pendientes', None)
+
+
+def guardar_eliminaciones(eliminaciones):
+    """
+    Registra los requerimientos/mediciones borrados para la sincronización
+    por deltas. eliminaciones: [(tarea_id, modelo, objeto_id)]
+    """
+    if not eliminaciones:
+        return
+    obras = dict(
+        Tarea.objects.filter(pk__in={tarea_id for tarea_id, _, _ in eliminaciones})
+        .values_list('pk', 'fase__obra_id')
+    )
+    EliminacionSincronizada.objects.bulk_create([
+        EliminacionSincronizada(obra_id=obras[tarea_id], modelo=modelo, objeto_id=objeto_id)
+        for tarea_id, modelo, objeto_id in eliminaciones
+        if tarea_id in obras
+    ])
+
+
+def _calcular_tarea(tarea):
+    requerimientos = tarea.requerimientomaterial_set.all()
+    mediciones = tarea.medicionmaterial_set.all()
+    total_requerido = sum((r.cantidad_requerida for r in requerimientos), CERO)
+    total_instalado = sum((m.cantidad for m in mediciones), CERO)
+    return {
+        'tarea': tarea,
+        'tiene_requerimientos': bool(requerimientos),
+        'porcentaje_avance': _porcentaje(total_instalado, total_requerido),
+        'costo_ejecutado': sum((m.cantidad * m.material.costo_unitario for m in mediciones), CERO),
+    }
+
+
+def _calcular_fase(fase):
+    tareas = [_calcular_tarea(tarea) for tarea in fase.tarea_set.all()]
+    con_requerimientos = [t for t in tareas if t['tiene_requerimientos']]
+    costo_tareas = sum((t['costo_ejecutado'] for t in tareas), CERO)
+    return {
+        'tareas': tareas,
+        'porcentaje_avance': _promedio(
+            sum((t['porcentaje_avance'] for t in con_requerimientos), CERO), len(con_requerimientos)
+        ),
+        'costo_ejecutado': costo_tareas + (fase.costo_mano_de_obra or CERO),
+    }
+
+
+PREFETCH_ARBOL_FASE = (
+    'tarea_set__requerimientomaterial_set',
+    Prefetch(
+        'tarea_set__medicionmaterial_set',
+        queryset=MedicionMaterial.objects.select_related('material'),
+    ),
+)
+
+
+class CalculadoraAvance:
+    """
+    Avance y costo de una obra para la vista de detalle.
+
+    Los totales de la obra salen de ResumenObra. El detalle de cada fase se
+    calcula en memoria solo cuando la plantilla lo pide (fragmento de caché
+    vencido); la primera fase que lo necesita precarga de una vez el árbol
+    tarea -> requerimientos/mediciones de todas las fases, así el número de
+    consultas no depende del tamaño de la obra.
+    """
+
+    def __init__(self, obra):
+        self.obra = obra
+        resumen = obra.resumen_avance
+        self.porcentaje_avance = resumen.porcentaje_avance
+        self.costo_ejecutado = resumen.costo_ejecutado
+        self._fases = list(obra.fase_set.all())
+        self._arbol_cargado = False
+        self.fases = [FaseAvance(self, fase) for fase in self._fases]
+
+    def cargar_arbol(self):
+        if not self._arbol_cargado:
+            prefetch_related_objects(self._fases, *PREFETCH_ARBOL_FASE)
+            self._arbol_cargado = True
+
+
+class FaseAvance:
+    """Detalle diferido de una fase dentro de CalculadoraAvance."""
+
+    def __init__(self, calculadora, fase):
+        self._calculadora = calculadora
+        self.fase = fase
+
+    @property
+    def version(self):
+        # Sello que cambia con cada recálculo de la fase (ver recalcular_fases)
+        return f"{self.fase.resumen_avance.fecha_actualizacion.timestamp():.6f}"
+
+    @cached_property
+    def _datos(self):
+        self._calculadora.cargar_arbol()
+        return _calcular_fase(self.fase)
+
+    @property
+    def tareas(self):
+        return self._datos['tareas']
+
+    @property
+    def porcentaje_avance(self):
+        return self._datos['porcentaje_avance']
+
+    @property
+    def costo_ejecutado(self):
+        return self._datos['costo_ejecutado']
@@ -0,0 +1,131 @@
+"""
+Búsqueda en el catálogo de materiales para los formularios que solo muestran
+los materiales seleccionados y piden el resto bajo demanda.
+
+En SQLite las palabras se buscan en un índice FTS5 (TABLA_FTS) sobre código
+y nombre, sin acentos ni mayúsculas y con índice de prefijos: cada búsqueda
+es una consulta al índice, no un recorrido de la tabla. El índice es de
+contenido externo y lo mantienen triggers sobre app_material, así que
+también ve las cargas por SQL directo (materiales.py). instalar_indice corre
+después de cada migrate porque SQLite recrea la tabla al alterar sus
+columnas y con ella pierde los triggers. En otros motores se usa
+nombre_busqueda con LIKE, que recorre la tabla.
+"""
+import re
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Material, normalizar_busqueda
+
+MATERIALES_POR_PAGINA = 25
+CAMPOS_RESULTADO = ('pk', 'codigo', 'nombre', 'unidad', 'familia', 'sistema')
+
+TABLA_FTS = 'app_material_fts'
+_SQL_INDICE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        codigo, nombre, content='app_material', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON app_material BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, codigo, nombre) VALUES (new.id, new.codigo, new.nombre);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON app_material BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, codigo, nombre) VALUES ('delete', old.id, old.codigo, old.nombre);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF codigo, nombre ON app_material BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, codigo, nombre) VALUES ('delete', old.id, old.codigo, old.nombre);
+        INSERT INTO {TABLA_FTS}(rowid, codigo, nombre) VALUES (new.id, new.codigo, new.nombre);
+    END""",
+]
+
+
+def _usa_fts(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def instalar_indice(using='default'):
+    """
+    Crea el índice FTS y sus triggers si faltan y, en ese caso, lo reconstruye
+    desde app_material. Sin efecto si ya están o si el motor no es SQLite.
+    """
+    if not _usa_fts(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [TABLA_FTS, f'{TABLA_FTS}_ai', f'{TABLA_FTS}_ad', f'{TABLA_FTS}_au'],
+        )
+        if cursor.fetchone()[0] == 4:
+            return False
+        for sql in _SQL_INDICE:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+    return True
+
+
+def _consulta_fts(texto):
+    """
+    Expresión MATCH: por cada palabra, sus tokens como frase con el último
+    como prefijo ("tub 1"* encuentra TUB-1/2 y "tuberia de 1"), todas
+    obligatorias. None si el texto no tiene letras ni números.
+    """
+    frases = []
+    for palabra in texto.split():
+        tokens = re.findall(r'[a-z0-9]+', normalizar_busqueda(palabra))
+        if tokens:
+            frases.append('"' + ' '.join(tokens) + '"*')
+    return ' '.join(frases) or None
+
+
+def buscar_materiales(texto='', familia=None, sistema=None):
+    """
+    Cada palabra de `texto` debe coincidir con el inicio de alguna palabra
+    del código o del nombre, sin distinguir acentos ni mayúsculas. familia y
+    sistema filtran por igualdad (índice material_sistema_familia).
+    """
+    materiales = Material.objects.all()
+    if sistema:
+        materiales = materiales.filter(sistema=sistema)
+    if familia:
+        materiales = materiales.filter(familia=familia)
+    if _usa_fts(materiales.db):
+        consulta = _consulta_fts(texto)
+        if consulta:
+            materiales = materiales.filter(
+                pk__in=RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", [consulta])
+            )
+        return materiales.order_by('nombre', 'pk')
+
+    for palabra in texto.split():
+        normalizada = normalizar_busqueda(palabra)
+        condicion = Q(codigo__istartswith=palabra)
+        if normalizada:
+            condicion |= Q(nombre_busqueda__startswith=normalizada)
+            condicion |= Q(nombre_busqueda__contains=f' {normalizada}')
+        materiales = materiales.filter(condicion)
+    return materiales.order_by('nombre', 'pk')
+
+
+def familias():
+    """Familias del catálogo para el filtro del buscador, en orden alfabético."""
+    return list(
+        Material.objects.exclude(familia='').order_by('familia').values_list('familia', flat=True).distinct()
+    )
+
+
+def pagina_de_resultados(materiales, numero_pagina):
+    paginator = Paginator(materiales.values(*CAMPOS_RESULTADO), MATERIALES_POR_PAGINA)
+    pagina = paginator.get_page(numero_pagina)
+    return {
+        'resultados': [
+            {'id': m['pk'], **{campo: m[campo] for campo in CAMPOS_RESULTADO[1:]}}
+            for m in pagina
+        ],
+        'pagina': pagina.number,
+        'paginas': paginator.num_pages,
+        'total': paginator.count,
+        'hay_siguiente': pagina.has_next(),
+    }
@@ -0,0 +1,290 @@
+"""
+Generación de cotizaciones a partir de una Corrida: explosión de materiales
+con el motor de reglas, costeo con utilidad y guardado con correlativo
+anual. Lo usan CotizacionCreateView y el comando regenerar_cotizaciones,
+así ambos producen exactamente lo mismo.
+"""
+import hashlib
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.text import slugify
+
+from . import precios, reglas, revisiones
+from .models import Corrida, Cotizacion, Material
+
+
+def obtener_costos_materiales(materiales_dict):
+    """
+    Obtiene los costos unitarios de los materiales requeridos.
+    Retorna un diccionario mapeando código de material a su costo unitario.
+    """
+    materiales_info = Material.objects.filter(
+        codigo__in=materiales_dict.keys()
+    ).values_list('codigo', 'costo_unitario')
+    return {codigo: Decimal(str(costo)) for codigo, costo in materiales_info}
+
+
+def linea_cotizacion(cantidad, costo, utilidad=precios.UTILIDAD_POR_DEFECTO):
+    """Línea del JSON: cantidad y precio unitario con utilidad, redondeado al centavo."""
+    return {
+        'cantidad': float(cantidad),
+        'costo_unitario': precios.a_numero(precios.precio_con_utilidad(precios.a_centavos(costo), utilidad)),
+    }
+
+
+def calcular_datos_cotizacion(datos_corrida, grafo=None, costos=None, materiales=None):
+    """
+    JSON `datos` de la cotización de una corrida. `grafo` y `costos`
+    ({codigo: Decimal}) se pueden pasar ya cargados para no consultar la
+    base de datos, p. ej. desde un proceso de trabajo, y `materiales` ya
+    explotados en lote (GrafoReglas.explotar_corridas).
+    """
+    if materiales is None:
+        if grafo is None:
+            grafo = reglas.obtener_grafo()
+        materiales = grafo.explotar_corrida(datos_corrida)
+    if costos is None:
+        costos = obtener_costos_materiales(materiales)
+
+    materiales_finales = {
+        codigo: linea_cotizacion(cantidad_dec, costos.get(codigo, Decimal('0.00')))
+        for codigo, cantidad_dec in materiales.items()
+    }
+
+    return {
+        'cliente': datos_corrida.get('cliente', ''),
+        'direccion_proyecto': datos_corrida.get('direccion_proyecto', ''),
+        'descripcion': datos_corrida.get('descripcion', ''),
+        'ingeniero_encargado': datos_corrida.get('ingeniero_encargado', ''),
+        'materiales': materiales_finales
+    }
+
+
+def _nuevo_correlativo(corrida):
+    """Correlativo, año y número de la siguiente cotización del año (MAX sobre anio/numero)."""
+    año_actual = datetime.now().year
+    ultimo_numero = Cotizacion.objects.filter(anio=año_actual).aggregate(ultimo=Max('numero'))['ultimo']
+    nuevo_numero = (ultimo_numero or 0) + 1
+
+    nombre_slug = slugify(corrida.nombre).replace('-', '_')
+    return {
+        'correlativo': f"COT-{año_actual}-GS-I-{nuevo_numero:03d}-{nombre_slug}",
+        'anio': año_actual,
+        'numero': nuevo_numero,
+    }
+
+
+def guardar_cotizacion(corrida, datos_cotizacion, huellas=None):
+    """
+    Crea o reemplaza la cotización (base) de la corrida. Si ya existía
+    conserva su correlativo y sus revisiones; si es nueva le asigna el
+    siguiente del año. `huellas` son las de las entradas usadas (campos de
+    ENTRADAS). Debe llamarse dentro de una transacción.
+    """
+    defaults = {
+        'nombre': corrida.nombre,
+        'datos': datos_cotizacion,
+        **(huellas or {}),
+    }
+    cotizacion_existente = cotizacion_base(corrida)
+    if cotizacion_existente:
+        # Sus revisiones son deltas contra el JSON que se va a reemplazar
+        revisiones.rebasar(cotizacion_existente, datos_cotizacion)
+        return Cotizacion.objects.update_or_create(pk=cotizacion_existente.pk, defaults=defaults)
+
+    return Cotizacion.objects.create(
+        corrida=corrida, **_nuevo_correlativo(corrida), **defaults
+    ), True
+
+
+def cotizacion_base(corrida):
+    """La cotización generada para la corrida (no sus revisiones), o None."""
+    return Cotizacion.objects.filter(corrida=corrida, revision_de__isnull=True).order_by('pk').first()
+
+
+# --- Huellas de las entradas ---
+
+# Campo de Cotizacion -> entrada que resume, para avisar qué cambió
+ENTRADAS = {
+    'huella_corrida': 'los datos de la corrida',
+    'huella_reglas': 'las reglas de materiales',
+    'huella_precios': 'la lista de precios',
+}
+
+
+def _sha256(texto):
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+def huella_datos(datos):
+    """Huella del JSON de una corrida, independiente del orden de las claves."""
+    return _sha256(json.dumps(datos, sort_keys=True, separators=(',', ':'), default=str))
+
+
+def huella_precios(costos=None):
+    """
+    Huella de la lista de precios completa ({codigo: Decimal}). Sin `costos`
+    la lee de la base de datos.
+    """
+    if costos is None:
+        costos = Material.objects.values_list('codigo', 'costo_unitario')
+    else:
+        costos = costos.items()
+    return _sha256('\n'.join(sorted(f'{codigo}={Decimal(str(costo))}' for codigo, costo in costos)))
+
+
+def generar_cotizacion(corrida):
+    """
+    Genera la cotización de la corrida solo si cambió alguna de sus entradas
+    (datos de la corrida, reglas o precios). Devuelve (cotizacion, cambios):
+    `cambios` es la lista de campos de ENTRADAS que difieren de los guardados,
+    vacía si se devolvió la cotización existente sin recalcular y None si no
+    había huellas con qué comparar (cotización nueva o anterior a las huellas).
+    """
+    grafo = reglas.obtener_grafo()
+    with transaction.atomic():
+        # Bloquea la corrida para que dos peticiones simultáneas no generen dos veces
+        corrida = Corrida.objects.select_for_update().get(pk=corrida.pk)
+        huellas = {
+            'huella_corrida': huella_datos(corrida.datos),
+            'huella_reglas': grafo.firma,
+            'huella_precios': huella_precios(),
+        }
+        existente = cotizacion_base(corrida)
+        if existente is None or not existente.huella_corrida:
+            # Nueva, o generada antes de guardar huellas: no hay con qué comparar
+            cambios = None
+        else:
+            cambios = [campo for campo in ENTRADAS if getattr(existente, campo) != huellas[campo]]
+            if not cambios:
+                # El nombre no entra en las huellas: si se renombró la corrida
+                # basta con copiarlo (fecha_modificacion renueva el PDF en caché)
+                if existente.nombre != corrida.nombre:
+                    existente.nombre = corrida.nombre
+                    existente.save(update_fields=['nombre', 'fecha_modificacion'])
+                return existente, cambios
+
+        datos_cotizacion = calcular_datos_cotizacion(corrida.datos, grafo)
+        cotizacion, _ = guardar_cotizacion(corrida, datos_cotizacion, huellas)
+    return cotizacion, cambios
+
+
+# --- Vista previa del asistente de corridas ---
+
+class ErrorVistaPrevia(Exception):
+    pass
+
+
+def _leer_entradas(entradas):
+    """{'equipos': {...}, 'tuberias': {...}} con enteros positivos (los ceros se descartan)."""
+    if not isinstance(entradas, dict):
+        raise ErrorVistaPrevia("Se esperaba un objeto con 'equipos' y 'tuberias'.")
+    leidas = {}
+    for grupo in ('equipos', 'tuberias'):
+        valores = entradas.get(grupo) or {}
+        if not isinstance(valores, dict):
+            raise ErrorVistaPrevia(f"'{grupo}' debe ser un objeto {{código: cantidad}}.")
+        leidas[grupo] = {}
+        for clave, valor in valores.items():
+            if valor in (None, ''):
+                continue
+            try:
+                cantidad = int(valor)
+            except (TypeError, ValueError):
+                raise ErrorVistaPrevia(f"Cantidad inválida para {clave}: {valor!r}.")
+            if cantidad < 0:
+                raise ErrorVistaPrevia(f"Cantidad negativa para {clave}.")
+            if cantidad:
+                leidas[grupo][str(clave)] = cantidad
+    return leidas
+
+
+def _cantidades_incrementales(grafo, entradas, estado):
+    """
+    Aplica sobre los totales del estado anterior solo la diferencia de las
+    entradas que cambiaron: cada equipo o tubería aporta cantidad x su
+    expansión unitaria, así que cambiar un equipo recorre solo su subárbol.
+    """
+    if estado and estado.get('firma') == grafo.firma:
+        anteriores = estado['entradas']
+        totales = {codigo: Decimal(cantidad) for codigo, cantidad in estado['totales'].items()}
+    else:
+        anteriores = {'equipos': {}, 'tuberias': {}}
+        totales = {}
+
+    cambios = 0
+    for tipo, grupo in (('equipo', 'equipos'), ('tuberia', 'tuberias')):
+        nuevas, viejas = entradas[grupo], anteriores.get(grupo, {})
+        for clave in nuevas.keys() | viejas.keys():
+            delta = nuevas.get(clave, 0) - viejas.get(clave, 0)
+            if not delta:
+                continue
+            cambios += 1
+            for codigo, factor in grafo.expansion_unitaria(tipo, clave).items():
+                totales[codigo] = totales.get(codigo, Decimal('0')) + delta * factor
+    return {codigo: cantidad for codigo, cantidad in totales.items() if cantidad}, cambios
+
+
+def vista_previa(entradas, estado=None):
+    """
+    Materiales, subtotales por familia y total de una corrida en edición.
+    `estado` es el que devolvió la llamada anterior de la misma sesión;
+    devuelve (respuesta, estado_nuevo). Las cantidades coinciden con
+    calcular_datos_cotizacion.
+    """
+    entradas = _leer_entradas(entradas)
+    grafo = reglas.obtener_grafo()
+
+    if grafo.lineal:
+        totales, cambios = _cantidades_incrementales(grafo, entradas, estado)
+        materiales = {codigo: cantidad for codigo, cantidad in totales.items() if cantidad > 0}
+        estado_nuevo = {
+            'firma': grafo.firma,
+            'entradas': entradas,
+            'totales': {codigo: str(cantidad) for codigo, cantidad in totales.items()},
+        }
+    else:
+        # Con coeficientes negativos la expansión no es lineal: se recalcula todo
+        materiales = grafo.explotar_corrida(entradas)
+        cambios = None
+        estado_nuevo = None
+
+    catalogo = {
+        codigo: (nombre, unidad, familia, costo)
+        for codigo, nombre, unidad, familia, costo in Material.objects.filter(
+            codigo__in=materiales.keys()
+        ).values_list('codigo', 'nombre', 'unidad', 'familia', 'costo_unitario')
+    }
+    # Mismas líneas y el mismo motor de precios que la cotización guardada
+    sin_catalogo = ('', '', 'SIN CATÁLOGO', Decimal('0.00'))
+    lineas = {
+        codigo: linea_cotizacion(cantidad_dec, catalogo.get(codigo, sin_catalogo)[3])
+        for codigo, cantidad_dec in materiales.items()
+    }
+    presupuesto = precios.Presupuesto.desde_materiales(
+        lineas, {codigo: catalogo.get(codigo, sin_catalogo)[2] for codigo in lineas}
+    )
+    filas = []
+    for codigo, familia, _, precio, importe in presupuesto.lineas():
+        nombre, unidad, _, _ = catalogo.get(codigo, sin_catalogo)
+        filas.append({
+            'codigo': codigo, 'nombre': nombre, 'unidad': unidad, 'familia': familia,
+            'cantidad': lineas[codigo]['cantidad'], 'costo_unitario': precios.a_numero(precio),
+            'subtotal': precios.a_numero(importe),
+        })
+    filas.sort(key=lambda f: (f['familia'], f['nombre'], f['codigo']))
+
+    respuesta = {
+        'materiales': filas,
+        'familias': [
+            {'familia': f, 'subtotal': precios.a_numero(presupuesto.subtotales[f])}
+            for f in sorted(presupuesto.subtotales)
+        ],
+        'total': precios.a_numero(presupuesto.total),
+        'entradas_recalculadas': cambios,
+    }
+    return respuesta, estado_nuevo
@@ -0,0 +1,175 @@
+"""
+Exportación de listados a CSV o XLSX en streaming. Las filas salen de un
+cursor del servidor (queryset.iterator) y se escriben en la respuesta a
+medida que se leen, así que la memoria no depende del tamaño de la tabla.
+
+El XLSX se arma con la biblioteca estándar (un ZIP con las partes XML
+mínimas de un libro de una hoja y celdas de texto en línea): zipfile puede
+escribirlo en un flujo sin seek, igual que el ZIP de PDF (ver app.pdf).
+
+Cada listado declara sus columnas como [(título, función(objeto))]; las
+vistas basadas en ListView usan ExportarListadoMixin, que respeta los
+filtros de su get_queryset, y las demás llaman a respuesta_exportacion.
+"""
+import csv
+import datetime
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.text import slugify
+
+PARAMETRO = 'exportar'
+FILAS_POR_LECTURA = 2000
+
+
+class Flujo:
+    """Destino de escritura sin seek que guarda lo escrito hasta que se lo vacía."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        partes, self._partes = self._partes, []
+        return partes
+
+
+def _valores(objetos, columnas):
+    for objeto in objetos:
+        yield [funcion(objeto) for _, funcion in columnas]
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        valor = timezone.localtime(valor) if timezone.is_aware(valor) else valor
+        return valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    return str(valor)
+
+
+# --- CSV ---
+
+def filas_csv(objetos, columnas):
+    flujo = Flujo()
+    escritor = csv.writer(flujo)
+    # BOM: Excel abre el archivo como UTF-8 y respeta los acentos
+    yield '\ufeff'
+    escritor.writerow([titulo for titulo, _ in columnas])
+    for valores in _valores(objetos, columnas):
+        escritor.writerow([_texto(valor) for valor in valores])
+        yield from flujo.vaciar()
+    yield from flujo.vaciar()
+
+
+# --- XLSX ---
+
+_TIPOS_XLSX = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_RELACIONES_XLSX = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_LIBRO_XLSX = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_RELACIONES_LIBRO_XLSX = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+_INICIO_HOJA_XLSX = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+_FIN_HOJA_XLSX = "</sheetData></worksheet>"
+
+
+def _celda_xlsx(valor):
+    # Los números van como números; todo lo demás, como texto en línea
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = _texto(valor)
+    if not texto:
+        return '<c/>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return '<row>' + ''.join(_celda_xlsx(valor) for valor in valores) + '</row>'
+
+
+def filas_xlsx(objetos, columnas, hoja='Datos'):
+    flujo = Flujo()
+    with zipfile.ZipFile(flujo, 'w', zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', _TIPOS_XLSX)
+        libro.writestr('_rels/.rels', _RELACIONES_XLSX)
+        libro.writestr('xl/workbook.xml', _LIBRO_XLSX.format(hoja=escape(hoja[:31], {'"': '&quot;'})))
+        libro.writestr('xl/_rels/workbook.xml.rels', _RELACIONES_LIBRO_XLSX)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja_xml:
+            hoja_xml.write((_INICIO_HOJA_XLSX + _fila_xlsx(titulo for titulo, _ in columnas)).encode())
+            for valores in _valores(objetos, columnas):
+                hoja_xml.write(_fila_xlsx(valores).encode())
+                yield from flujo.vaciar()
+            hoja_xml.write(_FIN_HOJA_XLSX.encode())
+    # Directorio central del ZIP, escrito al cerrarlo
+    yield from flujo.vaciar()
+
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', filas_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filas_xlsx),
+}
+
+
+def formato_pedido(request):
+    """'csv', 'xlsx' o None según ?exportar=."""
+    formato = request.GET.get(PARAMETRO)
+    return formato if formato in FORMATOS else None
+
+
+def respuesta_exportacion(queryset, columnas, nombre, formato):
+    """StreamingHttpResponse con el listado completo de `queryset` en `formato`."""
+    tipo, generar = FORMATOS[formato]
+    objetos = queryset.iterator(chunk_size=FILAS_POR_LECTURA)
+    respuesta = StreamingHttpResponse(generar(objetos, columnas), content_type=tipo)
+    archivo = f"{slugify(nombre)}_{timezone.localdate():%Y%m%d}.{formato}"
+    respuesta['Content-Disposition'] = f'attachment; filename="{archivo}"'
+    return respuesta
+
+
+class ExportarListadoMixin:
+    """
+    ListView que con ?exportar=csv|xlsx devuelve toda la tabla (sin paginar)
+    con los filtros de get_queryset. La subclase define `columnas_exportacion`
+    y `nombre_exportacion`.
+    """
+    columnas_exportacion = []
+    nombre_exportacion = 'listado'
+
+    def get(self, request, *args, **kwargs):
+        formato = formato_pedido(request)
+        if formato is None:
+            return super().get(request, *args, **kwargs)
+        return respuesta_exportacion(
+            self.get_queryset(), self.columnas_exportacion, self.nombre_exportacion, formato
+        )
@@ -0,0 +1,385 @@
+"""
+Diagrama de Gantt de una obra dibujado en el servidor, para el informe PDF
+y para descargarlo o enviarlo como SVG.
+
+El cronograma (fases seguidas de sus tareas, con su avance) se maqueta una
+vez en un Diagrama: coordenadas de barras y etiquetas en un lienzo de ANCHO
+unidades. Con él se escriben el SVG y los dibujos de ReportLab, así que los
+dos salen iguales. El Diagrama (JSON) y el SVG se guardan en disco
+(settings.GANTT_CACHE_DIR) con un nombre que incluye el sello de versión de
+la obra (ver `version`): mientras el cronograma no cambie no se vuelve a
+consultar ni a maquetar.
+
+No se dibuja la línea de "hoy": haría cambiar el archivo cada día aunque la
+obra no cambie.
+"""
+import json
+import math
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from functools import cache
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from reportlab.graphics.shapes import Drawing, Group, Line, Rect, String
+from reportlab.lib import colors
+
+from .models import ResumenFase, Tarea
+
+# Subir al cambiar el diseño del diagrama: descarta todo lo que hay en caché
+VERSION_DISENO = 1
+
+ANCHO = 1000
+ANCHO_ETIQUETAS = 230
+ALTO_EJE = 34
+ALTO_FILA = 20
+ALTO_BARRA = 12
+MARGEN = 10
+TAMANO_LETRA = 9
+CARACTERES_ETIQUETA = 40
+# Separación mínima entre marcas del eje, en unidades del lienzo
+SEPARACION_EJE = 55
+# Hasta este largo el eje marca semanas; después, meses
+DIAS_POR_SEMANAS = 120
+
+MESES = ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+
+# (barra, avance) por tipo de fila
+COLORES = {
+    'fase': ('#8fa9c9', '#2f5d8f'),
+    'tarea': ('#c8d8ea', '#5b8cc2'),
+}
+COLOR_FONDO_FASE = '#f0f3f7'
+COLOR_GUIA = '#e2e2e2'
+COLOR_TEXTO = '#222222'
+
+
+def version(obra_id):
+    """
+    Sello de versión del cronograma: toda alta, edición o baja de tareas,
+    requerimientos o mediciones recalcula el ResumenFase de su fase, así que
+    basta con la fecha más reciente y el número de fases.
+    """
+    return ResumenFase.objects.filter(fase__obra_id=obra_id).aggregate(
+        ultima=Max('fecha_actualizacion'), fases=Count('pk')
+    )
+
+
+def filas(obra_id):
+    """
+    Fases y tareas de la obra en el orden del diagrama: cada fase seguida de
+    sus tareas, las fases por su tarea más temprana. Cada fila es un dict con
+    id, nombre, tipo ('fase' o 'tarea'), padre, inicio, fin y avance (%).
+    """
+    # 1. Una sola consulta: tareas con su fase y su avance (ResumenTarea),
+    # ordenadas cronológicamente
+    tareas = (
+        Tarea.objects.filter(fase__obra_id=obra_id)
+        .select_related('fase', 'resumen')
+        .order_by('fecha_inicio', 'fase__id')
+    )
+
+    # 2. Una sola pasada: agrupamos por fase en orden de primera aparición.
+    # Como las tareas vienen ordenadas por fecha de inicio (y fase), eso deja
+    # las fases ordenadas por su fecha de inicio más temprana.
+    fases = {}
+    for tarea in tareas:
+        grupo = fases.get(tarea.fase_id)
+        if grupo is None:
+            grupo = fases[tarea.fase_id] = {'fase': tarea.fase, 'tareas': []}
+        grupo['tareas'].append(tarea)
+
+    # 3. Cada fase (el padre) va seguida inmediatamente de sus tareas
+    resultado = []
+    for fase_id, grupo in fases.items():
+        tareas_en_fase = grupo['tareas']
+        avances = [
+            tarea.resumen.porcentaje_avance if hasattr(tarea, 'resumen') else Decimal('0.00')
+            for tarea in tareas_en_fase
+        ]
+        resultado.append({
+            'id': f'fase-{fase_id}',
+            'nombre': grupo['fase'].nombre,
+            'tipo': 'fase',
+            'padre': None,
+            'inicio': min(t.fecha_inicio for t in tareas_en_fase),
+            'fin': max(t.fecha_fin_estimada for t in tareas_en_fase),
+            'avance': float(sum(avances) / len(avances)),
+        })
+        for tarea, avance_tarea in zip(tareas_en_fase, avances):
+            resultado.append({
+                'id': f'tarea-{tarea.id}',
+                'nombre': tarea.nombre,
+                'tipo': 'tarea',
+                'padre': f'fase-{fase_id}',
+                'inicio': tarea.fecha_inicio,
+                'fin': tarea.fecha_fin_estimada,
+                'avance': float(avance_tarea),
+            })
+    return resultado
+
+
+def _recortar(texto, largo=CARACTERES_ETIQUETA):
+    return texto if len(texto) <= largo else texto[:largo - 1] + '…'
+
+
+def _marcas_eje(inicio, dias, escala):
+    """[(x, etiqueta)]: lunes en cronogramas de hasta DIAS_POR_SEMANAS, meses en los demás."""
+    if dias <= DIAS_POR_SEMANAS:
+        paso = math.ceil(SEPARACION_EJE / (7 * escala))
+        primero = (7 - inicio.weekday()) % 7
+        return [
+            (ANCHO_ETIQUETAS + dia * escala, _fecha_corta(inicio.toordinal() + dia))
+            for dia in range(primero, dias, 7 * paso)
+        ]
+    paso = math.ceil(SEPARACION_EJE / (30.4 * escala))
+    anio, mes = inicio.year, inicio.month
+    if inicio.day > 1:
+        anio, mes = anio + mes // 12, mes % 12 + 1
+    marcas = []
+    while True:
+        dia = inicio.replace(year=anio, month=mes, day=1).toordinal() - inicio.toordinal()
+        if dia >= dias:
+            return marcas
+        marcas.append((ANCHO_ETIQUETAS + dia * escala, f"{MESES[mes - 1]} {anio}"))
+        mes += paso
+        anio, mes = anio + (mes - 1) // 12, (mes - 1) % 12 + 1
+
+
+def _fecha_corta(ordinal):
+    fecha = date.fromordinal(ordinal)
+    return f"{fecha.day:02d}/{fecha.month:02d}"
+
+
+@cache
+def _color(hexadecimal):
+    return colors.HexColor(hexadecimal)
+
+
+class Diagrama:
+    """
+    Maquetación del cronograma: marcas del eje [(x, etiqueta)] y filas
+    [(tipo, nombre, x inicial, x final, avance)], en unidades del lienzo.
+    """
+
+    def __init__(self, eje, filas):
+        self.eje = eje
+        self.filas = filas
+
+    @classmethod
+    def desde_filas(cls, filas):
+        """Diagrama a partir del resultado de `filas(obra_id)`."""
+        if not filas:
+            return cls([], [])
+        inicio = min(fila['inicio'] for fila in filas)
+        fin = max(fila['fin'] for fila in filas)
+        dias = (fin - inicio).days + 1
+        escala = (ANCHO - ANCHO_ETIQUETAS - MARGEN) / dias
+
+        def x(fecha):
+            return round(ANCHO_ETIQUETAS + (fecha - inicio).days * escala, 2)
+
+        geometria = []
+        for fila in filas:
+            x_inicial = x(fila['inicio'])
+            # El día de fin se incluye; una tarea de un día mide al menos 1
+            x_final = max(round(x(fila['fin']) + escala, 2), x_inicial + 1)
+            geometria.append(
+                (fila['tipo'], _recortar(fila['nombre']), x_inicial, x_final, round(fila['avance'], 2))
+            )
+        eje = [(round(posicion, 2), etiqueta) for posicion, etiqueta in _marcas_eje(inicio, dias, escala)]
+        return cls(eje, geometria)
+
+    @classmethod
+    def desde_json(cls, texto):
+        datos = json.loads(texto)
+        return cls([tuple(marca) for marca in datos['eje']], [tuple(fila) for fila in datos['filas']])
+
+    def a_json(self):
+        return json.dumps({'eje': self.eje, 'filas': self.filas}, ensure_ascii=False, separators=(',', ':'))
+
+    def alto(self, numero_filas=None):
+        numero_filas = len(self.filas) if numero_filas is None else numero_filas
+        return ALTO_EJE + max(numero_filas, 1) * ALTO_FILA + MARGEN
+
+    def _primitivas(self, desde=0, hasta=None):
+        """
+        Figuras de las filas [desde:hasta] con el eje arriba, en coordenadas
+        de arriba hacia abajo:
+            ('rect', x, y, ancho, alto, color)
+            ('linea', x1, y1, x2, y2, color)
+            ('texto', x, y de la línea base, texto, negrita, alineación)
+        """
+        filas = self.filas[desde:hasta]
+        alto = self.alto(len(filas))
+        if not filas:
+            yield 'texto', MARGEN, ALTO_EJE + ALTO_FILA - 6, "Sin tareas programadas", False, 'start'
+            return
+
+        for x, etiqueta in self.eje:
+            yield 'linea', x, ALTO_EJE - 8, x, alto - MARGEN, COLOR_GUIA
+            yield 'texto', x + 3, ALTO_EJE - 12, etiqueta, False, 'start'
+        yield 'linea', ANCHO_ETIQUETAS, ALTO_EJE - 8, ANCHO_ETIQUETAS, alto - MARGEN, COLOR_GUIA
+        yield 'linea', 0, ALTO_EJE - 0.5, ANCHO, ALTO_EJE - 0.5, COLOR_TEXTO
+
+        for i, (tipo, nombre, x_inicial, x_final, avance) in enumerate(filas):
+            y = ALTO_EJE + i * ALTO_FILA
+            es_fase = tipo == 'fase'
+            if es_fase:
+                yield 'rect', 0, y, ANCHO, ALTO_FILA, COLOR_FONDO_FASE
+            y_texto = y + ALTO_FILA / 2 + TAMANO_LETRA / 3
+            yield 'texto', 6 if es_fase else 18, y_texto, nombre, es_fase, 'start'
+
+            color_barra, color_avance = COLORES[tipo]
+            y_barra = y + (ALTO_FILA - ALTO_BARRA) / 2
+            ancho = x_final - x_inicial
+            yield 'rect', x_inicial, y_barra, ancho, ALTO_BARRA, color_barra
+            if avance > 0:
+                yield 'rect', x_inicial, y_barra, round(ancho * min(avance, 100) / 100, 2), ALTO_BARRA, color_avance
+            # El porcentaje va a la derecha de la barra, o dentro si no cabe
+            if x_final + 40 <= ANCHO:
+                yield 'texto', x_final + 4, y_texto, f"{avance:.0f}%", es_fase, 'start'
+            else:
+                yield 'texto', x_inicial - 4, y_texto, f"{avance:.0f}%", es_fase, 'end'
+
+    # --- SVG ---
+
+    def svg(self):
+        alto = self.alto()
+        partes = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{ANCHO}" height="{alto}" '
+            f'viewBox="0 0 {ANCHO} {alto}" font-family="Helvetica, Arial, sans-serif" '
+            f'font-size="{TAMANO_LETRA}" fill="{COLOR_TEXTO}">',
+            f'<rect width="{ANCHO}" height="{alto}" fill="#ffffff"/>',
+        ]
+        for figura, *args in self._primitivas():
+            if figura == 'rect':
+                x, y, ancho, alto_rect, color = args
+                partes.append(f'<rect x="{x}" y="{y}" width="{ancho}" height="{alto_rect}" fill="{color}"/>')
+            elif figura == 'linea':
+                x1, y1, x2, y2, color = args
+                partes.append(f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="{color}"/>')
+            else:
+                x, y, texto, negrita, alineacion = args
+                peso = ' font-weight="bold"' if negrita else ''
+                partes.append(
+                    f'<text x="{x}" y="{y}" text-anchor={quoteattr(alineacion)}{peso}>{escape(texto)}</text>'
+                )
+        partes.append('</svg>')
+        return '\n'.join(partes)
+
+    # --- ReportLab ---
+
+    def dibujos(self, ancho, alto_maximo):
+        """
+        Drawings de ReportLab de `ancho` puntos, cada uno con el eje y tantas
+        filas como quepan en `alto_maximo`: un cronograma largo se reparte en
+        varias páginas.
+        """
+        escala = ancho / ANCHO
+        filas_por_dibujo = max(int((alto_maximo / escala - ALTO_EJE - MARGEN) // ALTO_FILA), 1)
+        for desde in range(0, max(len(self.filas), 1), filas_por_dibujo):
+            yield self._dibujo(desde, desde + filas_por_dibujo, escala)
+
+    def _dibujo(self, desde, hasta, escala):
+        alto = self.alto(len(self.filas[desde:hasta]))
+        grupo = Group(transform=(escala, 0, 0, escala, 0, 0))
+        for figura, *args in self._primitivas(desde, hasta):
+            # ReportLab mide y de abajo hacia arriba
+            if figura == 'rect':
+                x, y, ancho, alto_rect, color = args
+                grupo.add(Rect(
+                    x, alto - y - alto_rect, ancho, alto_rect,
+                    fillColor=_color(color), strokeColor=None,
+                ))
+            elif figura == 'linea':
+                x1, y1, x2, y2, color = args
+                grupo.add(Line(x1, alto - y1, x2, alto - y2, strokeColor=_color(color), strokeWidth=1))
+            else:
+                x, y, texto, negrita, alineacion = args
+                grupo.add(String(
+                    x, alto - y, texto,
+                    fontName='Helvetica-Bold' if negrita else 'Helvetica',
+                    fontSize=TAMANO_LETRA, fillColor=_color(COLOR_TEXTO), textAnchor=alineacion,
+                ))
+        dibujo = Drawing(ANCHO * escala, alto * escala)
+        dibujo.add(grupo)
+        return dibujo
+
+
+# --- Caché en disco ---
+
+def _directorio():
+    return Path(settings.GANTT_CACHE_DIR)
+
+
+def nombre_en_cache(obra_id, sello):
+    """Nombre (sin extensión) de los archivos de la obra para el sello `version(obra_id)`."""
+    marca = int(sello['ultima'].timestamp() * 1_000_000) if sello['ultima'] else 0
+    return f"obra-{obra_id}-{sello['fases']}-{marca}-v{VERSION_DISENO}"
+
+
+def _escribir(ruta, contenido):
+    # Escritura atómica: ningún otro proceso ve un archivo a medio escribir
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=ruta.parent, suffix='.tmp', delete=False) as temporal:
+        temporal.write(contenido)
+    os.replace(temporal.name, ruta)
+
+
+def _guardar_en_cache(obra_id, sello):
+    directorio = _directorio()
+    base = directorio / nombre_en_cache(obra_id, sello)
+    diagrama = Diagrama.desde_filas(filas(obra_id))
+    directorio.mkdir(parents=True, exist_ok=True)
+    _escribir(base.with_suffix('.svg'), diagrama.svg())
+    # El JSON va último: su presencia indica que el SVG ya está escrito
+    _escribir(base.with_suffix('.json'), diagrama.a_json())
+    _borrar([obra_id], conservar=base.name)
+    return diagrama
+
+
+def diagrama(obra_id, sello=None):
+    """Diagrama vigente de la obra; lo maqueta si no está en disco."""
+    sello = sello or version(obra_id)
+    ruta = _directorio() / f"{nombre_en_cache(obra_id, sello)}.json"
+    try:
+        return Diagrama.desde_json(ruta.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return _guardar_en_cache(obra_id, sello)
+
+
+def abrir_svg(obra_id, sello=None):
+    """(archivo abierto, tamaño en bytes) del SVG vigente de la obra."""
+    sello = sello or version(obra_id)
+    ruta = _directorio() / f"{nombre_en_cache(obra_id, sello)}.svg"
+    if not (ruta.is_file() and ruta.with_suffix('.json').is_file()):
+        _guardar_en_cache(obra_id, sello)
+    try:
+        archivo = open(ruta, 'rb')
+    except FileNotFoundError:
+        # Otro proceso lo reemplazó entre la comprobación y la apertura
+        _guardar_en_cache(obra_id, sello)
+        archivo = open(ruta, 'rb')
+    return archivo, os.fstat(archivo.fileno()).st_size
+
+
+def _borrar(obra_ids, conservar=None):
+    directorio = _directorio()
+    if not directorio.is_dir():
+        return
+    for pk in obra_ids:
+        for ruta in directorio.glob(f"obra-{pk}-*"):
+            if ruta.stem != conservar and ruta.suffix in ('.svg', '.json'):
+                ruta.unlink(missing_ok=True)
+
+
+def invalidar(obra_ids):
+    """Borra los diagramas en caché de las obras al confirmar la transacción."""
+    obra_ids = set(obra_ids)
+    if obra_ids:
+        transaction.on_commit(lambda: _borrar(obra_ids))
@@ -0,0 +1,98 @@
+"""
+Informe de estado de una obra en PDF: datos generales, avance y costo de
+cada fase (de las tablas de resumen) y el Gantt. El Gantt sale del Diagrama
+en caché (ver app.gantt), así que un cronograma grande se maqueta una vez
+por versión de la obra y no en cada descarga.
+"""
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from . import gantt
+from .models import Fase
+from .pdf import NumberedCanvas
+
+MARGEN = 40
+ALTO_TITULO = 30
+TITULOS_FASES = ["Fase", "Tareas", "Avance (%)", "Costo Ejecutado ($)", "Presupuesto Asignado ($)"]
+COLUMNAS_FASES = [300, 60, 80, 130, 140]
+ESTILO_FASES = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f3f7')]),
+])
+ESTILO_DATOS = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ('TOPPADDING', (0, 0), (-1, -1), 2),
+])
+
+
+def _nombre_usuario(usuario):
+    if usuario is None:
+        return "No Asignado"
+    return usuario.get_full_name() or usuario.username
+
+
+def renderizar_informe_obra(obra):
+    """Bytes del informe de la obra."""
+    estilos = getSampleStyleSheet()
+    resumen = obra.resumen_avance
+    fases = Fase.objects.filter(obra=obra).select_related('resumen').order_by('pk')
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(letter),
+        leftMargin=MARGEN,
+        rightMargin=MARGEN,
+        topMargin=MARGEN,
+        bottomMargin=MARGEN + 10,
+        title=f"Informe de obra: {obra.nombre}",
+    )
+
+    contenido = [
+        Paragraph(f"Informe de Estado: {escape(obra.nombre)}", estilos['Title']),
+        Table([
+            ["Dirección:", obra.direccion],
+            ["Ingeniero Encargado:", _nombre_usuario(obra.ingeniero_encargado)],
+            ["Fechas:", f"Del {obra.fecha_inicio:%d/%m/%Y} al {obra.fecha_fin_estimada:%d/%m/%Y}"],
+            ["Presupuesto Inicial:", f"${obra.presupuesto_inicial:,.2f}"],
+            ["Presupuesto Ejecutado:", f"${resumen.costo_ejecutado:,.2f}"],
+            ["Avance Total:", f"{resumen.porcentaje_avance:.2f}%"],
+            ["Fecha del Informe:", f"{timezone.localtime():%d/%m/%Y %H:%M}"],
+        ], colWidths=[130, doc.width - 130], style=ESTILO_DATOS, hAlign='LEFT'),
+        Spacer(1, 12),
+        Paragraph("Fases del Proyecto", estilos['Heading2']),
+        Table(
+            [TITULOS_FASES] + [
+                [
+                    fase.nombre,
+                    fase.resumen_avance.num_tareas,
+                    f"{fase.resumen_avance.porcentaje_avance:.2f}",
+                    f"{fase.resumen_avance.costo_ejecutado:,.2f}",
+                    f"{fase.presupuesto_asignado:,.2f}",
+                ]
+                for fase in fases
+            ],
+            colWidths=COLUMNAS_FASES, style=ESTILO_FASES, repeatRows=1, hAlign='LEFT',
+        ),
+        PageBreak(),
+        Paragraph("Cronograma", estilos['Heading2']),
+    ]
+    # Un cronograma largo se parte en un dibujo por página (el primero deja
+    # lugar al título)
+    contenido.extend(gantt.diagrama(obra.pk).dibujos(doc.width, doc.height - ALTO_TITULO))
+
+    doc.build(contenido, canvasmaker=NumberedCanvas)
+    return buffer.getvalue()
@@ -0,0 +1,105 @@
+"""
+Líneas normalizadas de corridas y cotizaciones (CorridaLinea y
+CotizacionLinea). El JSON `datos` sigue siendo la fuente de verdad; aquí se
+reescriben sus líneas cada vez que cambia, para poder leer un equipo o un
+material, o sumar la demanda de un material entre cotizaciones, con una
+consulta indexada en lugar de recorrer todos los JSON.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db.models import Count, Sum
+
+from . import precios
+from .models import CorridaLinea, CotizacionLinea, Equipo, Material
+
+CUATRO_DECIMALES = Decimal('0.0001')
+
+
+def _decimal(valor):
+    try:
+        # Mismo redondeo que precios.a_cantidad
+        return Decimal(str(valor)).quantize(CUATRO_DECIMALES, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def lineas_de_corrida(corrida):
+    """
+    CorridaLinea (sin guardar) de los equipos y tuberías de la corrida. Se
+    omiten los códigos que ya no existen en el catálogo y las cantidades no
+    positivas.
+    """
+    datos = corrida.datos or {}
+    equipos = datos.get('equipos') or {}
+    tuberias = datos.get('tuberias') or {}
+    ids_equipo = dict(Equipo.objects.filter(modelo__in=equipos.keys()).values_list('modelo', 'pk'))
+    ids_material = dict(Material.objects.filter(codigo__in=tuberias.keys()).values_list('codigo', 'pk'))
+
+    lineas = []
+    for claves, ids, campo in ((equipos, ids_equipo, 'equipo_id'), (tuberias, ids_material, 'material_id')):
+        for clave, cantidad in claves.items():
+            try:
+                cantidad = int(cantidad)
+            except (TypeError, ValueError):
+                continue
+            if cantidad > 0 and clave in ids:
+                lineas.append(CorridaLinea(corrida=corrida, cantidad=cantidad, **{campo: ids[clave]}))
+    return lineas
+
+
+def lineas_de_cotizacion(cotizacion):
+    """CotizacionLinea (sin guardar) de los materiales de la cotización (o revisión)."""
+    materiales = (cotizacion.documento or {}).get('materiales') or {}
+    ids_material = dict(Material.objects.filter(codigo__in=materiales.keys()).values_list('codigo', 'pk'))
+
+    lineas = []
+    for codigo, info in materiales.items():
+        if codigo not in ids_material or not isinstance(info, dict):
+            continue
+        cantidad = _decimal(info.get('cantidad'))
+        costo_unitario = _decimal(info.get('costo_unitario', 0))
+        if cantidad is None or costo_unitario is None:
+            continue
+        lineas.append(CotizacionLinea(
+            cotizacion=cotizacion, material_id=ids_material[codigo],
+            cantidad=cantidad, costo_unitario=costo_unitario,
+            importe=precios.importe(precios.a_cantidad(cantidad), precios.a_centavos(costo_unitario)),
+        ))
+    return lineas
+
+
+def sincronizar_corrida(corrida):
+    CorridaLinea.objects.filter(corrida=corrida).delete()
+    CorridaLinea.objects.bulk_create(lineas_de_corrida(corrida))
+
+
+def sincronizar_cotizacion(cotizacion):
+    CotizacionLinea.objects.filter(cotizacion=cotizacion).delete()
+    CotizacionLinea.objects.bulk_create(lineas_de_cotizacion(cotizacion))
+
+
+def demanda_de_materiales(cotizaciones=None, materiales=None):
+    """
+    Cantidad total, número de cotizaciones e importe por material:
+    {codigo: {'cantidad', 'cotizaciones', 'importe'}}. El importe es la suma
+    de los importes por línea ya redondeados al centavo. `cotizaciones` y
+    `materiales` son querysets (o listas de pk) para acotar la suma.
+    """
+    lineas = CotizacionLinea.objects.all()
+    if cotizaciones is not None:
+        lineas = lineas.filter(cotizacion__in=cotizaciones)
+    if materiales is not None:
+        lineas = lineas.filter(material__in=materiales)
+    filas = lineas.values('material__codigo').annotate(
+        total_cantidad=Sum('cantidad'),
+        total_cotizaciones=Count('cotizacion', distinct=True),
+        total_importe=Sum('importe'),
+    ).order_by('material__codigo')
+    return {
+        fila['material__codigo']: {
+            'cantidad': fila['total_cantidad'],
+            'cotizaciones': fila['total_cotizaciones'],
+            'importe': precios.a_decimal(fila['total_importe']),
+        }
+        for fila in filas
+    }
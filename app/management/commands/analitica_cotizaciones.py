@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import analitica
+
+
+class Command(BaseCommand):
+    help = (
+        "Pone al día los resúmenes mensuales de cotizaciones (solo los meses con "
+        "cambios) y muestra el informe de demanda y conversión a obra."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Primer mes del informe (AAAA-MM).")
+        parser.add_argument('--hasta', help="Último mes del informe (AAAA-MM).")
+        parser.add_argument(
+            '--recalcular', action='store_true',
+            help="Recalcula todos los meses del rango aunque no hayan cambiado."
+        )
+        parser.add_argument('--limite', type=int, default=10, help="Materiales y equipos a listar.")
+
+    def handle(self, *args, **options):
+        try:
+            desde = analitica.leer_mes(options['desde'])
+            hasta = analitica.leer_mes(options['hasta'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['recalcular']:
+            analitica.actualizar_resumenes(desde, hasta, forzar=True)
+        informe = analitica.informe(desde, hasta, limite=max(options['limite'], 0))
+
+        self.stdout.write("Mes       Cotizaciones  En obra  Conversión  Valor cotizado")
+        for mes in informe['meses']:
+            self.stdout.write(
+                f"{mes['mes']:%Y-%m}   {mes['cotizaciones']:>12}  {mes['convertidas']:>7}  "
+                f"{mes['tasa_conversion']:>9}%  {mes['valor_cotizado']:>14,.2f}"
+            )
+        totales = informe['totales']
+        self.stdout.write(
+            f"Total     {totales['cotizaciones']:>12}  {totales['convertidas']:>7}  "
+            f"{totales['tasa_conversion']:>9}%  {totales['valor_cotizado']:>14,.2f}"
+        )
+
+        self.stdout.write("\nMateriales más cotizados (por importe):")
+        for material in informe['materiales']:
+            self.stdout.write(
+                f"  {material['codigo']:<15} {material['nombre'][:40]:<40} "
+                f"{material['cantidad']:>12,.2f} {material['importe']:>14,.2f}  ({material['cotizaciones']} cot.)"
+            )
+        self.stdout.write("\nEquipos más cotizados (por unidades):")
+        for equipo in informe['equipos']:
+            self.stdout.write(
+                f"  {equipo['modelo']:<15} {equipo['nombre'][:40]:<40} "
+                f"{equipo['cantidad']:>8}  ({equipo['cotizaciones']} cot.)"
+            )
+
+        if not options['recalcular']:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n{len(informe['meses_recalculados'])} mes(es) recalculado(s)."
+            ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.mediciones import RETENCION, depurar
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las claves de idempotencia y el registro de eliminaciones de la "
+        "sincronización de mediciones más viejos que el período de retención. "
+        "Pensado para ejecutarse a diario (cron)."
+    )
+
+    def handle(self, *args, **options):
+        claves, eliminaciones = depurar()
+        self.stdout.write(self.style.SUCCESS(
+            f"Depurado (retención de {RETENCION.days} días): {claves} clave(s) de idempotencia "
+            f"y {eliminaciones} eliminación(es)."
+        ))
@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from app import pdf
+from app.models import Cotizacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta a un ZIP el PDF de las cotizaciones seleccionadas. Usa los PDF "
+        "en caché y genera los que faltan en varios procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Generadas desde esta fecha (AAAA-MM-DD).")
+        parser.add_argument('--hasta', help="Generadas hasta esta fecha, inclusive (AAAA-MM-DD).")
+        parser.add_argument('--cliente', help="Solo cotizaciones cuyo cliente contenga este texto.")
+        parser.add_argument(
+            '--salida', default='cotizaciones.zip',
+            help="Archivo ZIP de destino (por defecto cotizaciones.zip)."
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help=(
+                "Procesos para generar los PDF que faltan (1 = sin pool). Por defecto, uno por CPU. "
+                "Donde no hay fork (Windows) se usa uno."
+            )
+        )
+
+    def handle(self, *args, **options):
+        cotizaciones = Cotizacion.objects.order_by('anio', 'numero', 'revision')
+        for opcion, lookup in (('desde', 'fecha_generacion__date__gte'), ('hasta', 'fecha_generacion__date__lte')):
+            if options[opcion]:
+                fecha = parse_date(options[opcion])
+                if fecha is None:
+                    raise CommandError(f"--{opcion} debe tener el formato AAAA-MM-DD.")
+                cotizaciones = cotizaciones.filter(**{lookup: fecha})
+        if options['cliente']:
+            # Mismo cliente que revisiones.campo: el de la base, salvo que la
+            # revisión lo cambie o lo quite en su delta
+            cliente = options['cliente']
+            propio = Q(delta__campos__has_key='cliente') | (
+                Q(delta__has_key='campos_quitados') & Q(delta__campos_quitados__icontains='"cliente"')
+            )
+            cotizaciones = cotizaciones.filter(
+                Q(revision_de__isnull=True, datos__cliente__icontains=cliente)
+                | Q(revision_de__isnull=False, delta__campos__cliente__icontains=cliente)
+                | (Q(revision_de__isnull=False, revision_de__datos__cliente__icontains=cliente) & ~propio)
+            )
+        total = cotizaciones.count()
+        if not total:
+            self.stdout.write("No hay cotizaciones que coincidan con el filtro.")
+            return
+
+        inicio = time.perf_counter()
+        desde_cache = 0
+        with open(options['salida'], 'wb') as salida:
+            exportadas = pdf.exportar_zip(cotizaciones, salida, options['procesos'])
+            for hechas, (cotizacion, en_cache) in enumerate(exportadas, 1):
+                desde_cache += en_cache
+                self.stdout.write(
+                    f"[{hechas}/{total}] {cotizacion.correlativo}{' (caché)' if en_cache else ''}"
+                )
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} PDF exportados a {options['salida']} en {duracion:.2f} s "
+            f"({desde_cache} desde la caché, {total - desde_cache} generados)."
+        ))
@@ -0,0 +1,77 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app import pdf
+from app.models import Cotizacion
+
+FAMILIAS = ['TUBERIA', 'ANCLAJE', 'ELECTRICIDAD', 'DRENAJE', 'SOPORTERIA', 'AISLAMIENTO']
+
+
+def cotizacion_sintetica(lineas):
+    """Cotización sin guardar de `lineas` materiales y su catálogo; sin consultas."""
+    catalogo = {}
+    materiales = {}
+    for i in range(lineas):
+        codigo = f"SINT-{i:05d}"
+        # Uno de cada cuatro nombres ocupa dos líneas en la tabla
+        nombre = f"Material sintético {i}" + (" con una descripción larga que obliga a partir el renglón" if i % 4 == 0 else "")
+        catalogo[codigo] = (nombre, FAMILIAS[i % len(FAMILIAS)])
+        materiales[codigo] = {'cantidad': i % 37 + 0.5, 'costo_unitario': 1.25 + i % 300}
+    ahora = timezone.now()
+    cotizacion = Cotizacion(
+        nombre=f"Sintética de {lineas} líneas",
+        datos={'cliente': 'Cliente de prueba', 'materiales': materiales},
+        fecha_generacion=ahora,
+        fecha_modificacion=ahora,
+    )
+    return cotizacion, catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide tiempo y memoria del PDF de cotizaciones (app.pdf) con cotizaciones "
+        "sintéticas de distinto tamaño. No toca la base de datos ni la caché."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lineas', type=int, nargs='+', default=[100, 1000, 5000],
+            help="Tamaños de cotización a medir (por defecto 100 1000 5000)."
+        )
+        parser.add_argument(
+            '--repeticiones', type=int, default=3,
+            help="Se informa el mejor tiempo de estas repeticiones."
+        )
+
+    def handle(self, *args, **options):
+        if any(lineas < 1 for lineas in options['lineas']):
+            raise CommandError("--lineas debe ser positivo.")
+        repeticiones = max(options['repeticiones'], 1)
+
+        self.stdout.write("  Líneas  Páginas  Tiempo (s)  ms/página  Memoria pico (MB)  KB/página")
+        for lineas in options['lineas']:
+            cotizacion, catalogo = cotizacion_sintetica(lineas)
+
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                contenido = pdf.renderizar_cotizacion(cotizacion, catalogo)
+                tiempos.append(time.perf_counter() - inicio)
+            segundos = min(tiempos)
+
+            # La memoria se mide aparte: tracemalloc hace todo más lento
+            tracemalloc.start()
+            try:
+                pdf.renderizar_cotizacion(cotizacion, catalogo)
+                _, pico = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            paginas = contenido.count(b'/Type /Page\n')
+            self.stdout.write(
+                f"{lineas:>8}  {paginas:>7}  {segundos:>10.2f}  {segundos * 1000 / paginas:>9.1f}  "
+                f"{pico / 2**20:>17.1f}  {pico / 1024 / paginas:>9.1f}"
+            )
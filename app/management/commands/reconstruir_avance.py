@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from app.avance import reconstruir
+from app.models import Obra
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero las tablas de resumen de avance y costo (ResumenTarea/Fase/Obra)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--obra', type=int, action='append', dest='obras',
+            help="ID de obra a reconstruir (se puede repetir). Por defecto, todas."
+        )
+
+    def handle(self, *args, **options):
+        obras = Obra.objects.all()
+        if options['obras']:
+            obras = obras.filter(pk__in=options['obras'])
+        total = reconstruir(obras)
+        self.stdout.write(self.style.SUCCESS(f"Resúmenes reconstruidos para {total} obra(s)."))
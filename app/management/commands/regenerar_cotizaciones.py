@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from app import reglas
+from app.cotizaciones import calcular_datos_cotizacion, guardar_cotizacion, huella_datos, huella_precios
+from app.models import Corrida, Material
+
+# Estado de cada proceso de trabajo (lo fija _iniciar_proceso)
+_grafo = None
+_costos = None
+
+
+def _iniciar_proceso(grafo, costos):
+    global _grafo, _costos
+    _grafo, _costos = grafo, costos
+
+
+def _calcular_lote(lote):
+    """
+    [(corrida_pk, (datos_cotizacion, huella_corrida), error)]; sin consultas.
+    Los materiales del lote se explotan juntos (explotar_corridas); si eso
+    falla, cada corrida se explota sola para que el error quede en la suya.
+    """
+    try:
+        explosiones = _grafo.explotar_corridas(dict(lote))
+    except Exception:
+        explosiones = {}
+    resultados = []
+    for pk, datos in lote:
+        try:
+            resultado = (
+                calcular_datos_cotizacion(datos, _grafo, _costos, materiales=explosiones.get(pk)),
+                huella_datos(datos),
+            )
+            resultados.append((pk, resultado, None))
+        except Exception as e:
+            resultados.append((pk, None, f"{type(e).__name__}: {e}"))
+    return resultados
+
+
+def _lotes(iterable, tamaño):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamaño)):
+        yield lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera las cotizaciones de las corridas seleccionadas con las reglas y "
+        "costos actuales, repartiendo el cálculo en varios procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anio', type=int, help="Solo corridas creadas ese año.")
+        parser.add_argument('--cliente', help="Solo corridas cuyo cliente contenga este texto.")
+        parser.add_argument(
+            '--correlativo', action='append', dest='correlativos',
+            help="Correlativo de corrida (se puede repetir)."
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help="Procesos de cálculo (1 = sin pool). Por defecto, uno por CPU."
+        )
+        parser.add_argument(
+            '--lote', type=int, default=50,
+            help="Corridas por lote de cálculo y por transacción de escritura."
+        )
+
+    def handle(self, *args, **options):
+        corridas = Corrida.objects.all()
+        if options['anio']:
+            corridas = corridas.filter(fecha_creacion__year=options['anio'])
+        if options['cliente']:
+            corridas = corridas.filter(datos__cliente__icontains=options['cliente'])
+        if options['correlativos']:
+            corridas = corridas.filter(correlativo__in=options['correlativos'])
+        tamaño_lote = max(options['lote'], 1)
+        procesos = max(options['procesos'], 1)
+
+        # Reglas y costos se cargan una vez y viajan a cada proceso
+        try:
+            grafo = reglas.obtener_grafo()
+        except reglas.ErrorReglas as e:
+            raise CommandError(str(e))
+        costos = {
+            codigo: Decimal(str(costo))
+            for codigo, costo in Material.objects.values_list('codigo', 'costo_unitario')
+        }
+        # Huellas comunes a todas las corridas (ver generar_cotizacion)
+        self.huellas = {'huella_reglas': grafo.firma, 'huella_precios': huella_precios(costos)}
+        lotes = list(_lotes(corridas.order_by('pk').values_list('pk', 'datos'), tamaño_lote))
+        total = sum(len(lote) for lote in lotes)
+        if not total:
+            self.stdout.write("No hay corridas que coincidan con el filtro.")
+            return
+
+        inicio = time.perf_counter()
+        regeneradas, fallidas = 0, []
+        if procesos == 1:
+            _iniciar_proceso(grafo, costos)
+            for lote in lotes:
+                ok, errores = self._guardar(_calcular_lote(lote))
+                regeneradas += ok
+                fallidas += errores
+        else:
+            # Los procesos hijos no deben heredar conexiones abiertas. Con fork
+            # heredan Django ya configurado (no necesitan consultar nada).
+            connections.close_all()
+            contexto = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                contexto = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(
+                max_workers=procesos, mp_context=contexto,
+                initializer=_iniciar_proceso, initargs=(grafo, costos),
+            ) as pool:
+                pendientes = [pool.submit(_calcular_lote, lote) for lote in lotes]
+                # Se escribe en el orden de las corridas para que los correlativos
+                # nuevos sigan ese orden; el cálculo sigue en paralelo
+                for futuro in pendientes:
+                    ok, errores = self._guardar(futuro.result())
+                    regeneradas += ok
+                    fallidas += errores
+        duracion = time.perf_counter() - inicio
+
+        for pk, error in fallidas:
+            self.stderr.write(f"Corrida {pk}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{regeneradas} de {total} cotizaciones regeneradas en {duracion:.2f} s "
+            f"({total / duracion:.1f} corridas/s, {procesos} proceso(s))."
+        ))
+        if fallidas:
+            self.stdout.write(self.style.WARNING(f"{len(fallidas)} corrida(s) con errores."))
+
+    def _guardar(self, resultados):
+        """Escribe un lote en una transacción; un error solo descarta su corrida."""
+        corridas = Corrida.objects.in_bulk([pk for pk, _, _ in resultados])
+        regeneradas, fallidas = 0, []
+        with transaction.atomic():
+            for pk, resultado, error in resultados:
+                if error is None:
+                    datos_cotizacion, huella_corrida = resultado
+                    huellas = {**self.huellas, 'huella_corrida': huella_corrida}
+                    try:
+                        with transaction.atomic():
+                            guardar_cotizacion(corridas[pk], datos_cotizacion, huellas)
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                if error is None:
+                    regeneradas += 1
+                else:
+                    fallidas.append((pk, error))
+        return regeneradas, fallidas
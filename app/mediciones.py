@@ -0,0 +1,274 @@
+"""
+Registro de mediciones en lote y sincronización por deltas para los
+clientes de campo (tabletas con conectividad intermitente).
+
+Las claves de idempotencia y el registro de eliminaciones se conservan
+RETENCION; `depurar` (comando depurar_sincronizacion) borra lo anterior. Un
+token más viejo que eso ya no puede responderse por deltas y recibe una
+sincronización completa.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import avance
+from .models import (
+    ClaveIdempotencia,
+    EliminacionSincronizada,
+    MedicionMaterial,
+    RequerimientoMaterial,
+)
+
+# Margen que se resta al token recibido: cubre transacciones que confirmaron
+# después de la lectura anterior con una marca de tiempo algo más vieja. El
+# cliente debe aplicar los cambios por id (upsert), así que repetir filas
+# dentro del margen es inofensivo. El token es la hora del servidor: una
+# transacción que tarde más que el margen en confirmar, o un reloj que se
+# atrase más que eso entre procesos, puede dejar cambios fuera del delta
+# hasta la próxima sincronización completa.
+SOLAPE_TOKEN = timedelta(seconds=2)
+
+# Campos del material que viajan con cada requerimiento
+CAMPOS_MATERIAL = ('codigo', 'nombre', 'unidad')
+
+MAX_MEDICIONES_POR_ENVIO = 2000
+
+# Cuánto se guardan las claves de idempotencia y las eliminaciones
+RETENCION = timedelta(days=30)
+
+
+class ErrorSincronizacion(Exception):
+    pass
+
+
+def registrar_mediciones(cantidades):
+    """
+    Guarda {(tarea_id, material_id, fecha): cantidad} con un solo
+    INSERT ... ON CONFLICT sobre (tarea, material, fecha_medicion): una
+    medición repetida para el mismo día reemplaza la anterior. Devuelve
+    {(tarea_id, material_id, fecha): medicion_id}.
+    """
+    if not cantidades:
+        return {}
+    mediciones = [
+        MedicionMaterial(tarea_id=tarea_id, material_id=material_id, fecha_medicion=fecha, cantidad=cantidad)
+        for (tarea_id, material_id, fecha), cantidad in cantidades.items()
+    ]
+    tarea_ids = {tarea_id for tarea_id, _, _ in cantidades}
+    with transaction.atomic():
+        MedicionMaterial.objects.bulk_create(
+            mediciones,
+            update_conflicts=True,
+            unique_fields=['tarea', 'material', 'fecha_medicion'],
+            update_fields=['cantidad', 'fecha_modificacion'],
+        )
+        # bulk_create no emite señales: actualizamos los resúmenes aquí
+        avance.recalcular_tareas(tarea_ids)
+        guardadas = MedicionMaterial.objects.filter(
+            tarea_id__in=tarea_ids,
+            fecha_medicion__in={fecha for _, _, fecha in cantidades},
+        ).values_list('tarea_id', 'material_id', 'fecha_medicion', 'pk')
+        return {
+            (tarea_id, material_id, fecha): pk
+            for tarea_id, material_id, fecha, pk in guardadas
+            if (tarea_id, material_id, fecha) in cantidades
+        }
+
+
+def borrar_mediciones(claves):
+    """
+    Borra las mediciones de {(tarea_id, material_id, fecha)}: las que se
+    marcan para borrar en el formulario de mediciones (una cantidad 0 se
+    guarda como medición, igual que en aplicar_envio). Los
+    receptores de post_delete recalculan las tareas y registran las
+    eliminaciones para la sincronización (en lote dentro de
+    avance.efectos_diferidos). Devuelve cuántas se borraron.
+    """
+    if not claves:
+        return 0
+    candidatas = MedicionMaterial.objects.filter(
+        tarea_id__in={tarea_id for tarea_id, _, _ in claves},
+        fecha_medicion__in={fecha for _, _, fecha in claves},
+    ).values_list('pk', 'tarea_id', 'material_id', 'fecha_medicion')
+    pks = [pk for pk, *clave in candidatas if tuple(clave) in claves]
+    if not pks:
+        return 0
+    borradas, _ = MedicionMaterial.objects.filter(pk__in=pks).delete()
+    return borradas
+
+
+def renovar_requerimientos(requerimientos):
+    """
+    Marca como modificados los requerimientos del queryset para que vuelvan
+    a enviarse en el próximo delta: se usa cuando cambia algo que se envía
+    con ellos (nombre de la tarea o la fase, datos del material).
+    """
+    return requerimientos.update(fecha_modificacion=timezone.now())
+
+
+def _serializar_requerimiento(req):
+    return {
+        'id': req.pk,
+        'tarea': req.tarea_id,
+        'tarea_nombre': req.tarea.nombre,
+        'fase_nombre': req.tarea.fase.nombre,
+        'material': req.material_id,
+        'material_codigo': req.material.codigo,
+        'material_nombre': req.material.nombre,
+        'unidad': req.material.unidad,
+        'cantidad_requerida': str(req.cantidad_requerida),
+    }
+
+
+def _serializar_medicion(med):
+    return {
+        'id': med.pk,
+        'tarea': med.tarea_id,
+        'material': med.material_id,
+        'cantidad': str(med.cantidad),
+        'fecha_medicion': med.fecha_medicion.isoformat(),
+    }
+
+
+def leer_token(token):
+    if not token:
+        return None
+    fecha = parse_datetime(token)
+    if fecha is None:
+        raise ErrorSincronizacion(f"Token de sincronización inválido: {token!r}")
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha, dt_timezone.utc)
+    return fecha
+
+
+def cambios_desde(obra, token=None):
+    """
+    Requerimientos y mediciones de la obra modificados desde `token` (todo si
+    es None), más los ids eliminados, y el token para la próxima llamada.
+    """
+    nuevo_token = timezone.now()
+    desde = leer_token(token)
+    if desde is not None and desde - SOLAPE_TOKEN < nuevo_token - RETENCION:
+        # Las eliminaciones de entonces ya pueden estar depuradas
+        desde = None
+
+    requerimientos = RequerimientoMaterial.objects.filter(tarea__fase__obra=obra).select_related(
+        'tarea__fase', 'material'
+    )
+    mediciones = MedicionMaterial.objects.filter(tarea__fase__obra=obra)
+    eliminados = {'requerimientos': [], 'mediciones': []}
+
+    if desde is not None:
+        corte = desde - SOLAPE_TOKEN
+        requerimientos = requerimientos.filter(fecha_modificacion__gte=corte)
+        mediciones = mediciones.filter(fecha_modificacion__gte=corte)
+        for modelo, objeto_id in EliminacionSincronizada.objects.filter(
+            obra=obra, fecha__gte=corte
+        ).values_list('modelo', 'objeto_id'):
+            clave = 'requerimientos' if modelo == 'requerimiento' else 'mediciones'
+            eliminados[clave].append(objeto_id)
+
+    return {
+        'token': nuevo_token.isoformat(),
+        'completo': desde is None,
+        'requerimientos': [_serializar_requerimiento(r) for r in requerimientos],
+        'mediciones': [_serializar_medicion(m) for m in mediciones],
+        'eliminados': eliminados,
+    }
+
+
+def aplicar_envio(obra, items):
+    """
+    Aplica un lote de mediciones enviado por un cliente de campo. Cada item
+    es {'clave', 'tarea', 'material', 'cantidad', 'fecha_medicion'}; `clave`
+    es generada por el cliente y hace que reenviar el mismo item no tenga
+    efecto. Devuelve un resultado por item, en el mismo orden.
+    """
+    if not isinstance(items, list):
+        raise ErrorSincronizacion("'mediciones' debe ser una lista.")
+    if len(items) > MAX_MEDICIONES_POR_ENVIO:
+        raise ErrorSincronizacion(f"Máximo {MAX_MEDICIONES_POR_ENVIO} mediciones por envío.")
+
+    # La consulta de claves y su inserción van en la misma transacción: si
+    # un reintento concurrente guarda alguna de las mismas claves primero, la
+    # restricción única hace fallar esta y se repite viéndolas ya procesadas
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                return _aplicar_envio(obra, items)
+        except IntegrityError:
+            if intento:
+                raise ErrorSincronizacion("Envío concurrente con las mismas claves; reintente.")
+
+
+def _aplicar_envio(obra, items):
+    requeridos = set(
+        RequerimientoMaterial.objects.filter(tarea__fase__obra=obra).values_list('tarea_id', 'material_id')
+    )
+    claves = [item.get('clave') for item in items if isinstance(item, dict)]
+    procesadas = dict(
+        ClaveIdempotencia.objects.filter(clave__in=[c for c in claves if isinstance(c, str)])
+        .values_list('clave', 'medicion_id')
+    )
+
+    resultados = []
+    pendientes = {}  # clave -> (tarea, material, fecha)
+    cantidades = {}
+    for item in items:
+        if not isinstance(item, dict):
+            resultados.append({'clave': None, 'estado': 'error', 'error': "Cada medición debe ser un objeto."})
+            continue
+        clave = item.get('clave')
+        resultado = {'clave': clave}
+        resultados.append(resultado)
+
+        if not isinstance(clave, str) or not 0 < len(clave) <= 64:
+            resultado.update(estado='error', error="'clave' debe ser un texto de 1 a 64 caracteres.")
+            continue
+        if clave in procesadas or clave in pendientes:
+            resultado.update(estado='duplicada', id=procesadas.get(clave))
+            continue
+        try:
+            tarea_id = int(item['tarea'])
+            material_id = int(item['material'])
+            cantidad = Decimal(str(item['cantidad']))
+            fecha = parse_date(str(item['fecha_medicion']))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            resultado.update(estado='error', error="Faltan campos o tienen un formato inválido.")
+            continue
+        if fecha is None or not cantidad.is_finite() or cantidad < 0:
+            resultado.update(estado='error', error="Fecha o cantidad inválida.")
+            continue
+        if (tarea_id, material_id) not in requeridos:
+            resultado.update(estado='error', error="La tarea/material no es un requerimiento de esta obra.")
+            continue
+
+        pendientes[clave] = (tarea_id, material_id, fecha)
+        cantidades[(tarea_id, material_id, fecha)] = cantidad
+        resultado['estado'] = 'aplicada'
+
+    ids = registrar_mediciones(cantidades)
+    ClaveIdempotencia.objects.bulk_create([
+        ClaveIdempotencia(clave=clave, medicion_id=ids.get(destino))
+        for clave, destino in pendientes.items()
+    ])
+
+    for resultado in resultados:
+        # Incluye las claves repetidas dentro del mismo lote
+        if resultado.get('estado') in ('aplicada', 'duplicada') and resultado['clave'] in pendientes:
+            resultado['id'] = ids.get(pendientes[resultado['clave']])
+    return resultados
+
+
+def depurar(ahora=None):
+    """
+    Borra las claves de idempotencia y las eliminaciones más viejas que
+    RETENCION. Devuelve (claves, eliminaciones) borradas.
+    """
+    corte = (ahora or timezone.now()) - RETENCION
+    claves, _ = ClaveIdempotencia.objects.filter(fecha__lt=corte).delete()
+    eliminaciones, _ = EliminacionSincronizada.objects.filter(fecha__lt=corte).delete()
+    return claves, eliminaciones
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:43
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def poblar_resumenes(apps, schema_editor):
+    """Carga inicial de los resúmenes con las mismas reglas que app.avance."""
+    Obra = apps.get_model('app', 'Obra')
+    ResumenTarea = apps.get_model('app', 'ResumenTarea')
+    ResumenFase = apps.get_model('app', 'ResumenFase')
+    ResumenObra = apps.get_model('app', 'ResumenObra')
+    precision = Decimal('0.0001')
+    cero = Decimal('0')
+
+    for obra in Obra.objects.all():
+        suma_obra, fases_con_tareas, costo_obra = cero, 0, cero
+        for fase in obra.fase_set.all():
+            suma_fase, con_req, costo_fase, num_tareas = cero, 0, cero, 0
+            for tarea in fase.tarea_set.all():
+                reqs = list(tarea.requerimientomaterial_set.all())
+                meds = list(tarea.medicionmaterial_set.select_related('material'))
+                requerido = sum((r.cantidad_requerida for r in reqs), cero)
+                instalado = sum((m.cantidad for m in meds), cero)
+                costo = sum((m.cantidad * m.material.costo_unitario for m in meds), cero)
+                porcentaje = (instalado / requerido * 100).quantize(precision) if requerido > 0 else cero
+                ResumenTarea.objects.create(
+                    tarea=tarea, num_requerimientos=len(reqs),
+                    cantidad_requerida=requerido, cantidad_instalada=instalado,
+                    costo_ejecutado=costo, porcentaje_avance=porcentaje,
+                )
+                num_tareas += 1
+                costo_fase += costo
+                if reqs:
+                    con_req += 1
+                    suma_fase += porcentaje
+            porcentaje_fase = (suma_fase / con_req).quantize(precision) if con_req else cero
+            costo_fase += fase.costo_mano_de_obra or cero
+            ResumenFase.objects.create(
+                fase=fase, num_tareas=num_tareas, num_tareas_con_requerimientos=con_req,
+                costo_ejecutado=costo_fase, porcentaje_avance=porcentaje_fase,
+            )
+            costo_obra += costo_fase
+            if num_tareas:
+                fases_con_tareas += 1
+                suma_obra += porcentaje_fase
+        ResumenObra.objects.create(
+            obra=obra, num_fases_con_tareas=fases_con_tareas, costo_ejecutado=costo_obra,
+            porcentaje_avance=(suma_obra / fases_con_tareas).quantize(precision) if fases_con_tareas else cero,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenFase',
+            fields=[
+                ('fase', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='app.fase')),
+                ('num_tareas', models.PositiveIntegerField(default=0)),
+                ('num_tareas_con_requerimientos', models.PositiveIntegerField(default=0)),
+                ('costo_ejecutado', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('porcentaje_avance', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenObra',
+            fields=[
+                ('obra', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='app.obra')),
+                ('num_fases_con_tareas', models.PositiveIntegerField(default=0)),
+                ('costo_ejecutado', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('porcentaje_avance', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenTarea',
+            fields=[
+                ('tarea', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='app.tarea')),
+                ('num_requerimientos', models.PositiveIntegerField(default=0)),
+                ('cantidad_requerida', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad_instalada', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('costo_ejecutado', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('porcentaje_avance', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
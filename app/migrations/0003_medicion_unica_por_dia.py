@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:47
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionar_duplicadas(apps, schema_editor):
+    """
+    Antes de la restricción única, las mediciones repetidas de un mismo
+    (tarea, material, fecha) se fusionan en una sola fila con la suma de sus
+    cantidades, para no alterar el avance registrado hasta ahora.
+    """
+    MedicionMaterial = apps.get_model('app', 'MedicionMaterial')
+    duplicadas = (
+        MedicionMaterial.objects.values('tarea_id', 'material_id', 'fecha_medicion')
+        .annotate(n=Count('id'), total=Sum('cantidad'), primera=Min('id'))
+        .filter(n__gt=1)
+    )
+    for grupo in duplicadas:
+        MedicionMaterial.objects.filter(pk=grupo['primera']).update(cantidad=grupo['total'])
+        MedicionMaterial.objects.filter(
+            tarea_id=grupo['tarea_id'],
+            material_id=grupo['material_id'],
+            fecha_medicion=grupo['fecha_medicion'],
+        ).exclude(pk=grupo['primera']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_resumen_avance'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='medicionmaterial',
+            constraint=models.UniqueConstraint(fields=('tarea', 'material', 'fecha_medicion'), name='medicion_unica_por_dia'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_medicion_unica_por_dia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicionmaterial',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='requerimientomaterial',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('medicion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.medicionmaterial')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EliminacionSincronizada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('requerimiento', 'Requerimiento de Material'), ('medicion', 'Medición de Material')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('obra', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eliminaciones_sincronizadas', to='app.obra')),
+            ],
+        ),
+    ]
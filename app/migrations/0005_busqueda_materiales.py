@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:53
+
+import unicodedata
+from django.db import migrations, models
+
+
+def poblar_nombre_busqueda(apps, schema_editor):
+    """Misma normalización que app.models.normalizar_busqueda."""
+    Material = apps.get_model('app', 'Material')
+    materiales = list(Material.objects.only('pk', 'nombre'))
+    for material in materiales:
+        sin_acentos = unicodedata.normalize('NFKD', material.nombre or '').encode('ascii', 'ignore').decode('ascii')
+        material.nombre_busqueda = ' '.join(sin_acentos.lower().split())
+    Material.objects.bulk_update(materiales, ['nombre_busqueda'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_sincronizacion_mediciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='nombre_busqueda',
+            field=models.CharField(blank=True, db_default='', editable=False, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['sistema', 'familia'], name='material_sistema_familia'),
+        ),
+        migrations.RunPython(poblar_nombre_busqueda, migrations.RunPython.noop),
+    ]
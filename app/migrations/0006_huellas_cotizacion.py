@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_busqueda_materiales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotizacion',
+            name='huella_corrida',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='huella_precios',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='huella_reglas',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:03
+
+import django.db.models.deletion
+from decimal import Decimal, InvalidOperation
+from django.db import migrations, models
+
+
+def poblar_lineas(apps, schema_editor):
+    """Mismas reglas que app.lineas.lineas_de_corrida / lineas_de_cotizacion."""
+    Corrida = apps.get_model('app', 'Corrida')
+    Cotizacion = apps.get_model('app', 'Cotizacion')
+    CorridaLinea = apps.get_model('app', 'CorridaLinea')
+    CotizacionLinea = apps.get_model('app', 'CotizacionLinea')
+    ids_equipo = dict(apps.get_model('app', 'Equipo').objects.values_list('modelo', 'pk'))
+    ids_material = dict(apps.get_model('app', 'Material').objects.values_list('codigo', 'pk'))
+
+    lineas = []
+    for corrida_id, datos in Corrida.objects.values_list('pk', 'datos').iterator():
+        datos = datos or {}
+        for grupo, ids, campo in (('equipos', ids_equipo, 'equipo_id'), ('tuberias', ids_material, 'material_id')):
+            for clave, cantidad in (datos.get(grupo) or {}).items():
+                try:
+                    cantidad = int(cantidad)
+                except (TypeError, ValueError):
+                    continue
+                if cantidad > 0 and clave in ids:
+                    lineas.append(CorridaLinea(corrida_id=corrida_id, cantidad=cantidad, **{campo: ids[clave]}))
+    CorridaLinea.objects.bulk_create(lineas, batch_size=500)
+
+    cuatro_decimales = Decimal('0.0001')
+    lineas = []
+    for cotizacion_id, datos in Cotizacion.objects.values_list('pk', 'datos').iterator():
+        for codigo, info in ((datos or {}).get('materiales') or {}).items():
+            if codigo not in ids_material or not isinstance(info, dict):
+                continue
+            try:
+                cantidad = Decimal(str(info.get('cantidad'))).quantize(cuatro_decimales)
+                costo_unitario = Decimal(str(info.get('costo_unitario', 0))).quantize(cuatro_decimales)
+            except (InvalidOperation, TypeError, ValueError):
+                continue
+            lineas.append(CotizacionLinea(
+                cotizacion_id=cotizacion_id, material_id=ids_material[codigo],
+                cantidad=cantidad, costo_unitario=costo_unitario,
+            ))
+    CotizacionLinea.objects.bulk_create(lineas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_huellas_cotizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorridaLinea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('corrida', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='app.corrida')),
+                ('equipo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lineas_corrida', to='app.equipo')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lineas_corrida', to='app.material')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['equipo', 'corrida'], name='corridalinea_equipo'), models.Index(fields=['material', 'corrida'], name='corridalinea_material')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('equipo__isnull', False), ('material__isnull', True)), models.Q(('equipo__isnull', True), ('material__isnull', False)), _connector='OR'), name='corridalinea_equipo_o_material')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CotizacionLinea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('costo_unitario', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('cotizacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='app.cotizacion')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas_cotizacion', to='app.material')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['material', 'cotizacion'], name='cotizacionlinea_material')],
+                'constraints': [models.UniqueConstraint(fields=('cotizacion', 'material'), name='cotizacionlinea_unica')],
+            },
+        ),
+        migrations.RunPython(poblar_lineas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def enlazar_obras(apps, schema_editor):
+    """
+    Las obras ya generadas desde una cotización llevan su nombre. Se enlazan
+    solo cuando ese nombre corresponde a una única cotización.
+    """
+    Obra = apps.get_model('app', 'Obra')
+    Cotizacion = apps.get_model('app', 'Cotizacion')
+    nombres_unicos = (
+        Cotizacion.objects.values('nombre').annotate(n=Count('pk')).filter(n=1).values('nombre')
+    )
+    cotizaciones = dict(
+        Cotizacion.objects.filter(nombre__in=nombres_unicos).values_list('nombre', 'pk')
+    )
+    obras = list(Obra.objects.filter(cotizacion__isnull=True, nombre__in=cotizaciones.keys()))
+    for obra in obras:
+        obra.cotizacion_id = cotizaciones[obra.nombre]
+    Obra.objects.bulk_update(obras, ['cotizacion'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_lineas_corrida_cotizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCotizacionesMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True, verbose_name='Mes (primer día)')),
+                ('huella', models.CharField(max_length=64)),
+                ('cotizaciones', models.PositiveIntegerField(default=0)),
+                ('convertidas', models.PositiveIntegerField(default=0, verbose_name='Cotizaciones con obra')),
+                ('valor_cotizado', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('materiales', models.JSONField(default=dict)),
+                ('equipos', models.JSONField(default=dict)),
+                ('fecha_calculo', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['mes'],
+            },
+        ),
+        migrations.AddField(
+            model_name='obra',
+            name='cotizacion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='obras', to='app.cotizacion', verbose_name='Cotización de Origen'),
+        ),
+        migrations.RunPython(enlazar_obras, migrations.RunPython.noop),
+    ]
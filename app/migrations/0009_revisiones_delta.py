@@ -0,0 +1,93 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:07
+
+import django.db.models.deletion
+import re
+from django.db import migrations, models
+
+
+def _calcular_delta(base, datos):
+    """Copia de app.revisiones.calcular_delta."""
+    falta = object()
+    materiales_base = base.get('materiales') or {}
+    materiales = datos.get('materiales') or {}
+    delta = {
+        'campos': {
+            clave: valor for clave, valor in datos.items()
+            if clave != 'materiales' and base.get(clave, falta) != valor
+        },
+        'campos_quitados': sorted(clave for clave in base if clave != 'materiales' and clave not in datos),
+        'agregados': {codigo: info for codigo, info in materiales.items() if codigo not in materiales_base},
+        'modificados': {
+            codigo: info for codigo, info in materiales.items()
+            if codigo in materiales_base and materiales_base[codigo] != info
+        },
+        'eliminados': sorted(codigo for codigo in materiales_base if codigo not in materiales),
+    }
+    return {clave: valor for clave, valor in delta.items() if valor}
+
+
+def _aplicar_delta(base, delta):
+    """Copia de app.revisiones.aplicar_delta."""
+    quitados = set(delta.get('campos_quitados', ()))
+    datos = {clave: valor for clave, valor in base.items() if clave != 'materiales' and clave not in quitados}
+    datos.update(delta.get('campos', {}))
+    eliminados = set(delta.get('eliminados', ()))
+    materiales = {
+        codigo: dict(info) for codigo, info in (base.get('materiales') or {}).items()
+        if codigo not in eliminados
+    }
+    for grupo in ('agregados', 'modificados'):
+        materiales.update({codigo: dict(info) for codigo, info in delta.get(grupo, {}).items()})
+    datos['materiales'] = materiales
+    return datos
+
+
+def codificar_revisiones(apps, schema_editor):
+    """
+    Las cotizaciones 'X_rev_N' cuya base 'X' existe pasan a guardar solo su
+    delta contra ella. Las que no tienen base se quedan como copias completas.
+    """
+    Cotizacion = apps.get_model('app', 'Cotizacion')
+    revisiones = Cotizacion.objects.filter(correlativo__regex=r'_rev_[0-9]+$', revision_de__isnull=True)
+    bases_por_correlativo = {}
+    for revision in revisiones.iterator():
+        correlativo_base = re.sub(r'_rev_\d+$', '', revision.correlativo)
+        if correlativo_base not in bases_por_correlativo:
+            bases_por_correlativo[correlativo_base] = Cotizacion.objects.filter(
+                correlativo=correlativo_base
+            ).only('pk', 'datos').first()
+        base = bases_por_correlativo[correlativo_base]
+        if base is None:
+            continue
+        Cotizacion.objects.filter(pk=revision.pk).update(
+            revision_de=base, delta=_calcular_delta(base.datos, revision.datos), datos={},
+        )
+
+
+def materializar_revisiones(apps, schema_editor):
+    Cotizacion = apps.get_model('app', 'Cotizacion')
+    for revision in Cotizacion.objects.filter(revision_de__isnull=False).select_related('revision_de').iterator():
+        Cotizacion.objects.filter(pk=revision.pk).update(
+            datos=_aplicar_delta(revision.revision_de.datos, revision.delta or {}),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_analitica_cotizaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotizacion',
+            name='delta',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='revision_de',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revisiones', to='app.cotizacion', verbose_name='Cotización Base'),
+        ),
+        migrations.RunPython(codificar_revisiones, materializar_revisiones),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:10
+
+import re
+from django.db import migrations, models
+
+# PREFIJO-AAAA-GS-I-NNN-nombre[_rev_N]
+PATRON_CORRELATIVO = re.compile(r'^[^-]+-(\d{4})-[^-]+-[^-]+-(\d+)')
+PATRON_REVISION = re.compile(r'_rev_(\d+)$')
+
+
+def poblar_numeracion(apps, schema_editor):
+    """Año, número y revisión a partir de los correlativos existentes."""
+    for nombre_modelo, campos in (('Corrida', ['anio', 'numero']), ('Cotizacion', ['anio', 'numero', 'revision'])):
+        modelo = apps.get_model('app', nombre_modelo)
+        objetos = list(modelo.objects.only('pk', 'correlativo'))
+        for objeto in objetos:
+            m = PATRON_CORRELATIVO.match(objeto.correlativo)
+            if m:
+                objeto.anio, objeto.numero = int(m.group(1)), int(m.group(2))
+            if 'revision' in campos:
+                r = PATRON_REVISION.search(objeto.correlativo)
+                objeto.revision = int(r.group(1)) if r else 0
+        modelo.objects.bulk_update(objetos, campos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_revisiones_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='corrida',
+            name='anio',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='corrida',
+            name='numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='anio',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cotizacion',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(poblar_numeracion, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='corrida',
+            index=models.Index(fields=['anio', 'numero'], name='corrida_anio_numero'),
+        ),
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['anio', 'numero'], name='cotizacion_anio_numero'),
+        ),
+        migrations.AddConstraint(
+            model_name='cotizacion',
+            constraint=models.UniqueConstraint(fields=('revision_de', 'revision'), name='cotizacion_revision_unica'),
+        ),
+    ]
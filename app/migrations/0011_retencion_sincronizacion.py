@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_numeracion_correlativos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='claveidempotencia',
+            name='fecha',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
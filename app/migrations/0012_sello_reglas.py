@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_retencion_sincronizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reglaequipomaterial',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='reglamaterialmaterial',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
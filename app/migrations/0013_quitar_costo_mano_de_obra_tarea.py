@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_sello_reglas'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tarea',
+            name='costo_mano_de_obra',
+        ),
+    ]
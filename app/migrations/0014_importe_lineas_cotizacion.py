@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:07
+
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import migrations, models
+
+
+def poblar_importes(apps, schema_editor):
+    """Mismo redondeo que app.precios: precio al centavo e importe de la línea al centavo."""
+    CotizacionLinea = apps.get_model('app', 'CotizacionLinea')
+    lineas = list(CotizacionLinea.objects.only('pk', 'cantidad', 'costo_unitario'))
+    for linea in lineas:
+        centavos = (linea.costo_unitario * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        linea.importe = int((linea.cantidad * centavos).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    CotizacionLinea.objects.bulk_update(lineas, ['importe'], batch_size=500)
+    # Los resúmenes guardados sumaban cantidad x costo sin redondear por línea
+    apps.get_model('app', 'ResumenCotizacionesMes').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_quitar_costo_mano_de_obra_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cotizacionlinea',
+            name='importe',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(poblar_importes, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
+import unicodedata
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Sum, JSONField
 from datetime import timedelta
 from decimal import Decimal
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 
 
 class Personal(models.Model):
@@ -52,12 +55,29 @@ class Obra(models.Model):
     fecha_inicio = models.DateField(verbose_name="Fecha de Inicio")
     fecha_fin_estimada = models.DateField(verbose_name="Fecha Fin Estimada")
     presupuesto_inicial = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Presupuesto Inicial")
+    cotizacion = models.ForeignKey(
+        'Cotizacion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='obras',
+        verbose_name="Cotización de Origen"
+    )
 
     def __str__(self):
         return self.nombre
 
+    @property
+    def resumen_avance(self):
+        try:
+            return self.resumen
+        except ResumenObra.DoesNotExist:
+            from .avance import recalcular_obras
+            recalcular_obras([self.pk], crear=True)
+            return ResumenObra.objects.get(obra=self)
+
     def get_presupuesto_ejecutado(self):
-        return sum(fase.costo_ejecutado for fase in self.fase_set.all())
+        return self.resumen_avance.costo_ejecutado
 
     def get_porcentaje_ejecutado(self):
         if self.presupuesto_inicial > 0:
@@ -67,11 +87,7 @@ class Obra(models.Model):
     
     @property
     def porcentaje_avance(self):
-        fases_con_tareas = [fase for fase in self.fase_set.all() if fase.tarea_set.exists()]
-        if not fases_con_tareas:
-            return Decimal('0.00')
-        total_porcentaje = sum(fase.porcentaje_avance for fase in fases_con_tareas)
-        return total_porcentaje / len(fases_con_tareas)
+        return self.resumen_avance.porcentaje_avance
 
 class Fase(models.Model):
     nombre = models.CharField(max_length=200, verbose_name="Nombre de la Fase")
@@ -86,11 +102,18 @@ class Fase(models.Model):
     def __str__(self):
         return f"{self.nombre} - {self.obra.nombre}"
 
+    @property
+    def resumen_avance(self):
+        try:
+            return self.resumen
+        except ResumenFase.DoesNotExist:
+            from .avance import recalcular_fases
+            recalcular_fases([self.pk], crear=True)
+            return ResumenFase.objects.get(fase=self)
+
     @property
     def costo_ejecutado(self):
-        costo_tareas = sum(tarea.costo_ejecutado for tarea in self.tarea_set.all())
-        costo_propio = self.costo_mano_de_obra if self.costo_mano_de_obra is not None else 0
-        return costo_tareas + costo_propio
+        return self.resumen_avance.costo_ejecutado
 
     @property
     def porcentaje_ejecutado(self):
@@ -100,11 +123,7 @@ class Fase(models.Model):
 
     @property
     def porcentaje_avance(self):
-        tareas_con_requerimientos = [tarea for tarea in self.tarea_set.all() if tarea.requerimientomaterial_set.exists()]
-        if not tareas_con_requerimientos:
-            return Decimal('0.00')
-        total_porcentaje = sum(tarea.porcentaje_avance for tarea in tareas_con_requerimientos)
-        return total_porcentaje / len(tareas_con_requerimientos)
+        return self.resumen_avance.porcentaje_avance
 
 class Tarea(models.Model):
     nombre = models.CharField(max_length=200, verbose_name="Nombre de la Tarea")
@@ -116,21 +135,59 @@ class Tarea(models.Model):
     def __str__(self):
         return f"{self.nombre} - {self.fase.nombre}"
 
+    @property
+    def resumen_avance(self):
+        try:
+            return self.resumen
+        except ResumenTarea.DoesNotExist:
+            from .avance import recalcular_tareas
+            recalcular_tareas([self.pk], crear=True)
+            return ResumenTarea.objects.get(tarea=self)
+
     @property
     def costo_ejecutado(self):
-        # Suma los costos de las asignaciones de materiales y mano de obra
-        costo_material = sum(medicion.costo_total for medicion in self.medicionmaterial_set.all())
-        return costo_material
+        # Costo de los materiales medidos, leído de la tabla de resumen
+        return self.resumen_avance.costo_ejecutado
 
     @property
     def porcentaje_avance(self):
-        total_requerido = sum(req.cantidad_requerida for req in self.requerimientomaterial_set.all())
-        # Suma las cantidades de todas las mediciones de material para esta tarea
-        total_instalado = sum(medicion.cantidad for medicion in self.medicionmaterial_set.all())
-        
-        if total_requerido > 0:
-            return (total_instalado / total_requerido) * 100
-        return Decimal('0.00')
+        return self.resumen_avance.porcentaje_avance
+
+class ResumenTarea(models.Model):
+    """Totales desnormalizados de una Tarea, mantenidos por app.avance."""
+    tarea = models.OneToOneField(Tarea, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    num_requerimientos = models.PositiveIntegerField(default=0)
+    cantidad_requerida = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cantidad_instalada = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo_ejecutado = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    porcentaje_avance = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen de {self.tarea_id}: {self.porcentaje_avance}%"
+
+class ResumenFase(models.Model):
+    """Totales desnormalizados de una Fase, calculados desde sus ResumenTarea."""
+    fase = models.OneToOneField(Fase, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    num_tareas = models.PositiveIntegerField(default=0)
+    num_tareas_con_requerimientos = models.PositiveIntegerField(default=0)
+    costo_ejecutado = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    porcentaje_avance = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen de fase {self.fase_id}: {self.porcentaje_avance}%"
+
+class ResumenObra(models.Model):
+    """Totales desnormalizados de una Obra, calculados desde sus ResumenFase."""
+    obra = models.OneToOneField(Obra, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    num_fases_con_tareas = models.PositiveIntegerField(default=0)
+    costo_ejecutado = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    porcentaje_avance = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen de obra {self.obra_id}: {self.porcentaje_avance}%"
 
 class AsignacionPersonal(models.Model):
     tarea = models.ForeignKey(Tarea, on_delete=models.CASCADE, verbose_name="Tarea")
@@ -144,6 +201,11 @@ class AsignacionPersonal(models.Model):
     def costo_total(self):
         return Decimal('0.00')
 
+def normalizar_busqueda(texto):
+    """Minúsculas, sin acentos y con los espacios compactados."""
+    sin_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sin_acentos.lower().split())
+
 class Material(models.Model):
     SISTEMA_CHOICES = [
     ('VRF', 'VRF'),
@@ -156,7 +218,22 @@ class Material(models.Model):
     sistema = models.CharField(max_length=3, choices=SISTEMA_CHOICES, default='VRF', verbose_name='Tipo de Sistema')
     costo_unitario = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Costo Unitario")
     stock = models.IntegerField(default=0, verbose_name="Stock Disponible")
-    
+    # Nombre normalizado para la búsqueda con LIKE fuera de SQLite; en SQLite
+    # se busca en el índice FTS5 (ver app.catalogo)
+    nombre_busqueda = models.CharField(max_length=200, blank=True, editable=False, db_default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sistema', 'familia'], name='material_sistema_familia'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.nombre_busqueda = normalizar_busqueda(self.nombre)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nombre' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'nombre_busqueda'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nombre} ({self.unidad})"
 
@@ -183,6 +260,7 @@ class RequerimientoMaterial(models.Model):
     tarea = models.ForeignKey(Tarea, on_delete=models.CASCADE, verbose_name="Tarea")
     material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name="Material")
     cantidad_requerida = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Cantidad Requerida")
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Requerimiento para {self.tarea.nombre}: {self.cantidad_requerida} {self.material.unidad} de {self.material.nombre}"
@@ -192,6 +270,15 @@ class MedicionMaterial(models.Model):
     material = models.ForeignKey(Material, on_delete=models.CASCADE, verbose_name="Material")
     cantidad = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Cantidad Medida")
     fecha_medicion = models.DateField(verbose_name="Fecha de Medición")
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tarea', 'material', 'fecha_medicion'],
+                name='medicion_unica_por_dia',
+            ),
+        ]
 
     def __str__(self):
         return f"Medición de {self.cantidad} {self.material.unidad} en {self.tarea.nombre} el {self.fecha_medicion}"
@@ -200,13 +287,43 @@ class MedicionMaterial(models.Model):
     def costo_total(self):
         return self.cantidad * self.material.costo_unitario
     
+class EliminacionSincronizada(models.Model):
+    """Registro de requerimientos/mediciones borrados, para la sincronización por deltas."""
+    MODELO_CHOICES = [
+        ('requerimiento', 'Requerimiento de Material'),
+        ('medicion', 'Medición de Material'),
+    ]
+    obra = models.ForeignKey(Obra, on_delete=models.CASCADE, related_name='eliminaciones_sincronizadas')
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id} eliminado el {self.fecha}"
+
+class ClaveIdempotencia(models.Model):
+    """Claves generadas por los clientes de campo para no aplicar dos veces un envío."""
+    clave = models.CharField(max_length=64, unique=True)
+    medicion = models.ForeignKey(MedicionMaterial, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.clave
+
 class Corrida(models.Model):
     correlativo = models.CharField(max_length=100, unique=True)
     nombre = models.CharField(max_length=255, unique=True)
     datos = JSONField() # Aquí se guardan todas las variables
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
-    
+    # Año y número del correlativo: el siguiente número es un MAX indexado
+    anio = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    numero = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['anio', 'numero'], name='corrida_anio_numero'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -224,6 +341,7 @@ class ReglaEquipoMaterial(models.Model):
         verbose_name="Materiales Requeridos",
         help_text="Lista de dicts: [{'codigo': 'MAT001', 'cantidad': 5}, ...]"
     )
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Regla Equipo a Material"
@@ -245,11 +363,22 @@ class ReglaMaterialMaterial(models.Model):
         verbose_name="Materiales Requeridos",
         help_text="Lista de dicts: [{'codigo': 'MAT002', 'cantidad': 2}, ...]"
     )
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Regla Material a Material"
         verbose_name_plural = "Reglas Material a Materiales"
 
+    def clean(self):
+        # Una regla que cierra un ciclo haría imposible expandir los materiales
+        from .reglas import ErrorReglas, validar_regla_material
+        if self.material_origen_id is None:
+            return
+        try:
+            validar_regla_material(self)
+        except ErrorReglas as e:
+            raise ValidationError({'materiales_requeridos': str(e)})
+
     def __str__(self):
         return f"Material {self.material_origen.codigo} requiere varios materiales"
 
@@ -264,6 +393,114 @@ class Cotizacion(models.Model):
     datos = JSONField()
     fecha_generacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
+    # Huellas de las entradas con que se generó (ver app.cotizaciones)
+    huella_corrida = models.CharField(max_length=64, blank=True, editable=False)
+    huella_reglas = models.CharField(max_length=64, blank=True, editable=False)
+    huella_precios = models.CharField(max_length=64, blank=True, editable=False)
+    # Las revisiones (_rev_N) guardan solo su diferencia con la base (ver app.revisiones)
+    revision_de = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='revisiones',
+        verbose_name="Cotización Base"
+    )
+    delta = models.JSONField(null=True, blank=True, editable=False)
+    # Año y número del correlativo (las revisiones llevan los de su base) y
+    # número de revisión (0 en la base)
+    anio = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    numero = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    revision = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['anio', 'numero'], name='cotizacion_anio_numero'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['revision_de', 'revision'], name='cotizacion_revision_unica'),
+        ]
 
     def __str__(self):
         return self.nombre
+
+    @cached_property
+    def documento(self):
+        """JSON completo: `datos` en una base, base + delta en una revisión."""
+        if self.revision_de_id is None:
+            return self.datos
+        from .revisiones import aplicar_delta
+        return aplicar_delta(self.revision_de.datos, self.delta or {})
+
+# --- Líneas normalizadas de corridas y cotizaciones ---
+# Copia consultable de Corrida.datos y Cotizacion.datos, que siguen siendo la
+# fuente de verdad: las señales las reescriben cada vez que cambia el JSON
+# (ver app.lineas).
+
+class CorridaLinea(models.Model):
+    """Un equipo o una tubería de la corrida con su cantidad."""
+    corrida = models.ForeignKey(Corrida, on_delete=models.CASCADE, related_name='lineas')
+    equipo = models.ForeignKey(Equipo, on_delete=models.CASCADE, null=True, blank=True, related_name='lineas_corrida')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, null=True, blank=True, related_name='lineas_corrida')
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['equipo', 'corrida'], name='corridalinea_equipo'),
+            models.Index(fields=['material', 'corrida'], name='corridalinea_material'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(equipo__isnull=False, material__isnull=True)
+                    | models.Q(equipo__isnull=True, material__isnull=False)
+                ),
+                name='corridalinea_equipo_o_material',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.equipo or self.material} en {self.corrida}"
+
+class CotizacionLinea(models.Model):
+    """Un material de la cotización con su cantidad y costo unitario con utilidad."""
+    cotizacion = models.ForeignKey(Cotizacion, on_delete=models.CASCADE, related_name='lineas')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='lineas_cotizacion')
+    cantidad = models.DecimalField(max_digits=14, decimal_places=4)
+    costo_unitario = models.DecimalField(max_digits=14, decimal_places=4)
+    # Importe de la línea en centavos, redondeado como en app.precios: las
+    # sumas en SQL dan lo mismo que el total de la cotización
+    importe = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['material', 'cotizacion'], name='cotizacionlinea_material'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['cotizacion', 'material'], name='cotizacionlinea_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} {self.material.unidad} de {self.material.nombre} en {self.cotizacion}"
+
+class ResumenCotizacionesMes(models.Model):
+    """
+    Agregados de las cotizaciones generadas en un mes, para el informe de
+    demanda y conversión (ver app.analitica). `huella` resume el estado de
+    las cotizaciones del mes al calcularlo: si cambia, el mes se recalcula.
+    """
+    mes = models.DateField(unique=True, verbose_name="Mes (primer día)")
+    huella = models.CharField(max_length=64)
+    cotizaciones = models.PositiveIntegerField(default=0)
+    convertidas = models.PositiveIntegerField(default=0, verbose_name="Cotizaciones con obra")
+    valor_cotizado = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # {codigo: [cantidad, importe, cotizaciones]} y {modelo: [cantidad, cotizaciones]}
+    materiales = models.JSONField(default=dict)
+    equipos = models.JSONField(default=dict)
+    fecha_calculo = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['mes']
+
+    def __str__(self):
+        return f"Resumen de cotizaciones de {self.mes:%Y-%m}"
@@ -0,0 +1,414 @@
+"""
+PDF de las cotizaciones. El documento se arma con ReportLab una sola vez y
+se guarda en disco (settings.PDF_CACHE_DIR) con un nombre que incluye el pk,
+la fecha de modificación de la cotización y VERSION_PLANTILLA: mientras la
+cotización no cambie se sirve el mismo archivo. Los cambios que no tocan la
+cotización pero sí lo que imprime (nombre, código o familia de sus
+materiales) borran sus archivos (ver signals).
+"""
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from contextlib import ExitStack
+from functools import cache
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+from . import precios
+from .exportacion import Flujo
+from .models import CotizacionLinea, Material
+
+# Subir al cambiar el diseño del PDF: descarta todo lo que hay en caché
+VERSION_PLANTILLA = 1
+
+# Orden de las familias en el documento; las demás van al final
+ORDEN_FAMILIAS = ['tuberia', 'anclaje', 'electricidad', 'drenaje']
+
+# Campos del material que aparecen en el PDF (el costo sale del JSON)
+CAMPOS_IMPRESOS = ('codigo', 'nombre', 'familia')
+
+# --- Tabla de materiales ---
+MARGEN_SUPERIOR = 160
+COLUMNAS = [70, 250, 60, 80, 80]
+FILAS_POR_TRAMO = 50
+TITULOS = ["Código", "Material", "Cantidad", "Costo Unitario ($)", "Precio ($)"]
+ESTILO_TITULOS = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
+]
+ESTILO_CUERPO = [
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+]
+
+
+class NumberedCanvas(canvas.Canvas):
+    """
+    Canvas que numera las páginas como "Página N de M" sin guardarlas hasta
+    el final: cada página dibuja un form XObject con su número, que se
+    define al cerrar el documento, cuando ya se conoce M. La memoria no
+    crece con copias del estado de cada página.
+    """
+
+    def showPage(self):
+        self.doForm(f"numero_pagina_{self._pageNumber}")
+        canvas.Canvas.showPage(self)
+
+    def save(self):
+        num_pages = self._pageNumber - 1
+        for pagina in range(1, num_pages + 1):
+            self.beginForm(f"numero_pagina_{pagina}")
+            self.draw_page_number(pagina, num_pages)
+            self.endForm()
+        canvas.Canvas.save(self)
+
+    def draw_page_number(self, page_number, page_count):
+        self.setFont("Helvetica", 9)
+        # Dibujar en la parte inferior derecha (x = 550 en carta vertical)
+        text = f"Página {page_number} de {page_count}"
+        self.drawRightString(self._pagesize[0] - 62, 30, text)
+
+
+@cache
+def _estilos():
+    """Estilos de párrafo, construidos una vez por proceso."""
+    styles = getSampleStyleSheet()
+    return {
+        'material': ParagraphStyle('MatStyle', parent=styles['Normal'], fontSize=9, leading=10),
+        'familia': ParagraphStyle('FamStyle', parent=styles['Normal'], fontSize=10, fontName='Helvetica-Bold'),
+    }
+
+
+@cache
+def _ruta_logo():
+    """
+    Ruta del logo, o None si no está. Se pasa como ruta y no como
+    ImageReader: ReportLab incrusta el JPEG tal cual, una vez por documento,
+    sin decodificarlo.
+    """
+    ruta = Path(settings.BASE_DIR) / 'app' / 'static' / 'img' / 'logo.jpeg'
+    return str(ruta) if ruta.is_file() else None
+
+
+def _prioridad_familia(nombre_familia):
+    nombre_normalizado = nombre_familia.lower()
+    if nombre_normalizado in ORDEN_FAMILIAS:
+        return ORDEN_FAMILIAS.index(nombre_normalizado)
+    return len(ORDEN_FAMILIAS)
+
+
+class _DocumentoPorTramos(SimpleDocTemplate):
+    """
+    Documento que recibe la tabla como un iterador de tramos y los pide a
+    medida que se maquetan: en memoria solo hay un par de tramos a la vez,
+    nunca las celdas de todas las líneas.
+    """
+
+    def __init__(self, *args, tramos, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tramos = tramos
+
+    def filterFlowables(self, flowables):
+        # Siempre queda uno detrás del que se procesa, para que build() no
+        # termine antes de agotar el iterador (_hanging es la lista interna
+        # de acciones de página de ReportLab)
+        if flowables is not self._hanging and len(flowables) < 2:
+            flowables.extend(islice(self._tramos, 2 - len(flowables)))
+
+
+def _tramos_de_tabla(filas):
+    """
+    Tablas de FILAS_POR_TRAMO filas a partir de (fila, tipo). Partir una
+    tabla entre páginas cuesta lo que mide la tabla, así que con tramos
+    cortos el costo por página es constante. El estilo de cada fila sale de
+    su tipo ('familia', 'total' o None), sin recorrer la tabla.
+    """
+    filas = iter(filas)
+    while tramo := list(islice(filas, FILAS_POR_TRAMO)):
+        t_style = list(ESTILO_CUERPO)
+        for i, (_, tipo) in enumerate(tramo):
+            if tipo == 'familia':
+                t_style.append(('BACKGROUND', (0, i), (-1, i), colors.lightgrey))
+            elif tipo == 'total':
+                t_style.append(('FONTNAME', (3, i), (4, i), 'Helvetica-Bold'))
+                t_style.append(('LINEABOVE', (3, i), (4, i), 0.5, colors.black))
+        yield Table([celdas for celdas, _ in tramo], colWidths=COLUMNAS, style=TableStyle(t_style))
+
+
+def renderizar_cotizacion(cotizacion, catalogo=None):
+    """
+    Bytes del PDF de la cotización (o revisión), sin pasar por la caché.
+    `catalogo` es {codigo: (nombre, familia)}; si no se da, se lee de la BD.
+    """
+    datos = cotizacion.documento
+    estilos = _estilos()
+
+    # --- PROCESAMIENTO DE DATOS ---
+    materiales_json = datos.get('materiales', {})
+    if catalogo is None:
+        catalogo = {
+            codigo: (nombre, familia)
+            for codigo, nombre, familia in Material.objects.filter(
+                codigo__in=materiales_json.keys()
+            ).values_list('codigo', 'nombre', 'familia')
+        }
+
+    # Importes, subtotales y total en centavos exactos (ver app.precios)
+    presupuesto = precios.Presupuesto.desde_materiales(
+        materiales_json, {codigo: familia for codigo, (_, familia) in catalogo.items()}
+    )
+    materiales_por_familia = defaultdict(list)
+    for linea in presupuesto.lineas():
+        materiales_por_familia[linea[1]].append(linea)
+
+    familias_presentes = sorted(materiales_por_familia.keys(), key=_prioridad_familia)
+
+    # --- FILAS DE LA TABLA ---
+    # Se generan a medida que se maquetan los tramos: (celdas, tipo)
+    def filas():
+        for familia in familias_presentes:
+            yield ["", Paragraph(familia.upper(), estilos['familia']), "", "", ""], 'familia'
+            # Ordenar materiales internamente por código
+            for codigo, _, _, precio, importe in sorted(materiales_por_familia[familia]):
+                nombre = catalogo[codigo][0] if codigo in catalogo else "Desconocido"
+                yield [
+                    codigo,
+                    Paragraph(nombre, estilos['material']),
+                    f"{float(materiales_json[codigo].get('cantidad', 0))}",
+                    f"{precios.a_decimal(precio):.2f}",
+                    f"{precios.a_decimal(importe):.2f}",
+                ], None
+            subtotal_familia = precios.a_decimal(presupuesto.subtotales[familia])
+            yield ["", "", "", f"SUBTOTAL {familia.upper()}", f"{subtotal_familia:.2f}"], 'total'
+        yield ["", "", "", "", ""], None  # Separador visual
+        yield ["", "", "", "TOTAL GENERAL", f"{precios.a_decimal(presupuesto.total):.2f}"], 'total'
+
+    # Fila de títulos: la dibuja el membrete en cada página (en lugar de
+    # repetirla dentro de la tabla) y la tabla empieza justo debajo
+    encabezado = Table([TITULOS], colWidths=COLUMNAS, style=TableStyle(ESTILO_TITULOS))
+    _, alto_encabezado = encabezado.wrap(0, 0)
+
+    tramos = _tramos_de_tabla(filas())
+    buffer = BytesIO()
+    doc = _DocumentoPorTramos(
+        buffer,
+        pagesize=letter,
+        leftMargin=50,
+        rightMargin=50,
+        topMargin=MARGEN_SUPERIOR + alto_encabezado,
+        bottomMargin=50,
+        tramos=tramos,
+    )
+    # Misma posición que tendría la primera fila de la tabla en el marco
+    # (6 pt de relleno; las tablas más anchas que el marco no se centran)
+    x_tabla = doc.leftMargin + 6 + max(doc.width - 12 - sum(COLUMNAS), 0) / 2
+    y_encabezado = doc.pagesize[1] - MARGEN_SUPERIOR - 6 - alto_encabezado
+
+    def membrete(canvas, doc):
+        canvas.saveState()
+        logo_path = _ruta_logo()
+        if logo_path:
+            canvas.drawImage(logo_path, 50, 710, width=100, height=50, preserveAspectRatio=True, mask='auto')
+
+        canvas.setFont("Helvetica", 7)
+        fecha_gen = cotizacion.fecha_generacion.strftime('%d/%m/%Y')
+        canvas.drawRightString(550, 755, f"Fecha generación: {fecha_gen}")
+        fecha_mod = cotizacion.fecha_modificacion.strftime('%d/%m/%Y')
+        canvas.drawRightString(550, 745, f"Fecha modificación: {fecha_mod}")
+
+        y_pos = 690
+        canvas.setFont("Helvetica-Bold", 10)
+        canvas.drawString(60, y_pos, f"Cotización: {cotizacion.nombre}")
+        y_pos -= 15
+        canvas.setFont("Helvetica", 10)
+        canvas.drawString(60, y_pos, f"Cliente: {datos.get('cliente', 'N/A')}")
+        y_pos -= 15
+        canvas.drawString(60, y_pos, f"Dirección del Proyecto: {datos.get('direccion_proyecto', 'N/A')}")
+        y_pos -= 15
+        canvas.drawString(60, y_pos, f"Ingeniero Encargado: {datos.get('ingeniero_encargado', 'N/A')}")
+        canvas.restoreState()
+        encabezado.drawOn(canvas, x_tabla, y_encabezado)
+
+    # Siempre hay al menos un tramo: el del total general
+    doc.build([next(tramos)], onFirstPage=membrete, onLaterPages=membrete, canvasmaker=NumberedCanvas)
+    return buffer.getvalue()
+
+
+# --- Caché en disco ---
+
+def _directorio():
+    return Path(settings.PDF_CACHE_DIR)
+
+
+def nombre_en_cache(cotizacion):
+    marca = int(cotizacion.fecha_modificacion.timestamp() * 1_000_000)
+    return f"cotizacion-{cotizacion.pk}-{marca}-v{VERSION_PLANTILLA}.pdf"
+
+
+def ruta_en_cache(cotizacion):
+    """Ruta del PDF vigente de la cotización; lo genera si no está en disco."""
+    directorio = _directorio()
+    ruta = directorio / nombre_en_cache(cotizacion)
+    if ruta.is_file():
+        return ruta
+
+    return _guardar_en_cache(cotizacion, renderizar_cotizacion(cotizacion))
+
+
+def _guardar_en_cache(cotizacion, contenido):
+    directorio = _directorio()
+    ruta = directorio / nombre_en_cache(cotizacion)
+    directorio.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica: ningún otro proceso ve un PDF a medio escribir
+    with tempfile.NamedTemporaryFile(dir=directorio, suffix='.tmp', delete=False) as temporal:
+        temporal.write(contenido)
+    os.replace(temporal.name, ruta)
+    _borrar([cotizacion.pk], conservar=ruta)
+    return ruta
+
+
+def abrir_cotizacion(cotizacion):
+    """(archivo abierto, tamaño en bytes, ETag) del PDF de la cotización."""
+    try:
+        archivo = open(ruta_en_cache(cotizacion), 'rb')
+    except FileNotFoundError:
+        # Otro proceso lo invalidó entre la comprobación y la apertura
+        archivo = open(ruta_en_cache(cotizacion), 'rb')
+    estado = os.fstat(archivo.fileno())
+    # La fecha del archivo distingue un PDF regenerado tras invalidarse por
+    # un cambio en los materiales, que conserva el mismo nombre
+    etag = f'"{Path(archivo.name).stem}-{estado.st_mtime_ns}"'
+    return archivo, estado.st_size, etag
+
+
+def _borrar(cotizacion_ids, conservar=None):
+    directorio = _directorio()
+    if not directorio.is_dir():
+        return
+    for pk in cotizacion_ids:
+        for ruta in directorio.glob(f"cotizacion-{pk}-*.pdf"):
+            if ruta != conservar:
+                ruta.unlink(missing_ok=True)
+
+
+def invalidar(cotizacion_ids):
+    """Borra los PDF en caché de las cotizaciones al confirmar la transacción."""
+    cotizacion_ids = set(cotizacion_ids)
+    if cotizacion_ids:
+        transaction.on_commit(lambda: _borrar(cotizacion_ids))
+
+
+def invalidar_materiales(material_ids):
+    """Borra los PDF de las cotizaciones (y revisiones) que usan esos materiales."""
+    invalidar(
+        CotizacionLinea.objects.filter(material_id__in=material_ids)
+        .values_list('cotizacion_id', flat=True).distinct()
+    )
+
+
+# --- Exportación en lote ---
+
+# Catálogo de cada proceso de trabajo (lo fija _iniciar_proceso)
+_catalogo = None
+
+
+def _iniciar_proceso(catalogo):
+    global _catalogo
+    _catalogo = catalogo
+
+
+def _renderizar_en_cache(cotizacion):
+    """En un proceso de trabajo: genera el PDF y lo deja en la caché; sin consultas."""
+    return _guardar_en_cache(cotizacion, renderizar_cotizacion(cotizacion, _catalogo))
+
+
+def nombre_en_zip(cotizacion):
+    return f"{cotizacion.correlativo}.pdf"
+
+
+def exportar_zip(cotizaciones, salida, procesos=1):
+    """
+    Escribe en `salida` un ZIP con el PDF de cada cotización y devuelve un
+    iterador que avanza una cotización por paso: (cotizacion, desde_cache).
+    `salida` puede ser un archivo o cualquier objeto con write(); no hace
+    falta que admita seek, así que sirve para una respuesta en streaming.
+    Los PDF van en el ZIP en el orden de `cotizaciones`.
+
+    Los PDF que ya están en caché se copian tal cual; los demás se generan
+    en `procesos` procesos (con fork, como regenerar_cotizaciones) y quedan
+    en la caché para la próxima vez. Donde no hay fork se generan en este
+    proceso: los hijos arrancarían sin Django configurado.
+    """
+    cotizaciones = list(cotizaciones.select_related('revision_de'))
+    faltantes = [c for c in cotizaciones if not (_directorio() / nombre_en_cache(c)).is_file()]
+
+    codigos = set()
+    for cotizacion in faltantes:
+        codigos.update(cotizacion.documento.get('materiales', {}))
+    catalogo = {
+        codigo: (nombre, familia)
+        for codigo, nombre, familia in Material.objects.filter(
+            codigo__in=codigos
+        ).values_list('codigo', 'nombre', 'familia')
+    }
+
+    procesos = min(max(procesos, 1), len(faltantes))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        procesos = 1
+
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip, ExitStack() as pila:
+        generados = {}
+        if procesos > 1:
+            # Los procesos hijos no deben heredar conexiones abiertas; no consultan nada
+            connections.close_all()
+            pool = pila.enter_context(ProcessPoolExecutor(
+                max_workers=procesos, mp_context=multiprocessing.get_context('fork'),
+                initializer=_iniciar_proceso, initargs=(catalogo,),
+            ))
+            # Se generan en paralelo mientras se copian los que están en caché
+            generados = {c.pk: pool.submit(_renderizar_en_cache, c) for c in faltantes}
+        else:
+            _iniciar_proceso(catalogo)
+        pendientes = {c.pk for c in faltantes}
+
+        for cotizacion in cotizaciones:
+            if cotizacion.pk in generados:
+                ruta = generados[cotizacion.pk].result()
+            elif cotizacion.pk in pendientes:
+                ruta = _renderizar_en_cache(cotizacion)
+            else:
+                try:
+                    archivo_zip.write(_directorio() / nombre_en_cache(cotizacion), nombre_en_zip(cotizacion))
+                except FileNotFoundError:
+                    # Se invalidó después de revisar la caché
+                    ruta = ruta_en_cache(cotizacion)
+                else:
+                    yield cotizacion, True
+                    continue
+            archivo_zip.write(ruta, nombre_en_zip(cotizacion))
+            yield cotizacion, False
+
+
+def zip_en_streaming(cotizaciones, procesos=1):
+    """Trozos del ZIP de exportar_zip a medida que se escriben (para StreamingHttpResponse)."""
+    flujo = Flujo()
+    for _ in exportar_zip(cotizaciones, flujo, procesos):
+        yield from flujo.vaciar()
+    # Directorio central del ZIP, escrito al cerrarlo
+    yield from flujo.vaciar()
@@ -0,0 +1,121 @@
+"""
+Motor de precios de cotizaciones en aritmética entera. Costos, precios e
+importes van en centavos, las utilidades en puntos básicos (30% = 3000) y
+las cantidades en diezmilésimas (los 4 decimales de CotizacionLinea), así
+que líneas, subtotales y totales son exactos y salen iguales en el PDF, el
+formulario de edición, la vista previa y el presupuesto de la obra.
+
+El JSON de las cotizaciones sigue guardando `costo_unitario` como número;
+al leerlo se redondea a centavos, de modo que los documentos antiguos (con
+arrastre de float) y los nuevos (ya redondeados) se tratan igual.
+"""
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils.functional import cached_property
+
+CENTAVOS = 100
+ESCALA_CANTIDAD = 10_000
+BASE_UTILIDAD = 10_000
+UTILIDAD_POR_DEFECTO = 3_000  # 30%
+
+
+def _escalar(valor, escala):
+    return int((Decimal(str(valor or 0)) * escala).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def _dividir(numerador, divisor):
+    """Cociente entero redondeado a la mitad hacia arriba (simétrico en negativos)."""
+    cociente, resto = divmod(abs(numerador), divisor)
+    if resto * 2 >= divisor:
+        cociente += 1
+    return cociente if numerador >= 0 else -cociente
+
+
+def a_centavos(valor):
+    return _escalar(valor, CENTAVOS)
+
+
+def a_cantidad(valor):
+    return _escalar(valor, ESCALA_CANTIDAD)
+
+
+def a_puntos_basicos(fraccion):
+    """0.30 -> 3000."""
+    return _escalar(fraccion, BASE_UTILIDAD)
+
+
+def porcentaje_a_puntos_basicos(porcentaje):
+    """30 -> 3000."""
+    return _escalar(porcentaje, CENTAVOS)
+
+
+def a_decimal(centavos):
+    return Decimal(centavos).scaleb(-2)
+
+
+def a_numero(centavos):
+    """Centavos como número para el JSON (128.7, nunca 128.70000000000002)."""
+    return float(a_decimal(centavos))
+
+
+def precio_con_utilidad(costo_centavos, utilidad=UTILIDAD_POR_DEFECTO):
+    """Precio de venta en centavos: costo x (1 + utilidad), redondeado al centavo."""
+    return _dividir(costo_centavos * (BASE_UTILIDAD + utilidad), BASE_UTILIDAD)
+
+
+def importe(cantidad, precio_centavos):
+    """Importe de una línea en centavos (`cantidad` en diezmilésimas)."""
+    return _dividir(cantidad * precio_centavos, ESCALA_CANTIDAD)
+
+
+class Presupuesto:
+    """
+    Líneas de una cotización en arreglos paralelos de enteros. Importes,
+    subtotales por familia y total se calculan en una pasada sobre los
+    arreglos, sin Decimal ni float por línea.
+    """
+
+    def __init__(self, codigos, cantidades, precios, familias):
+        self.codigos = list(codigos)
+        self.cantidades = array('q', cantidades)
+        self.precios = array('q', precios)
+        self.familias = list(familias)
+
+    @classmethod
+    def desde_materiales(cls, materiales, familias=None, familia_por_defecto='OTRO'):
+        """
+        `materiales` es el dict {codigo: {'cantidad', 'costo_unitario'}} de
+        Cotizacion.documento; `familias` {codigo: familia}.
+        """
+        familias = familias or {}
+        codigos = list(materiales)
+        return cls(
+            codigos,
+            (a_cantidad(materiales[codigo].get('cantidad')) for codigo in codigos),
+            (a_centavos(materiales[codigo].get('costo_unitario')) for codigo in codigos),
+            (familias.get(codigo, familia_por_defecto) for codigo in codigos),
+        )
+
+    def __len__(self):
+        return len(self.codigos)
+
+    @cached_property
+    def importes(self):
+        return array('q', map(importe, self.cantidades, self.precios))
+
+    @cached_property
+    def total(self):
+        return sum(self.importes)
+
+    @cached_property
+    def subtotales(self):
+        """{familia: centavos}."""
+        subtotales = {}
+        for familia, importe_linea in zip(self.familias, self.importes):
+            subtotales[familia] = subtotales.get(familia, 0) + importe_linea
+        return subtotales
+
+    def lineas(self):
+        """(codigo, familia, cantidad en diezmilésimas, precio, importe) por línea."""
+        return zip(self.codigos, self.familias, self.cantidades, self.precios, self.importes)
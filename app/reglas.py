@@ -0,0 +1,341 @@
+"""
+Motor de reglas Equipo -> Material y Material -> Material.
+
+Todas las reglas se leen de una vez y se compilan en un grafo con orden
+topológico (se rechazan los ciclos). El grafo compilado se guarda por
+proceso junto con un sello de las tablas de reglas (última modificación y
+número de filas); si otro proceso cambia las reglas el sello deja de
+coincidir y se recompila. Con él, expandir los materiales de una cotización
+no hace más consultas que las dos del sello.
+"""
+import hashlib
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.functional import cached_property
+
+from .models import ReglaEquipoMaterial, ReglaMaterialMaterial
+
+CERO = Decimal('0')
+
+
+class ErrorReglas(Exception):
+    pass
+
+
+class CicloEnReglas(ErrorReglas):
+    def __init__(self, ciclo):
+        self.ciclo = ciclo
+        super().__init__("Ciclo en las reglas de materiales: " + " -> ".join(ciclo))
+
+
+def _coeficientes(regla, origen):
+    """{codigo: cantidad} de la lista JSON de una regla (los repetidos se suman)."""
+    coeficientes = defaultdict(Decimal)
+    items = regla.materiales_requeridos
+    if not isinstance(items, list):
+        raise ErrorReglas(f"Regla de {origen}: materiales_requeridos debe ser una lista.")
+    for item in items:
+        try:
+            coeficientes[str(item['codigo'])] += Decimal(str(item['cantidad']))
+        except (KeyError, TypeError, InvalidOperation):
+            raise ErrorReglas(f"Regla de {origen}: item inválido {item!r}.")
+    return coeficientes
+
+
+def _orden_topologico(aristas):
+    """
+    Orden topológico (Kahn) de los materiales con reglas. Si hay un ciclo
+    lanza CicloEnReglas con uno de los recorridos que lo forman.
+    """
+    entrantes = defaultdict(int)
+    for hijos in aristas.values():
+        for hijo in hijos:
+            entrantes[hijo] += 1
+    pendientes = [codigo for codigo in aristas if not entrantes[codigo]]
+    orden = []
+    while pendientes:
+        codigo = pendientes.pop()
+        orden.append(codigo)
+        for hijo in aristas.get(codigo, ()):
+            entrantes[hijo] -= 1
+            if not entrantes[hijo] and hijo in aristas:
+                pendientes.append(hijo)
+    if len(orden) < len(aristas):
+        raise CicloEnReglas(_buscar_ciclo(aristas, set(aristas) - set(orden)))
+    return orden
+
+
+def _buscar_ciclo(aristas, candidatos):
+    # Cada nodo que quedó fuera del orden tiene algún predecesor también
+    # fuera; retrocediendo por ellos se termina cerrando un ciclo
+    predecesores = defaultdict(list)
+    for origen in candidatos:
+        for hijo in aristas[origen]:
+            if hijo in candidatos:
+                predecesores[hijo].append(origen)
+    codigo = min(candidatos)
+    camino, vistos = [], {}
+    while codigo not in vistos:
+        vistos[codigo] = len(camino)
+        camino.append(codigo)
+        codigo = min(predecesores[codigo])
+    ciclo = camino[vistos[codigo]:] + [codigo]
+    return ciclo[::-1]
+
+
+class GrafoReglas:
+    def __init__(self, por_equipo, por_material):
+        # por_equipo: {modelo: {codigo: cantidad}}
+        # por_material: {codigo_origen: {codigo: cantidad}}
+        self.por_equipo = por_equipo
+        self.por_material = por_material
+        self.posicion = {codigo: i for i, codigo in enumerate(_orden_topologico(por_material))}
+
+    @classmethod
+    def desde_bd(cls, reglas_equipo=None, reglas_material=None):
+        if reglas_equipo is None:
+            reglas_equipo = ReglaEquipoMaterial.objects.all()
+        if reglas_material is None:
+            reglas_material = ReglaMaterialMaterial.objects.all()
+
+        por_equipo = defaultdict(lambda: defaultdict(Decimal))
+        for regla in reglas_equipo:
+            for codigo, cantidad in _coeficientes(regla, regla.equipo_origen_id).items():
+                por_equipo[regla.equipo_origen_id][codigo] += cantidad
+        por_material = defaultdict(lambda: defaultdict(Decimal))
+        for regla in reglas_material:
+            for codigo, cantidad in _coeficientes(regla, regla.material_origen_id).items():
+                por_material[regla.material_origen_id][codigo] += cantidad
+        return cls(
+            {k: dict(v) for k, v in por_equipo.items()},
+            {k: dict(v) for k, v in por_material.items()},
+        )
+
+    def expandir_equipos(self, equipos):
+        """{modelo: cantidad} -> {codigo: Decimal} con las reglas Equipo -> Material."""
+        materiales = defaultdict(Decimal)
+        for modelo, cantidad_equipo in equipos.items():
+            if cantidad_equipo is None:
+                continue
+            cantidad_equipo = Decimal(str(cantidad_equipo))
+            for codigo, cantidad in self.por_equipo.get(modelo, {}).items():
+                materiales[codigo] += cantidad * cantidad_equipo
+        return materiales
+
+    def expandir_materiales(self, materiales):
+        """
+        {codigo: cantidad} -> {codigo: Decimal} con la clausura de las reglas
+        Material -> Material. Los materiales alcanzables se recorren una sola
+        vez en orden topológico, así cada uno se expande con su cantidad
+        final aunque se llegue a él por varios caminos.
+        """
+        totales = defaultdict(Decimal, {k: Decimal(str(v)) for k, v in materiales.items()})
+
+        alcanzables = set()
+        pila = [codigo for codigo in totales if codigo in self.por_material]
+        while pila:
+            codigo = pila.pop()
+            if codigo in alcanzables:
+                continue
+            alcanzables.add(codigo)
+            pila.extend(h for h in self.por_material[codigo] if h in self.por_material)
+
+        for codigo in sorted(alcanzables, key=self.posicion.__getitem__):
+            cantidad_origen = totales[codigo]
+            for codigo_req, cantidad in self.por_material[codigo].items():
+                cantidad_a_agregar = cantidad * cantidad_origen
+                if cantidad_a_agregar > 0:
+                    totales[codigo_req] += cantidad_a_agregar
+        return totales
+
+    def explotar_corrida(self, datos):
+        """
+        Materiales de una Corrida.datos: tuberías más lo que piden sus
+        equipos, con la clausura de las reglas Material -> Material.
+        Devuelve {codigo: Decimal} solo con cantidades positivas.
+        """
+        base = defaultdict(Decimal, {k: Decimal(str(v)) for k, v in datos.get('tuberias', {}).items()})
+        for codigo, cantidad in self.expandir_equipos(datos.get('equipos', {})).items():
+            base[codigo] += cantidad
+        return {k: v for k, v in self.expandir_materiales(base).items() if v > 0}
+
+    # --- Expansión por unidad (vista previa incremental) ---
+
+    @cached_property
+    def lineal(self):
+        """
+        True si ninguna regla tiene coeficientes negativos. Solo entonces
+        la expansión es lineal en las cantidades de entrada y se puede
+        sumar por partes (ver expansion_unitaria).
+        """
+        return all(
+            cantidad >= 0
+            for reglas_por_origen in (self.por_equipo, self.por_material)
+            for coeficientes in reglas_por_origen.values()
+            for cantidad in coeficientes.values()
+        )
+
+    @cached_property
+    def _filas_unitarias(self):
+        return {}
+
+    def _fila_material(self, codigo):
+        """{codigo: factor} que termina pidiendo una unidad de `codigo`."""
+        filas = self._filas_unitarias
+        clave = ('material', codigo)
+        if clave in filas:
+            return filas[clave]
+        if codigo not in self.por_material:
+            return {codigo: Decimal(1)}
+
+        # Subárbol alcanzable sin fila calculada, resuelto de las hojas hacia arriba
+        pendientes, pila = set(), [codigo]
+        while pila:
+            actual = pila.pop()
+            if actual in pendientes or ('material', actual) in filas:
+                continue
+            pendientes.add(actual)
+            pila.extend(h for h in self.por_material[actual] if h in self.por_material)
+        for actual in sorted(pendientes, key=self.posicion.__getitem__, reverse=True):
+            fila = defaultdict(Decimal)
+            fila[actual] += 1
+            for hijo, coeficiente in self.por_material[actual].items():
+                if coeficiente <= 0:
+                    continue
+                for codigo_final, factor in filas.get(('material', hijo), {hijo: Decimal(1)}).items():
+                    fila[codigo_final] += coeficiente * factor
+            filas[('material', actual)] = dict(fila)
+        return filas[clave]
+
+    def expansion_unitaria(self, tipo, clave):
+        """
+        Materiales totales por una unidad de un equipo (tipo 'equipo', clave
+        = modelo) o de una tubería (tipo 'tuberia', clave = código), reglas
+        Material -> Material incluidas. Se memoriza por grafo: cada subárbol
+        se calcula una sola vez. Requiere self.lineal.
+        """
+        if tipo == 'tuberia':
+            return self._fila_material(clave)
+        filas = self._filas_unitarias
+        if ('equipo', clave) not in filas:
+            fila = defaultdict(Decimal)
+            for codigo, coeficiente in self.por_equipo.get(clave, {}).items():
+                for codigo_final, factor in self._fila_material(codigo).items():
+                    fila[codigo_final] += coeficiente * factor
+            filas[('equipo', clave)] = dict(fila)
+        return filas[('equipo', clave)]
+
+    @cached_property
+    def firma(self):
+        """Huella del contenido de las reglas, estable entre procesos."""
+        contenido = repr((
+            sorted((k, sorted(v.items())) for k, v in self.por_equipo.items()),
+            sorted((k, sorted(v.items())) for k, v in self.por_material.items()),
+        ))
+        return hashlib.sha1(contenido.encode()).hexdigest()
+
+    # --- Explosión en lote ---
+
+    @cached_property
+    def orden(self):
+        return sorted(self.posicion, key=self.posicion.__getitem__)
+
+    def explotar_corridas(self, datos_por_clave):
+        """
+        Versión en lote de explotar_corrida: {clave: Corrida.datos} ->
+        {clave: {codigo: Decimal}} con resultados idénticos.
+
+        Las corridas se apilan en una matriz dispersa material x corrida y
+        la clausura se obtiene por sustitución hacia adelante sobre la matriz
+        de reglas: cada material se visita una sola vez en orden topológico y
+        empuja su fila completa a sus hijos. Las sumas se hacen en el mismo
+        orden que en el camino escalar, así los Decimal coinciden exactamente.
+        Las corridas con cantidades base negativas (donde la expansión deja
+        de ser lineal) se resuelven con el camino escalar.
+        """
+        resultados = {}
+        filas = defaultdict(dict)  # codigo -> {clave: cantidad}
+        for clave, datos in datos_por_clave.items():
+            base = defaultdict(Decimal, {k: Decimal(str(v)) for k, v in datos.get('tuberias', {}).items()})
+            for codigo, cantidad in self.expandir_equipos(datos.get('equipos', {})).items():
+                base[codigo] += cantidad
+            if any(cantidad < 0 for cantidad in base.values()):
+                resultados[clave] = self.explotar_corrida(datos)
+                continue
+            resultados[clave] = {}
+            for codigo, cantidad in base.items():
+                if cantidad:
+                    filas[codigo][clave] = cantidad
+
+        for codigo in self.orden:
+            fila = filas.get(codigo)
+            if not fila:
+                continue
+            for codigo_req, coeficiente in self.por_material[codigo].items():
+                # Con cantidades positivas expandir_materiales descarta estas aristas
+                if coeficiente <= 0:
+                    continue
+                destino = filas[codigo_req]
+                for clave, cantidad_origen in fila.items():
+                    destino[clave] = destino.get(clave, CERO) + coeficiente * cantidad_origen
+
+        for codigo, fila in filas.items():
+            for clave, cantidad in fila.items():
+                if cantidad > 0:
+                    resultados[clave][codigo] = cantidad
+        return resultados
+
+
+def explotar_corridas(corridas):
+    """{corrida.pk: {codigo: Decimal}} para un iterable de Corridas (sin consultas extra)."""
+    return obtener_grafo().explotar_corridas({corrida.pk: corrida.datos for corrida in corridas})
+
+
+_grafo = None
+_version = None
+
+
+def version():
+    """
+    Sello de las reglas en la base: toda alta o edición renueva
+    fecha_modificacion y toda baja cambia el número de filas, así que el
+    sello cambia en cualquier proceso sin depender del backend de caché.
+    """
+    return tuple(
+        tuple(modelo.objects.aggregate(ultima=Max('fecha_modificacion'), reglas=Count('pk')).values())
+        for modelo in (ReglaEquipoMaterial, ReglaMaterialMaterial)
+    )
+
+
+def obtener_grafo():
+    """Grafo compilado del proceso; se recompila si las reglas cambiaron en la base."""
+    global _grafo, _version
+    sello = version()
+    if _grafo is None or sello != _version:
+        _grafo = GrafoReglas.desde_bd()
+        _version = sello
+    return _grafo
+
+
+def invalidar():
+    """Descarta el grafo compilado de este proceso (los demás lo notan por el sello)."""
+    global _grafo
+
+    def _invalidar():
+        global _grafo
+        _grafo = None
+
+    _grafo = None
+    # Que nadie recompile con datos aún sin confirmar
+    transaction.on_commit(_invalidar)
+
+
+def validar_regla_material(regla):
+    """Lanza CicloEnReglas si `regla` (nueva o editada) cierra un ciclo."""
+    otras = ReglaMaterialMaterial.objects.all()
+    if regla.pk:
+        otras = otras.exclude(pk=regla.pk)
+    GrafoReglas.desde_bd(reglas_equipo=[], reglas_material=[*otras, regla])
@@ -0,0 +1,108 @@
+"""
+Persistencia de los requerimientos de material de una tarea a partir de la
+tabla de cantidades de los formularios de tarea (campos material-quantity-<pk>).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .avance import efectos_diferidos
+from .models import Material, RequerimientoMaterial
+
+PREFIJO_CAMPO = 'material-quantity-'
+PRECISION_CANTIDAD = Decimal('0.01')
+# RequerimientoMaterial.cantidad_requerida: max_digits=8, decimal_places=2
+MAX_CANTIDAD = Decimal('999999.99')
+
+
+class ErrorRequerimientos(Exception):
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__(' '.join(errores))
+
+
+def leer_cantidades(datos):
+    """
+    Devuelve {material_pk: cantidad} con las cantidades mayores que cero de
+    los campos material-quantity-<pk>. Los valores inválidos y los materiales
+    que no existen se reportan juntos con ErrorRequerimientos.
+    """
+    cantidades = {}
+    errores = []
+    for clave, valor in datos.items():
+        if not clave.startswith(PREFIJO_CAMPO):
+            continue
+        sufijo = clave[len(PREFIJO_CAMPO):]
+        valor = (valor or '').strip()
+        if not valor:
+            continue
+        try:
+            material_pk = int(sufijo)
+            cantidad = Decimal(valor)
+        except (ValueError, InvalidOperation):
+            errores.append(f"Cantidad inválida para el material {sufijo}: '{valor}'.")
+            continue
+        if not cantidad.is_finite() or cantidad < 0 or cantidad > MAX_CANTIDAD:
+            errores.append(f"Cantidad fuera de rango para el material {material_pk}: '{valor}'.")
+            continue
+        cantidad = cantidad.quantize(PRECISION_CANTIDAD)
+        if cantidad > 0:
+            cantidades[material_pk] = cantidad
+
+    existentes = set(Material.objects.filter(pk__in=cantidades.keys()).values_list('pk', flat=True))
+    desconocidos = sorted(set(cantidades) - existentes)
+    if desconocidos:
+        errores.append(f"Materiales inexistentes: {', '.join(map(str, desconocidos))}.")
+    if errores:
+        raise ErrorRequerimientos(errores)
+    return cantidades
+
+
+def guardar_requerimientos(tarea, cantidades):
+    """
+    Ajusta los requerimientos de la tarea a {material_pk: cantidad}: crea los
+    nuevos, actualiza las cantidades que cambiaron y borra el resto, con una
+    consulta por operación. Los que no cambian conservan su pk y su
+    fecha_modificacion, así la sincronización por deltas no los reenvía.
+    Devuelve (creados, actualizados, eliminados).
+    """
+    actuales = {}
+    sobrantes = []
+    for req in RequerimientoMaterial.objects.filter(tarea=tarea).order_by('pk'):
+        if req.material_id in actuales:
+            # Material repetido (p. ej. cargado desde el admin): se conserva el primero
+            sobrantes.append(req.pk)
+        else:
+            actuales[req.material_id] = req
+
+    nuevos = [
+        RequerimientoMaterial(tarea=tarea, material_id=material_pk, cantidad_requerida=cantidad)
+        for material_pk, cantidad in cantidades.items()
+        if material_pk not in actuales
+    ]
+    cambiados = []
+    ahora = timezone.now()
+    for material_pk, req in actuales.items():
+        cantidad = cantidades.get(material_pk)
+        if cantidad is None:
+            sobrantes.append(req.pk)
+        elif req.cantidad_requerida != cantidad:
+            req.cantidad_requerida = cantidad
+            # bulk_update no aplica auto_now
+            req.fecha_modificacion = ahora
+            cambiados.append(req)
+
+    if not (nuevos or cambiados or sobrantes):
+        return 0, 0, 0
+
+    # Los receptores de post_delete registran las eliminaciones para la
+    # sincronización; con efectos_diferidos se escriben en lote y el resumen
+    # de la tarea se recalcula una sola vez al final.
+    with transaction.atomic(), efectos_diferidos() as tareas_a_recalcular:
+        RequerimientoMaterial.objects.bulk_create(nuevos)
+        RequerimientoMaterial.objects.bulk_update(cambiados, ['cantidad_requerida', 'fecha_modificacion'])
+        if sobrantes:
+            RequerimientoMaterial.objects.filter(pk__in=sobrantes).delete()
+        tareas_a_recalcular.add(tarea.pk)
+    return len(nuevos), len(cambiados), len(sobrantes)
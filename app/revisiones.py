@@ -0,0 +1,160 @@
+"""
+Revisiones de cotizaciones guardadas como diferencias. Cada revisión
+(_rev_N) apunta a su cotización base (revision_de) y guarda en `delta` solo
+lo que cambia respecto de ella: campos generales, utilidades y líneas de
+material agregadas, modificadas o eliminadas. Como el delta es siempre
+contra la base, materializar cualquier revisión es aplicar un único delta.
+
+Formato del delta (se omiten las claves vacías):
+    {'campos': {clave: valor}, 'campos_quitados': [clave],
+     'agregados': {codigo: info}, 'modificados': {codigo: info},
+     'eliminados': [codigo]}
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .models import Cotizacion
+
+_FALTA = object()
+
+
+def calcular_delta(base, datos):
+    """Delta que convierte el JSON `base` en `datos`."""
+    materiales_base = base.get('materiales') or {}
+    materiales = datos.get('materiales') or {}
+    delta = {
+        'campos': {
+            clave: valor for clave, valor in datos.items()
+            if clave != 'materiales' and base.get(clave, _FALTA) != valor
+        },
+        'campos_quitados': sorted(clave for clave in base if clave != 'materiales' and clave not in datos),
+        'agregados': {codigo: info for codigo, info in materiales.items() if codigo not in materiales_base},
+        'modificados': {
+            codigo: info for codigo, info in materiales.items()
+            if codigo in materiales_base and materiales_base[codigo] != info
+        },
+        'eliminados': sorted(codigo for codigo in materiales_base if codigo not in materiales),
+    }
+    return {clave: valor for clave, valor in delta.items() if valor}
+
+
+def aplicar_delta(base, delta):
+    """JSON completo de la revisión. No modifica `base`."""
+    quitados = set(delta.get('campos_quitados', ()))
+    datos = {clave: valor for clave, valor in base.items() if clave != 'materiales' and clave not in quitados}
+    datos.update(delta.get('campos', {}))
+
+    eliminados = set(delta.get('eliminados', ()))
+    materiales = {
+        codigo: dict(info) for codigo, info in (base.get('materiales') or {}).items()
+        if codigo not in eliminados
+    }
+    for grupo in ('agregados', 'modificados'):
+        materiales.update({codigo: dict(info) for codigo, info in delta.get(grupo, {}).items()})
+    datos['materiales'] = materiales
+    return datos
+
+
+def resumen_delta(delta):
+    """Cuántas líneas agrega, modifica y elimina la revisión, sin materializarla."""
+    delta = delta or {}
+    return {
+        'agregados': len(delta.get('agregados', {})),
+        'modificados': len(delta.get('modificados', {})),
+        'eliminados': len(delta.get('eliminados', [])),
+        'campos': sorted([*delta.get('campos', {}), *delta.get('campos_quitados', [])]),
+    }
+
+
+def diferencias(datos_a, datos_b):
+    """
+    Cambios de `datos_a` a `datos_b` listos para mostrar: campos
+    [(clave, antes, después)], líneas agregadas y eliminadas [(codigo, info)]
+    y modificadas [(codigo, antes, después)].
+    """
+    delta = calcular_delta(datos_a, datos_b)
+    materiales_a = datos_a.get('materiales') or {}
+    return {
+        'campos': [
+            (clave, datos_a.get(clave), datos_b.get(clave))
+            for clave in sorted([*delta.get('campos', {}), *delta.get('campos_quitados', [])])
+        ],
+        'agregados': sorted(delta.get('agregados', {}).items()),
+        'eliminados': [(codigo, materiales_a[codigo]) for codigo in delta.get('eliminados', [])],
+        'modificados': [
+            (codigo, materiales_a[codigo], info) for codigo, info in sorted(delta.get('modificados', {}).items())
+        ],
+    }
+
+
+def campo(cotizacion, clave, defecto=None):
+    """Un campo general del documento de la cotización sin materializar sus líneas."""
+    if cotizacion.revision_de_id is None:
+        return cotizacion.datos.get(clave, defecto)
+    delta = cotizacion.delta or {}
+    if clave in delta.get('campos_quitados', ()):
+        return defecto
+    return delta.get('campos', {}).get(clave, cotizacion.revision_de.datos.get(clave, defecto))
+
+
+def base_de(cotizacion):
+    return cotizacion.revision_de if cotizacion.revision_de_id else cotizacion
+
+
+def familia(cotizacion):
+    """Base y revisiones de la cotización, en orden. Solo carga los deltas."""
+    base = base_de(cotizacion)
+    return [base, *base.revisiones.order_by('revision')]
+
+
+def _siguiente_revision(base):
+    """Número de la próxima revisión: un MAX sobre (revision_de, revision)."""
+    ultima = base.revisiones.aggregate(ultima=Max('revision'))['ultima']
+    # Una base importada como '..._rev_N' ya ocupa el número N
+    return max(ultima or 0, base.revision) + 1
+
+
+def crear_revision(original, nombre, datos):
+    """
+    Nueva revisión con el JSON completo `datos`, guardada como delta contra
+    la base de `original` (que puede ser la base o cualquiera de sus revisiones).
+    """
+    base = base_de(original)
+    delta = calcular_delta(base.datos, datos)
+    correlativo_base = re.sub(r'_rev_\d+$', '', base.correlativo)
+    # Se bloquea la base (como generar_cotizacion con la corrida) para que dos
+    # guardados simultáneos no tomen el mismo número. En SQLite, que no
+    # bloquea filas, el segundo choca con la restricción única y se repite
+    # con el número siguiente.
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                Cotizacion.objects.select_for_update().only('pk').get(pk=base.pk)
+                numero_revision = _siguiente_revision(base)
+                return Cotizacion.objects.create(
+                    corrida_id=base.corrida_id,
+                    nombre=nombre,
+                    correlativo=f"{correlativo_base}_rev_{numero_revision}",
+                    anio=base.anio,
+                    numero=base.numero,
+                    revision=numero_revision,
+                    datos={},
+                    revision_de=base,
+                    delta=delta,
+                )
+        except IntegrityError:
+            if intento:
+                raise
+
+
+def rebasar(base, datos_nuevos):
+    """
+    Antes de reemplazar el JSON de una base, recalcula los deltas de sus
+    revisiones contra `datos_nuevos` para que sigan materializando lo mismo.
+    """
+    revisiones = list(base.revisiones.only('pk', 'delta'))
+    for revision in revisiones:
+        revision.delta = calcular_delta(datos_nuevos, aplicar_delta(base.datos, revision.delta or {}))
+    Cotizacion.objects.bulk_update(revisiones, ['delta'])
@@ -0,0 +1,244 @@
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import avance, catalogo, gantt, lineas, mediciones, pdf, reglas
+from .models import (
+    Obra,
+    Fase,
+    Tarea,
+    Material,
+    Corrida,
+    Cotizacion,
+    ReglaEquipoMaterial,
+    ReglaMaterialMaterial,
+    RequerimientoMaterial,
+    MedicionMaterial,
+    ResumenTarea,
+    ResumenFase,
+    ResumenObra,
+)
+
+
+def _borrado_en_cascada(origin, modelos=(Tarea, Fase, Obra)):
+    """
+    True si el borrado viene de alguno de `modelos` (instancia o QuerySet):
+    sus resúmenes se eliminan con ellos y no tiene sentido recalcularlos.
+    """
+    modelo = getattr(origin, 'model', None) or type(origin)
+    return modelo in modelos
+
+
+# --- Efectos diferidos (ver avance.efectos_diferidos) ---
+
+def _recalcular_tarea(tarea_id):
+    pendientes = avance.pendientes_diferidos()
+    if pendientes is None:
+        avance.recalcular_tareas([tarea_id])
+    else:
+        pendientes['tareas'].add(tarea_id)
+
+
+# --- Mediciones y requerimientos ---
+
+@receiver(post_save, sender=MedicionMaterial)
+@receiver(post_save, sender=RequerimientoMaterial)
+def actualizar_resumen_tarea(sender, instance, **kwargs):
+    _recalcular_tarea(instance.tarea_id)
+    anterior = getattr(instance, '_padre_anterior', None)
+    if anterior and anterior != instance.tarea_id:
+        _recalcular_tarea(anterior)
+
+
+@receiver(post_delete, sender=MedicionMaterial)
+@receiver(post_delete, sender=RequerimientoMaterial)
+def actualizar_resumen_tarea_borrado(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin):
+        return
+    _recalcular_tarea(instance.tarea_id)
+
+
+# --- Registro de eliminaciones para la sincronización por deltas ---
+
+@receiver(post_delete, sender=MedicionMaterial)
+@receiver(post_delete, sender=RequerimientoMaterial)
+def registrar_eliminacion(sender, instance, origin=None, **kwargs):
+    # Si se borra la obra completa no queda nadie a quien avisar
+    if _borrado_en_cascada(origin, (Obra,)):
+        return
+    eliminacion = (instance.tarea_id, 'medicion' if sender is MedicionMaterial else 'requerimiento', instance.pk)
+    pendientes = avance.pendientes_diferidos()
+    if pendientes is None:
+        avance.guardar_eliminaciones([eliminacion])
+    else:
+        pendientes['eliminaciones'].append(eliminacion)
+
+
+# Cada requerimiento se envía con los nombres de su tarea y fase y los datos
+# de su material: si cambian, se renuevan para que entren en el delta
+
+@receiver(post_save, sender=Tarea)
+def renovar_requerimientos_tarea(sender, instance, created, **kwargs):
+    if not created:
+        mediciones.renovar_requerimientos(RequerimientoMaterial.objects.filter(tarea=instance))
+
+
+@receiver(post_save, sender=Fase)
+def renovar_requerimientos_fase(sender, instance, created, **kwargs):
+    if not created:
+        mediciones.renovar_requerimientos(RequerimientoMaterial.objects.filter(tarea__fase=instance))
+
+
+@receiver(pre_save, sender=Material)
+def recordar_material_sincronizado(sender, instance, update_fields=None, **kwargs):
+    instance._sincronizado_anterior = None
+    if instance.pk and (update_fields is None or set(update_fields) & set(mediciones.CAMPOS_MATERIAL)):
+        instance._sincronizado_anterior = (
+            Material.objects.filter(pk=instance.pk).values_list(*mediciones.CAMPOS_MATERIAL).first()
+        )
+
+
+@receiver(post_save, sender=Material)
+def renovar_requerimientos_material(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_sincronizado_anterior', None)
+    if anterior and anterior != tuple(getattr(instance, campo) for campo in mediciones.CAMPOS_MATERIAL):
+        mediciones.renovar_requerimientos(RequerimientoMaterial.objects.filter(material=instance))
+
+
+# --- Índice de búsqueda de materiales ---
+
+@receiver(post_migrate)
+def instalar_indice_materiales(sender, using='default', **kwargs):
+    # Después de cada migrate: alterar app_material en SQLite borra los triggers
+    if sender.name == 'app':
+        catalogo.instalar_indice(using)
+
+
+# --- Costo unitario de materiales ---
+
+@receiver(post_save, sender=Material)
+def actualizar_resumen_material(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and 'costo_unitario' not in update_fields:
+        return
+    avance.recalcular_por_materiales([instance.pk])
+
+
+# --- PDF de cotizaciones en caché ---
+
+@receiver(pre_save, sender=Material)
+def recordar_material_impreso(sender, instance, update_fields=None, **kwargs):
+    # Lo que el PDF muestra del material, para saber si cambió al guardar
+    instance._impreso_anterior = None
+    if instance.pk and (update_fields is None or set(update_fields) & set(pdf.CAMPOS_IMPRESOS)):
+        instance._impreso_anterior = (
+            Material.objects.filter(pk=instance.pk).values_list(*pdf.CAMPOS_IMPRESOS).first()
+        )
+
+
+@receiver(post_save, sender=Material)
+def invalidar_pdf_material(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_impreso_anterior', None)
+    if anterior and anterior != tuple(getattr(instance, campo) for campo in pdf.CAMPOS_IMPRESOS):
+        pdf.invalidar_materiales([instance.pk])
+
+
+@receiver(pre_delete, sender=Material)
+def invalidar_pdf_material_eliminado(sender, instance, **kwargs):
+    # Antes del borrado: después ya no quedan las líneas que lo usan
+    pdf.invalidar_materiales([instance.pk])
+
+
+@receiver(post_delete, sender=Cotizacion)
+def invalidar_pdf_cotizacion(sender, instance, **kwargs):
+    pdf.invalidar([instance.pk])
+
+
+# --- Diagramas de Gantt en caché ---
+
+@receiver(post_delete, sender=Obra)
+def invalidar_gantt_obra(sender, instance, **kwargs):
+    # Los demás cambios renuevan el sello de versión de la obra (ver app.gantt)
+    gantt.invalidar([instance.pk])
+
+
+# --- Reglas de materiales ---
+
+@receiver(post_save, sender=ReglaEquipoMaterial)
+@receiver(post_save, sender=ReglaMaterialMaterial)
+@receiver(post_delete, sender=ReglaEquipoMaterial)
+@receiver(post_delete, sender=ReglaMaterialMaterial)
+def invalidar_grafo_reglas(sender, **kwargs):
+    reglas.invalidar()
+
+
+# --- Líneas de corridas y cotizaciones ---
+
+@receiver(post_save, sender=Corrida)
+@receiver(post_save, sender=Cotizacion)
+def sincronizar_lineas(sender, instance, update_fields=None, **kwargs):
+    # Guardados que no tocan el JSON no cambian las líneas
+    if update_fields is not None and 'datos' not in update_fields:
+        return
+    if sender is Corrida:
+        lineas.sincronizar_corrida(instance)
+    else:
+        lineas.sincronizar_cotizacion(instance)
+
+
+# --- Estructura Obra / Fase / Tarea ---
+
+@receiver(pre_save, sender=MedicionMaterial)
+@receiver(pre_save, sender=RequerimientoMaterial)
+@receiver(pre_save, sender=Tarea)
+@receiver(pre_save, sender=Fase)
+def recordar_padre_anterior(sender, instance, **kwargs):
+    # Si la fila cambia de padre hay que recalcular también el anterior
+    campo = {Tarea: 'fase_id', Fase: 'obra_id'}.get(sender, 'tarea_id')
+    anterior = None
+    if instance.pk:
+        anterior = sender.objects.filter(pk=instance.pk).values_list(campo, flat=True).first()
+    instance._padre_anterior = anterior
+
+
+@receiver(post_save, sender=Obra)
+def crear_resumen_obra(sender, instance, created, **kwargs):
+    if created:
+        ResumenObra.objects.create(obra=instance)
+
+
+@receiver(post_save, sender=Fase)
+def actualizar_resumen_fase(sender, instance, created, **kwargs):
+    if created:
+        ResumenFase.objects.create(fase=instance)
+    # costo_mano_de_obra forma parte del costo ejecutado de la fase
+    avance.recalcular_fases([instance.pk])
+    anterior = getattr(instance, '_padre_anterior', None)
+    if anterior and anterior != instance.obra_id:
+        avance.recalcular_obras([anterior])
+
+
+@receiver(post_save, sender=Tarea)
+def actualizar_resumen_tarea_estructura(sender, instance, created, **kwargs):
+    if created:
+        ResumenTarea.objects.create(tarea=instance)
+        avance.recalcular_fases([instance.fase_id])
+        return
+    # También al renombrar: el recálculo renueva el sello de versión de la
+    # fase, que invalida su fragmento en caché del detalle de la obra
+    anterior = getattr(instance, '_padre_anterior', None)
+    avance.recalcular_fases([anterior, instance.fase_id])
+
+
+@receiver(post_delete, sender=Tarea)
+def actualizar_resumen_tarea_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Fase, Obra)):
+        return
+    avance.recalcular_fases([instance.fase_id])
+
+
+@receiver(post_delete, sender=Fase)
+def actualizar_resumen_fase_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Obra,)):
+        return
+    avance.recalcular_obras([instance.obra_id])
@@ -0,0 +1,76 @@
+/*
+ * Buscador de materiales para los formularios de tarea y cotización.
+ * Consulta el endpoint de autocompletado (api/materiales/buscar/) y llama a
+ * opciones.agregar(material) cuando el usuario elige un resultado.
+ */
+function iniciarBuscadorMateriales(opciones) {
+    var $texto = $(opciones.texto);
+    var $sistema = $(opciones.sistema);
+    var $familia = $(opciones.familia);
+    var $resultados = $(opciones.resultados);
+    var $masResultados = $(opciones.masResultados);
+    var pagina = 1;
+    var temporizador = null;
+    var peticion = null;
+
+    function mostrar(datos, agregarAlFinal) {
+        if (!agregarAlFinal) {
+            $resultados.empty();
+        }
+        $.each(datos.resultados, function(_, material) {
+            var yaAgregado = opciones.estaAgregado(material);
+            var $item = $('<li class="resultado-material"></li>')
+                .text(material.codigo + ' · ' + material.nombre + ' (' + material.unidad + ')')
+                .toggleClass('agregado', yaAgregado)
+                .data('material', material);
+            $resultados.append($item);
+        });
+        if (!agregarAlFinal && datos.resultados.length === 0) {
+            $resultados.append($('<li class="sin-resultados"></li>').text('Sin resultados'));
+        }
+        $masResultados.toggle(datos.hay_siguiente);
+    }
+
+    function buscar(agregarAlFinal) {
+        var texto = $.trim($texto.val());
+        // Con una familia elegida se puede listar sin escribir nada
+        if (!texto && !$familia.val()) {
+            $resultados.empty();
+            $masResultados.hide();
+            return;
+        }
+        if (peticion) {
+            peticion.abort();
+        }
+        peticion = $.getJSON(opciones.url, {
+            q: texto,
+            sistema: $sistema.val() || '',
+            familia: $familia.val() || '',
+            page: pagina
+        }).done(function(datos) {
+            mostrar(datos, agregarAlFinal);
+        });
+    }
+
+    $texto.add($sistema).add($familia).on('input change', function() {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(function() {
+            pagina = 1;
+            buscar(false);
+        }, 250);
+    });
+
+    $masResultados.hide().on('click', function(e) {
+        e.preventDefault();
+        pagina += 1;
+        buscar(true);
+    });
+
+    $resultados.on('click', 'li.resultado-material', function() {
+        var $item = $(this);
+        if (!$item.hasClass('agregado')) {
+            opciones.agregar($item.data('material'));
+            $item.addClass('agregado');
+        }
+    });
+}
@@ -0,0 +1,94 @@
+/*
+ * Vista previa en vivo del asistente de corridas (pasos 2 y 3). Envía las
+ * cantidades del paso actual, junto con las ya cargadas en el otro paso, al
+ * endpoint de vista previa y muestra el total, los subtotales por familia y
+ * los materiales expandidos.
+ */
+(function() {
+    var config = JSON.parse(document.getElementById('vista-previa-config').textContent);
+    var form = document.getElementById('wizardForm');
+    var panel = document.getElementById('vistaPrevia');
+    var prefijo = config.paso + '-';
+    var temporizador = null;
+    var controlador = null;
+
+    var formato = new Intl.NumberFormat('es-VE', {minimumFractionDigits: 2, maximumFractionDigits: 2});
+
+    function entradas() {
+        var datos = {equipos: {}, tuberias: {}};
+        Object.keys(config.otras_entradas).forEach(function(grupo) {
+            datos[grupo] = Object.assign({}, config.otras_entradas[grupo]);
+        });
+        form.querySelectorAll('input[type="number"][name^="' + prefijo + '"]').forEach(function(input) {
+            var cantidad = parseInt(input.value, 10);
+            if (cantidad > 0) {
+                datos[config.grupo][input.name.slice(prefijo.length)] = cantidad;
+            }
+        });
+        return datos;
+    }
+
+    function celda(fila, texto, clase) {
+        var td = document.createElement('td');
+        td.textContent = texto;
+        if (clase) {
+            td.className = clase;
+        }
+        fila.appendChild(td);
+    }
+
+    function mostrar(datos) {
+        panel.querySelector('.vista-previa-total').textContent = formato.format(datos.total);
+
+        var familias = panel.querySelector('.vista-previa-familias');
+        familias.innerHTML = '';
+        datos.familias.forEach(function(item) {
+            var fila = document.createElement('tr');
+            celda(fila, item.familia);
+            celda(fila, formato.format(item.subtotal), 'numero');
+            familias.appendChild(fila);
+        });
+
+        var materiales = panel.querySelector('.vista-previa-materiales');
+        materiales.innerHTML = '';
+        datos.materiales.forEach(function(item) {
+            var fila = document.createElement('tr');
+            celda(fila, item.codigo);
+            celda(fila, item.nombre);
+            celda(fila, formato.format(item.cantidad) + ' ' + item.unidad, 'numero');
+            celda(fila, formato.format(item.subtotal), 'numero');
+            materiales.appendChild(fila);
+        });
+        panel.querySelector('.vista-previa-num-materiales').textContent = datos.materiales.length;
+    }
+
+    function actualizar() {
+        if (controlador) {
+            controlador.abort();
+        }
+        controlador = new AbortController();
+        fetch(config.url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': form.querySelector('input[name="csrfmiddlewaretoken"]').value
+            },
+            body: JSON.stringify(entradas()),
+            signal: controlador.signal
+        }).then(function(respuesta) {
+            return respuesta.ok ? respuesta.json() : null;
+        }).then(function(datos) {
+            if (datos) {
+                mostrar(datos);
+            }
+        }).catch(function() {});
+    }
+
+    form.addEventListener('input', function(e) {
+        if (e.target.name && e.target.name.indexOf(prefijo) === 0) {
+            clearTimeout(temporizador);
+            temporizador = setTimeout(actualizar, 300);
+        }
+    });
+    actualizar();
+})();
@@ -1,5 +1,7 @@
 from django import template
 
+from app import revisiones
+
 register = template.Library()
 
 @register.filter
@@ -9,3 +11,12 @@ def get(dictionary, key):
     Ejemplo de uso en plantilla: `{{ diccionario|get:clave }}`
     """
     return dictionary.get(key)
+
+@register.filter
+def campo_cotizacion(cotizacion, clave):
+    """
+    Campo general de una cotización o revisión sin materializar sus líneas
+    (ver app.revisiones.campo).
+    Ejemplo de uso en plantilla: `{{ cotizacion|campo_cotizacion:'descripcion' }}`
+    """
+    return revisiones.campo(cotizacion, clave)
@@ -1,3 +1,1332 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models.functions import Coalesce
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analitica, avance, catalogo, gantt, lineas, mediciones, pdf, precios, reglas, revisiones
+from .cotizaciones import ErrorVistaPrevia, calcular_datos_cotizacion, generar_cotizacion, vista_previa
+from .models import (
+    ClaveIdempotencia, Corrida, Cotizacion, EliminacionSincronizada, Equipo, Fase, Material, MedicionMaterial, Obra, ReglaEquipoMaterial,
+    ReglaMaterialMaterial, RequerimientoMaterial, ResumenFase, ResumenObra, ResumenTarea, Tarea,
+)
+from .requerimientos import ErrorRequerimientos, guardar_requerimientos, leer_cantidades
+
+
+def D(valor):
+    return Decimal(str(valor))
+
+
+def crear_obra(nombre='Obra'):
+    return Obra.objects.create(
+        nombre=nombre, direccion='x', fecha_inicio=date(2025, 1, 1), fecha_fin_estimada=date(2025, 3, 1),
+        presupuesto_inicial=1000,
+    )
+
+
+def crear_tarea(fase, nombre='Tarea'):
+    return Tarea.objects.create(
+        nombre=nombre, fase=fase, fecha_inicio=date(2025, 1, 1), fecha_fin_estimada=date(2025, 2, 1),
+    )
+
+
+class ResumenAvanceTests(TestCase):
+    """Los resúmenes que mantienen las señales coinciden con reconstruirlos desde cero."""
+
+    def setUp(self):
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=D('2.00'))
+        self.codo = Material.objects.create(codigo='COD', nombre='Codo', familia='F', unidad='u', costo_unitario=D('5.00'))
+        self.obra = crear_obra()
+        self.fase_1 = Fase.objects.create(nombre='F1', obra=self.obra, presupuesto_asignado=500, costo_mano_de_obra=D('100'))
+        self.fase_2 = Fase.objects.create(nombre='F2', obra=self.obra, presupuesto_asignado=500)
+        self.tarea_1 = crear_tarea(self.fase_1, 'T1')
+        self.tarea_2 = crear_tarea(self.fase_1, 'T2')
+        self.tarea_3 = crear_tarea(self.fase_2, 'T3')
+        RequerimientoMaterial.objects.create(tarea=self.tarea_1, material=self.tubo, cantidad_requerida=10)
+        RequerimientoMaterial.objects.create(tarea=self.tarea_2, material=self.codo, cantidad_requerida=4)
+        RequerimientoMaterial.objects.create(tarea=self.tarea_3, material=self.tubo, cantidad_requerida=20)
+        MedicionMaterial.objects.create(tarea=self.tarea_1, material=self.tubo, cantidad=5, fecha_medicion=date(2025, 1, 2))
+        MedicionMaterial.objects.create(tarea=self.tarea_1, material=self.tubo, cantidad=3, fecha_medicion=date(2025, 1, 3))
+        self.medicion = MedicionMaterial.objects.create(
+            tarea=self.tarea_2, material=self.codo, cantidad=1, fecha_medicion=date(2025, 1, 2)
+        )
+
+    def resumenes(self):
+        return (
+            sorted(ResumenTarea.objects.values_list('tarea_id', 'num_requerimientos', 'cantidad_requerida',
+                                                    'cantidad_instalada', 'costo_ejecutado', 'porcentaje_avance')),
+            sorted(ResumenFase.objects.values_list('fase_id', 'num_tareas', 'num_tareas_con_requerimientos',
+                                                   'costo_ejecutado', 'porcentaje_avance')),
+            sorted(ResumenObra.objects.values_list('obra_id', 'num_fases_con_tareas', 'costo_ejecutado',
+                                                   'porcentaje_avance')),
+        )
+
+    def assertIgualAReconstruir(self):
+        incrementales = self.resumenes()
+        ResumenTarea.objects.all().delete()
+        ResumenFase.objects.all().delete()
+        ResumenObra.objects.all().delete()
+        avance.reconstruir()
+        self.assertEqual(incrementales, self.resumenes())
+
+    def test_valores(self):
+        tarea_1 = ResumenTarea.objects.get(tarea=self.tarea_1)
+        self.assertEqual(tarea_1.porcentaje_avance, D('80'))
+        self.assertEqual(tarea_1.costo_ejecutado, D('16'))
+        fase_1 = ResumenFase.objects.get(fase=self.fase_1)
+        self.assertEqual(fase_1.porcentaje_avance, D('52.5'))        # (80 + 25) / 2
+        self.assertEqual(fase_1.costo_ejecutado, D('121'))           # 16 + 5 + mano de obra
+        obra = ResumenObra.objects.get(obra=self.obra)
+        self.assertEqual(obra.porcentaje_avance, D('26.25'))         # (52.5 + 0) / 2
+        self.assertEqual(obra.costo_ejecutado, D('121'))
+        self.assertIgualAReconstruir()
+
+    def test_cambiar_costo_del_material(self):
+        self.tubo.costo_unitario = D('3.00')
+        self.tubo.save()
+        self.assertEqual(ResumenObra.objects.get(obra=self.obra).costo_ejecutado, D('129'))
+        self.assertIgualAReconstruir()
+
+    def test_borrar_medicion_y_tarea(self):
+        self.medicion.delete()
+        self.assertEqual(ResumenFase.objects.get(fase=self.fase_1).porcentaje_avance, D('40'))
+        self.tarea_1.delete()
+        fase_1 = ResumenFase.objects.get(fase=self.fase_1)
+        self.assertEqual((fase_1.num_tareas, fase_1.costo_ejecutado, fase_1.porcentaje_avance), (1, D('100'), D('0')))
+        self.assertIgualAReconstruir()
+
+    def test_mano_de_obra_de_la_fase(self):
+        self.fase_2.costo_mano_de_obra = D('50')
+        self.fase_2.save()
+        self.assertEqual(ResumenObra.objects.get(obra=self.obra).costo_ejecutado, D('171'))
+        self.assertIgualAReconstruir()
+
+    def test_mover_requerimiento_de_tarea(self):
+        requerimiento = RequerimientoMaterial.objects.get(tarea=self.tarea_3)
+        requerimiento.tarea = self.tarea_2
+        requerimiento.save()
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea_3).num_requerimientos, 0)
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea_2).num_requerimientos, 2)
+        self.assertIgualAReconstruir()
+
+
+class VentanaMedicionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        material = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=1)
+        cls.obra = crear_obra()
+        tarea = crear_tarea(Fase.objects.create(nombre='F1', obra=cls.obra, presupuesto_asignado=100))
+        RequerimientoMaterial.objects.create(tarea=tarea, material=material, cantidad_requerida=1000)
+        cls.fechas = [date(2025, 1, 1) + timedelta(days=i) for i in range(60)]
+        MedicionMaterial.objects.bulk_create([
+            MedicionMaterial(tarea=tarea, material=material, cantidad=1, fecha_medicion=fecha) for fecha in cls.fechas
+        ])
+
+    def ventana(self, **params):
+        contexto = self.client.get(reverse('obra-mediciones', args=[self.obra.pk]), params).context
+        return contexto['fechas_medicion'], contexto['fecha_corte'], contexto['tabla_mediciones'][0]['antes']
+
+    def test_por_defecto(self):
+        fechas, corte, antes = self.ventana()
+        self.assertEqual(fechas, [f.isoformat() for f in self.fechas[-10:]])
+        self.assertEqual((corte, antes), (self.fechas[-10], 50))
+
+    def test_ultimas_se_acota(self):
+        fechas, corte, antes = self.ventana(ultimas=100000)
+        self.assertEqual(len(fechas), 31)
+        self.assertEqual(fechas[-1], self.fechas[-1].isoformat())
+        self.assertEqual(antes, 29)
+        self.assertEqual(len(self.ventana(ultimas=0)[0]), 1)
+
+    def test_solo_hasta_muestra_las_ultimas_hasta_esa_fecha(self):
+        fechas, corte, antes = self.ventana(hasta=self.fechas[44].isoformat())
+        self.assertEqual(fechas, [f.isoformat() for f in self.fechas[14:45]])
+        self.assertEqual((corte, antes), (self.fechas[14], 14))
+
+    def test_desde_muy_atras_se_acota(self):
+        fechas, corte, antes = self.ventana(desde='2000-01-01')
+        self.assertEqual(fechas, [f.isoformat() for f in self.fechas[:31]])
+        self.assertEqual((corte, antes), (date(2000, 1, 1), 0))
+
+    def test_rango(self):
+        fechas, corte, antes = self.ventana(desde=self.fechas[5].isoformat(), hasta=self.fechas[9].isoformat())
+        self.assertEqual(fechas, [f.isoformat() for f in self.fechas[5:10]])
+        self.assertEqual(antes, 5)
+
+
+class FormularioMedicionesTests(TestCase):
+
+    def setUp(self):
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=2)
+        self.codo = Material.objects.create(codigo='COD', nombre='Codo', familia='F', unidad='u', costo_unitario=5)
+        self.obra = crear_obra()
+        self.tarea = crear_tarea(Fase.objects.create(nombre='F1', obra=self.obra, presupuesto_asignado=100))
+        for material in (self.tubo, self.codo):
+            RequerimientoMaterial.objects.create(tarea=self.tarea, material=material, cantidad_requerida=10)
+        self.dia = date(2025, 1, 2)
+        for material in (self.tubo, self.codo):
+            MedicionMaterial.objects.create(tarea=self.tarea, material=material, cantidad=4, fecha_medicion=self.dia)
+        self.url = reverse('obra-mediciones', args=[self.obra.pk])
+
+    def campo(self, material, prefijo='medicion'):
+        return f'{prefijo}-{self.tarea.pk}-{material.pk}'
+
+    def enviar(self, campos, query=''):
+        return self.client.post(self.url + query, {'fecha_medicion': self.dia.isoformat(), **campos})
+
+    def cantidades(self):
+        return dict(MedicionMaterial.objects.values_list('material__codigo', 'cantidad'))
+
+    def test_campos_vacios_no_tocan_las_demas(self):
+        self.enviar({self.campo(self.tubo): '6', self.campo(self.codo): ''})
+        self.assertEqual(self.cantidades(), {'TUB-1': D(6), 'COD': D(4)})
+        self.assertEqual(MedicionMaterial.objects.count(), 2)
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea).cantidad_instalada, D(10))
+
+    def test_cero_se_guarda_como_medicion(self):
+        self.enviar({self.campo(self.tubo): '0'})
+        self.assertEqual(self.cantidades(), {'TUB-1': D(0), 'COD': D(4)})
+        self.assertFalse(EliminacionSincronizada.objects.exists())
+
+    def test_borrar_elimina_solo_esa_medicion(self):
+        medicion = MedicionMaterial.objects.get(material=self.tubo)
+        self.enviar({self.campo(self.tubo, 'borrar'): 'on', self.campo(self.codo): ''})
+        self.assertEqual(self.cantidades(), {'COD': D(4)})
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea).cantidad_instalada, D(4))
+        self.assertEqual(
+            list(EliminacionSincronizada.objects.values_list('modelo', 'objeto_id')), [('medicion', medicion.pk)]
+        )
+
+    def test_errores_no_escriben_nada(self):
+        for campos in (
+            {self.campo(self.tubo): '7', self.campo(self.codo): 'abc'},
+            {self.campo(self.tubo): '7', self.campo(self.codo): 'inf'},
+            {self.campo(self.tubo): '7', self.campo(self.tubo, 'borrar'): 'on'},
+            {self.campo(self.tubo): '7', f'medicion-{self.tarea.pk}-999': '1'},
+        ):
+            with self.subTest(campos=campos):
+                with self.assertLogs('app.views', 'WARNING'):
+                    self.enviar(campos)
+                self.assertEqual(self.cantidades(), {'TUB-1': D(4), 'COD': D(4)})
+
+    def test_vuelve_a_la_misma_ventana(self):
+        query = '?desde=2025-01-01&hasta=2025-01-31&page=2'
+        respuesta = self.enviar({self.campo(self.tubo): '5'}, query)
+        self.assertRedirects(respuesta, self.url + query, fetch_redirect_response=False)
+        with self.assertLogs('app.views', 'WARNING'):
+            respuesta = self.enviar({self.campo(self.tubo): 'x'}, query)
+        self.assertRedirects(respuesta, self.url + query, fetch_redirect_response=False)
+
+    def test_formulario_sin_valores_precargados(self):
+        respuesta = self.client.get(self.url, {'ultimas': 5})
+        self.assertNotContains(respuesta, 'value="0"')
+        self.assertContains(respuesta, f'action="{self.url}?ultimas=5"')
+
+
+class CacheGanttTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        self.enterContext(override_settings(GANTT_CACHE_DIR=directorio.name))
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=2)
+        self.obra = crear_obra()
+        self.fase = Fase.objects.create(nombre='Instalación', obra=self.obra, presupuesto_asignado=100)
+        self.tarea = crear_tarea(self.fase, 'Tendido')
+        RequerimientoMaterial.objects.create(tarea=self.tarea, material=self.tubo, cantidad_requerida=10)
+        self.url = reverse('gantt_svg', args=[self.obra.pk])
+
+    def svg(self, **cabeceras):
+        respuesta = self.client.get(self.url, **cabeceras)
+        if respuesta.status_code != 200:
+            return respuesta, None
+        return respuesta, b''.join(respuesta.streaming_content).decode()
+
+    def archivos(self):
+        return sorted(ruta.suffix for ruta in self.directorio.glob(f'obra-{self.obra.pk}-*'))
+
+    def test_se_maqueta_una_vez_por_version(self):
+        with mock.patch.object(gantt, 'filas', wraps=gantt.filas) as filas:
+            respuesta, svg = self.svg()
+            self.assertIn('Tendido', svg)
+            self.assertEqual(self.svg(HTTP_IF_NONE_MATCH=respuesta['ETag'])[0].status_code, 304)
+            self.assertEqual(self.svg()[1], svg)
+            self.assertEqual(filas.call_count, 1)
+            self.assertEqual(
+                gantt.diagrama(self.obra.pk).filas, gantt.Diagrama.desde_filas(gantt.filas(self.obra.pk)).filas
+            )
+        self.assertEqual(self.archivos(), ['.json', '.svg'])
+
+    def assertRenovado(self, anterior, esperado):
+        _, svg = self.svg()
+        self.assertNotEqual(svg, anterior)
+        self.assertIn(esperado, svg)
+        # Solo queda el diagrama vigente
+        self.assertEqual(self.archivos(), ['.json', '.svg'])
+        return svg
+
+    def test_cambios_que_renuevan_el_diagrama(self):
+        _, svg = self.svg()
+        self.tarea.nombre = 'Tendido de tubería'
+        self.tarea.save()
+        svg = self.assertRenovado(svg, 'Tendido de tubería')
+
+        self.fase.nombre = 'Montaje'
+        self.fase.save()
+        svg = self.assertRenovado(svg, 'Montaje')
+
+        MedicionMaterial.objects.create(tarea=self.tarea, material=self.tubo, cantidad=5, fecha_medicion=date(2025, 1, 2))
+        svg = self.assertRenovado(svg, '50%')
+
+        pruebas = Fase.objects.create(nombre='Pruebas', obra=self.obra, presupuesto_asignado=1)
+        crear_tarea(pruebas, 'Arranque')
+        svg = self.assertRenovado(svg, 'Arranque')
+
+        pruebas.delete()
+        self.assertNotIn('Arranque', self.assertRenovado(svg, 'Montaje'))
+
+    def test_borrar_la_obra(self):
+        self.svg()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.obra.delete()
+        self.assertEqual(self.archivos(), [])
+
+
+class SincronizacionMedicionesTests(TestCase):
+
+    def setUp(self):
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=2)
+        self.codo = Material.objects.create(codigo='COD', nombre='Codo', familia='F', unidad='u', costo_unitario=5)
+        self.obra = crear_obra()
+        self.fase = Fase.objects.create(nombre='F1', obra=self.obra, presupuesto_asignado=100)
+        self.tarea = crear_tarea(self.fase)
+        self.req_tubo = RequerimientoMaterial.objects.create(tarea=self.tarea, material=self.tubo, cantidad_requerida=10)
+        self.req_codo = RequerimientoMaterial.objects.create(tarea=self.tarea, material=self.codo, cantidad_requerida=4)
+
+    def item(self, clave, cantidad, material=None, fecha='2025-01-02'):
+        material = material or self.tubo
+        return {'clave': clave, 'tarea': self.tarea.pk, 'material': material.pk,
+                'cantidad': cantidad, 'fecha_medicion': fecha}
+
+    def envejecer(self):
+        # Todo lo existente pasa a ser anterior al token (fuera del solape)
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        RequerimientoMaterial.objects.update(fecha_modificacion=hace_una_hora)
+        MedicionMaterial.objects.update(fecha_modificacion=hace_una_hora)
+        EliminacionSincronizada.objects.update(fecha=hace_una_hora)
+        return mediciones.cambios_desde(self.obra)['token']
+
+    def test_envio_idempotente(self):
+        primero = mediciones.aplicar_envio(self.obra, [self.item('a', 3), self.item('a', 9), self.item('b', 1, self.codo)])
+        self.assertEqual([r['estado'] for r in primero], ['aplicada', 'duplicada', 'aplicada'])
+        self.assertEqual(primero[0]['id'], primero[1]['id'])
+
+        reenvio = mediciones.aplicar_envio(self.obra, [self.item('a', 7), self.item('c', 5)])
+        self.assertEqual([r['estado'] for r in reenvio], ['duplicada', 'aplicada'])
+        self.assertEqual(reenvio[0]['id'], primero[0]['id'])
+        # 'c' es otra clave para el mismo día: reemplaza la cantidad, no duplica
+        self.assertEqual(
+            list(MedicionMaterial.objects.filter(material=self.tubo).values_list('cantidad', flat=True)), [D(5)]
+        )
+        self.assertEqual(ClaveIdempotencia.objects.count(), 3)
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea).cantidad_instalada, D(6))
+
+    def test_errores_por_item(self):
+        resultados = mediciones.aplicar_envio(self.obra, [
+            'x', self.item('', 1), self.item('d', -1), self.item('e', 'nan'), self.item('f', 1, fecha='ayer'),
+            {**self.item('g', 1), 'material': 999}, self.item('h', 0),
+        ])
+        self.assertEqual([r['estado'] for r in resultados], ['error'] * 6 + ['aplicada'])
+        self.assertEqual(list(MedicionMaterial.objects.values_list('cantidad', flat=True)), [D(0)])
+
+    def test_reintento_tras_conflicto_de_claves(self):
+        original = mediciones._aplicar_envio
+        llamadas = []
+
+        def conflicto_la_primera_vez(obra, items):
+            llamadas.append(1)
+            if len(llamadas) == 1:
+                raise IntegrityError
+            return original(obra, items)
+
+        with mock.patch.object(mediciones, '_aplicar_envio', side_effect=conflicto_la_primera_vez):
+            resultados = mediciones.aplicar_envio(self.obra, [self.item('a', 3)])
+        self.assertEqual((len(llamadas), resultados[0]['estado']), (2, 'aplicada'))
+
+        with mock.patch.object(mediciones, '_aplicar_envio', side_effect=IntegrityError):
+            with self.assertRaises(mediciones.ErrorSincronizacion):
+                mediciones.aplicar_envio(self.obra, [self.item('b', 3)])
+
+    def test_delta_desde_token(self):
+        mediciones.aplicar_envio(self.obra, [self.item('a', 3), self.item('b', 1, self.codo)])
+        completo = mediciones.cambios_desde(self.obra)
+        self.assertTrue(completo['completo'])
+        self.assertEqual((len(completo['requerimientos']), len(completo['mediciones'])), (2, 2))
+
+        token = self.envejecer()
+        borrada = MedicionMaterial.objects.get(material=self.codo).pk
+        MedicionMaterial.objects.get(pk=borrada).delete()
+        mediciones.aplicar_envio(self.obra, [self.item('c', 4)])
+        delta = mediciones.cambios_desde(self.obra, token)
+        self.assertFalse(delta['completo'])
+        self.assertEqual(delta['requerimientos'], [])
+        self.assertEqual([(m['material'], m['cantidad']) for m in delta['mediciones']], [(self.tubo.pk, '4.00')])
+        self.assertEqual(delta['eliminados'], {'requerimientos': [], 'mediciones': [borrada]})
+
+    def test_token_mas_viejo_que_la_retencion(self):
+        viejo = (timezone.now() - mediciones.RETENCION - timedelta(days=1)).isoformat()
+        self.assertTrue(mediciones.cambios_desde(self.obra, viejo)['completo'])
+        with self.assertRaises(mediciones.ErrorSincronizacion):
+            mediciones.cambios_desde(self.obra, 'ayer')
+
+    def test_renombrar_reenvia_requerimientos(self):
+        token = self.envejecer()
+        self.tubo.costo_unitario = 3
+        self.tubo.save()
+        self.assertEqual(mediciones.cambios_desde(self.obra, token)['requerimientos'], [])
+
+        self.tubo.nombre = 'Tubo de cobre'
+        self.tubo.save()
+        delta = mediciones.cambios_desde(self.obra, token)
+        self.assertEqual([r['material_nombre'] for r in delta['requerimientos']], ['Tubo de cobre'])
+
+        for padre, campo in ((self.tarea, 'tarea_nombre'), (self.fase, 'fase_nombre')):
+            with self.subTest(campo=campo):
+                token = self.envejecer()
+                padre.nombre = 'Nuevo nombre'
+                padre.save()
+                delta = mediciones.cambios_desde(self.obra, token)
+                self.assertEqual([r[campo] for r in delta['requerimientos']], ['Nuevo nombre'] * 2)
+
+    def test_depurar(self):
+        mediciones.aplicar_envio(self.obra, [self.item('a', 3)])
+        MedicionMaterial.objects.get().delete()
+        ahora = timezone.now()
+        self.assertEqual(mediciones.depurar(ahora), (0, 0))
+        self.assertEqual(mediciones.depurar(ahora + mediciones.RETENCION + timedelta(seconds=1)), (1, 1))
+
+
+class RequerimientosTareaTests(TestCase):
+
+    def setUp(self):
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=2)
+        self.codo = Material.objects.create(codigo='COD', nombre='Codo', familia='F', unidad='u', costo_unitario=5)
+        self.cinta = Material.objects.create(codigo='CIN', nombre='Cinta', familia='F', unidad='u', costo_unitario=1)
+        self.tarea = crear_tarea(Fase.objects.create(nombre='F1', obra=crear_obra(), presupuesto_asignado=100))
+
+    def requerimientos(self):
+        return dict(self.tarea.requerimientomaterial_set.values_list('material__codigo', 'cantidad_requerida'))
+
+    def test_leer_cantidades(self):
+        datos = {
+            f'material-quantity-{self.tubo.pk}': ' 2.346 ', f'material-quantity-{self.codo.pk}': '0',
+            f'material-quantity-{self.cinta.pk}': '', 'nombre': 'x',
+        }
+        self.assertEqual(leer_cantidades(datos), {self.tubo.pk: D('2.35')})
+
+        with self.assertRaises(ErrorRequerimientos) as error:
+            leer_cantidades({
+                'material-quantity-abc': '1', f'material-quantity-{self.tubo.pk}': '-1',
+                f'material-quantity-{self.codo.pk}': '1e9', 'material-quantity-999': '1',
+            })
+        self.assertEqual(len(error.exception.errores), 4)
+
+    def test_diff_conserva_los_que_no_cambian(self):
+        self.assertEqual(guardar_requerimientos(self.tarea, {self.tubo.pk: D(10), self.codo.pk: D(4)}), (2, 0, 0))
+        sin_cambio = RequerimientoMaterial.objects.get(material=self.tubo)
+        self.assertEqual(guardar_requerimientos(self.tarea, {self.tubo.pk: D(10), self.codo.pk: D(4)}), (0, 0, 0))
+
+        resultado = guardar_requerimientos(self.tarea, {self.tubo.pk: D(10), self.cinta.pk: D(3)})
+        self.assertEqual(resultado, (1, 0, 1))
+        conservado = RequerimientoMaterial.objects.get(material=self.tubo)
+        self.assertEqual(
+            (conservado.pk, conservado.fecha_modificacion), (sin_cambio.pk, sin_cambio.fecha_modificacion)
+        )
+        self.assertEqual(self.requerimientos(), {'TUB-1': D(10), 'CIN': D(3)})
+        self.assertEqual(list(EliminacionSincronizada.objects.values_list('modelo', flat=True)), ['requerimiento'])
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea).cantidad_requerida, D(13))
+
+    def test_actualiza_y_deduplica(self):
+        RequerimientoMaterial.objects.create(tarea=self.tarea, material=self.tubo, cantidad_requerida=1)
+        RequerimientoMaterial.objects.create(tarea=self.tarea, material=self.tubo, cantidad_requerida=2)
+        self.assertEqual(guardar_requerimientos(self.tarea, {self.tubo.pk: D(5)}), (0, 1, 1))
+        self.assertEqual(self.requerimientos(), {'TUB-1': D(5)})
+        self.assertEqual(ResumenTarea.objects.get(tarea=self.tarea).cantidad_requerida, D(5))
+
+    def test_vista_no_guarda_la_tarea_con_cantidades_invalidas(self):
+        guardar_requerimientos(self.tarea, {self.tubo.pk: D(10)})
+        url = reverse('tarea-update', args=[self.tarea.pk])
+        datos = {'nombre': 'Renombrada', 'fecha_inicio': '2025-01-01', 'fecha_fin_estimada': '2025-02-01'}
+
+        respuesta = self.client.post(url, {**datos, f'material-quantity-{self.tubo.pk}': 'abc'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.tarea.refresh_from_db()
+        self.assertEqual(self.tarea.nombre, 'Tarea')
+
+        self.client.post(url, {**datos, f'material-quantity-{self.codo.pk}': '2'})
+        self.tarea.refresh_from_db()
+        self.assertEqual(self.tarea.nombre, 'Renombrada')
+        self.assertEqual(self.requerimientos(), {'COD': D(2)})
+
+
+class BuscarMaterialesTests(TestCase):
+
+    def setUp(self):
+        for codigo, nombre, familia, sistema in (
+            ('TUB-1', 'Tubería de cobre 1/2', 'Tuberías', 'VRF'),
+            ('TUB-2', 'Tubería de cobre 3/4', 'Tuberías', 'CHW'),
+            ('COD-90', 'Codo de 90°', 'Accesorios', 'VRF'),
+            ('AIS', 'Aislamiento térmico', 'Aislantes', 'VRF'),
+        ):
+            Material.objects.create(
+                codigo=codigo, nombre=nombre, familia=familia, sistema=sistema, unidad='u', costo_unitario=1
+            )
+
+    def codigos(self, texto='', **filtros):
+        return list(catalogo.buscar_materiales(texto, **filtros).values_list('codigo', flat=True))
+
+    def test_prefijos_sin_acentos_ni_mayusculas(self):
+        self.assertEqual(self.codigos('TUBERIA'), ['TUB-1', 'TUB-2'])
+        self.assertEqual(self.codigos('tub 1'), ['TUB-1'])
+        self.assertEqual(self.codigos('term ais'), ['AIS'])
+        self.assertEqual(self.codigos('cod-9'), ['COD-90'])
+        self.assertEqual(self.codigos('obre'), [])
+        self.assertEqual(self.codigos('"*'), ['AIS', 'COD-90', 'TUB-1', 'TUB-2'])
+
+    def test_filtros(self):
+        self.assertEqual(self.codigos('tuberia', sistema='CHW'), ['TUB-2'])
+        self.assertEqual(self.codigos(familia='Accesorios'), ['COD-90'])
+        self.assertEqual(catalogo.familias(), ['Accesorios', 'Aislantes', 'Tuberías'])
+
+        respuesta = self.client.get(reverse('material-buscar'), {'q': 'de', 'familia': 'Tuberías'})
+        datos = respuesta.json()
+        self.assertEqual(([m['codigo'] for m in datos['resultados']], datos['total']), (['TUB-1', 'TUB-2'], 2))
+
+    def test_formulario_de_tarea_ofrece_las_familias(self):
+        fase = Fase.objects.create(nombre='F1', obra=crear_obra(), presupuesto_asignado=100)
+        respuesta = self.client.get(reverse('tarea-create', args=[fase.pk]))
+        self.assertContains(respuesta, '<option value="Aislantes">Aislantes</option>', html=True)
+        self.assertContains(respuesta, "familia: '#buscarFamilia'")
+
+    def test_triggers_ven_el_sql_directo(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO app_material (codigo, nombre, unidad, familia, sistema, costo_unitario, stock, nombre_busqueda)"
+                " VALUES ('VAL', 'Válvula de bola', 'u', 'Válvulas', 'CHW', 1, 0, '')"
+            )
+        self.assertEqual(self.codigos('valvula'), ['VAL'])
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE app_material SET nombre = 'Llave de paso' WHERE codigo = 'VAL'")
+        self.assertEqual((self.codigos('valvula'), self.codigos('llave')), ([], ['VAL']))
+        Material.objects.filter(codigo='VAL').delete()
+        self.assertEqual(self.codigos('llave'), [])
+
+    def test_instalar_indice_se_repara(self):
+        self.assertFalse(catalogo.instalar_indice())
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {catalogo.TABLA_FTS}_ai")
+            cursor.execute(f"DROP TABLE {catalogo.TABLA_FTS}")
+        Material.objects.create(codigo='NUEVO', nombre='Soporte', familia='F', unidad='u', costo_unitario=1)
+        self.assertTrue(catalogo.instalar_indice())
+        self.assertEqual(self.codigos('soporte'), ['NUEVO'])
+        self.assertEqual(self.codigos('tuberia'), ['TUB-1', 'TUB-2'])
+
+
+class ExplotarCorridasTests(SimpleTestCase):
+    """La explosión en lote da exactamente lo mismo que la escalar."""
+
+    def setUp(self):
+        self.grafo = reglas.GrafoReglas(
+            por_equipo={
+                'E1': {'TUB-1': D(3), 'SOP': D(2)},
+                'E2': {'SOP': D('0.5'), 'AIS': D(-1)},
+                'E3': {'TUB-1': D(-4)},
+            },
+            por_material={
+                'TUB-1': {'AIS': D('1.1'), 'SOP': D('0.25')},
+                'TUB-2': {'AIS': D('1.3'), 'COD': D(-2)},
+                'AIS': {'CINTA': D('0.1')},
+                'SOP': {'TOR': D(4), 'CINTA': D(-1)},
+            },
+        )
+
+    def test_lote_igual_a_escalar(self):
+        corridas = {
+            'vacia': {},
+            'solo_tuberias': {'tuberias': {'TUB-1': 10, 'TUB-2': '2.5', 'OTRO': 1}},
+            'solo_equipos': {'equipos': {'E1': 2, 'E2': 3}},
+            'mixta': {'equipos': {'E1': 1, 'E2': None}, 'tuberias': {'TUB-2': 4, 'SOP': 1}},
+            'equipo_negativo': {'equipos': {'E3': 1}, 'tuberias': {'TUB-1': 2}},
+            'tuberia_negativa': {'tuberias': {'TUB-1': -3, 'TUB-2': 1}},
+            'ceros': {'equipos': {'E1': 0}, 'tuberias': {'TUB-2': 0}},
+            'sin_reglas': {'equipos': {'X': 5}, 'tuberias': {'Y': 7}},
+        }
+        lote = self.grafo.explotar_corridas(corridas)
+        self.assertEqual(lote.keys(), corridas.keys())
+        for clave, datos in corridas.items():
+            with self.subTest(corrida=clave):
+                self.assertEqual(lote[clave], self.grafo.explotar_corrida(datos))
+
+    def test_coeficientes_negativos_se_descartan(self):
+        materiales = self.grafo.explotar_corridas({1: {'tuberias': {'TUB-2': 1}}})[1]
+        self.assertNotIn('COD', materiales)
+        self.assertEqual(materiales['AIS'], D('1.3'))
+        self.assertEqual(materiales['CINTA'], D('0.13'))
+
+
+class VistaPreviaTests(TestCase):
+    """La vista previa incremental da lo mismo que explotar la corrida completa."""
+
+    def setUp(self):
+        for codigo, familia, costo in (
+            ('TUB-1', 'Tuberías', '12.35'), ('TUB-2', 'Tuberías', '20'), ('AIS', 'Aislantes', '3.33'),
+            ('SOP', 'Accesorios', '0.7'), ('TOR', 'Accesorios', '0.05'),
+        ):
+            Material.objects.create(codigo=codigo, nombre=codigo, familia=familia, unidad='u', costo_unitario=D(costo))
+        self.grafo = reglas.GrafoReglas(
+            por_equipo={'E1': {'TUB-1': D(3), 'SOP': D(2)}, 'E2': {'SOP': D('0.5'), 'CINTA': D(1)}},
+            por_material={
+                'TUB-1': {'AIS': D('1.1'), 'SOP': D('0.25')},
+                'TUB-2': {'AIS': D('1.3')},
+                'SOP': {'TOR': D(4)},
+            },
+        )
+
+    def previa(self, entradas, estado=None):
+        with mock.patch.object(reglas, 'obtener_grafo', return_value=self.grafo):
+            respuesta, estado = vista_previa(entradas, estado)
+        # El estado viaja en la sesión como JSON
+        return respuesta, estado and json.loads(json.dumps(estado))
+
+    def sin_contador(self, respuesta):
+        return {clave: valor for clave, valor in respuesta.items() if clave != 'entradas_recalculadas'}
+
+    def test_incremental_igual_a_completa(self):
+        pasos = [
+            {'equipos': {'E1': 2}, 'tuberias': {}},
+            {'equipos': {'E1': 2, 'E2': '3'}, 'tuberias': {'TUB-2': 4}},
+            {'equipos': {'E1': 5, 'E2': 3}, 'tuberias': {'TUB-2': 4, 'TUB-1': 7}},
+            {'equipos': {'E1': 0, 'E2': ''}, 'tuberias': {'TUB-1': 7}},
+            {'equipos': {}, 'tuberias': {}},
+        ]
+        estado = None
+        for numero, entradas in enumerate(pasos):
+            with self.subTest(paso=numero):
+                incremental, estado = self.previa(entradas, estado)
+                completa, _ = self.previa(entradas)
+                self.assertEqual(self.sin_contador(incremental), self.sin_contador(completa))
+                cantidades = {f['codigo']: D(f['cantidad']) for f in incremental['materiales']}
+                esperadas = self.grafo.explotar_corrida(
+                    {grupo: {k: int(v) for k, v in valores.items() if v} for grupo, valores in entradas.items()}
+                )
+                self.assertEqual(cantidades, esperadas)
+        self.assertEqual(incremental['total'], 0)
+
+    def test_solo_recalcula_lo_que_cambio(self):
+        _, estado = self.previa({'equipos': {'E1': 1, 'E2': 1}, 'tuberias': {'TUB-2': 1}})
+        respuesta, _ = self.previa({'equipos': {'E1': 1, 'E2': 2}, 'tuberias': {'TUB-2': 1}}, estado)
+        self.assertEqual(respuesta['entradas_recalculadas'], 1)
+
+        # Si las reglas cambiaron, el estado anterior no sirve y se recalcula todo
+        estado['firma'] = 'otra'
+        respuesta, _ = self.previa({'equipos': {'E1': 1, 'E2': 2}, 'tuberias': {'TUB-2': 1}}, estado)
+        self.assertEqual(respuesta['entradas_recalculadas'], 3)
+
+    def test_reglas_no_lineales_recalculan_todo(self):
+        self.grafo = reglas.GrafoReglas(por_equipo={'E1': {'TUB-1': D(3), 'SOP': D(-1)}}, por_material={})
+        respuesta, estado = self.previa({'equipos': {'E1': 2}})
+        self.assertIsNone(estado)
+        self.assertEqual([f['codigo'] for f in respuesta['materiales']], ['TUB-1'])
+
+    def test_entradas_invalidas(self):
+        for entradas in ([], {'equipos': ['E1']}, {'equipos': {'E1': 'x'}}, {'tuberias': {'TUB-1': -1}}):
+            with self.subTest(entradas=entradas), self.assertRaises(ErrorVistaPrevia):
+                self.previa(entradas)
+
+
+class LineasTests(TestCase):
+    """Las tablas de líneas siguen al JSON de corridas y cotizaciones."""
+
+    def setUp(self):
+        for codigo in ('TUB-1', 'AIS', 'SOP'):
+            Material.objects.create(codigo=codigo, nombre=codigo, familia='F', unidad='u', costo_unitario=1)
+        Equipo.objects.create(nombre='Condensadora', modelo='E1', capacidad=10, mca=1, mfa=1)
+        self.corrida = Corrida.objects.create(
+            correlativo='C-1', nombre='Torre A',
+            datos={'equipos': {'E1': 2, 'E9': 1}, 'tuberias': {'TUB-1': '15', 'AIS': 0, 'SOP': 'x', 'NADA': 3}},
+        )
+
+    def lineas_corrida(self):
+        return sorted(self.corrida.lineas.values_list(Coalesce('equipo__modelo', 'material__codigo'), 'cantidad'))
+
+    def test_corrida(self):
+        self.assertEqual(self.lineas_corrida(), [('E1', 2), ('TUB-1', 15)])
+
+        self.corrida.datos = {'tuberias': {'SOP': 4}}
+        self.corrida.save()
+        self.assertEqual(self.lineas_corrida(), [('SOP', 4)])
+
+        # Un guardado que no toca el JSON no reescribe las líneas
+        self.corrida.datos = {}
+        self.corrida.save(update_fields=['nombre'])
+        self.assertEqual(self.lineas_corrida(), [('SOP', 4)])
+
+    def test_cotizaciones_y_demanda(self):
+        base = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=self.corrida, nombre='Torre A', datos={'materiales': {
+                'TUB-1': {'cantidad': 10, 'costo_unitario': '2.5'},
+                'AIS': {'cantidad': '4.5', 'costo_unitario': 2},
+                'NADA': {'cantidad': 1, 'costo_unitario': 1},
+                'SOP': {'cantidad': 'x', 'costo_unitario': 1},
+            }},
+        )
+        revision = revisiones.crear_revision(base, 'Torre A rev 1', {'materiales': {
+            'TUB-1': {'cantidad': 12, 'costo_unitario': '2.5'},
+            'SOP': {'cantidad': 1, 'costo_unitario': 8},
+        }})
+        self.assertEqual(
+            sorted(base.lineas.values_list('material__codigo', 'cantidad', 'costo_unitario')),
+            [('AIS', D('4.5'), D(2)), ('TUB-1', D(10), D('2.5'))],
+        )
+        self.assertEqual(
+            sorted(revision.lineas.values_list('material__codigo', 'cantidad')), [('SOP', D(1)), ('TUB-1', D(12))]
+        )
+
+        demanda = lineas.demanda_de_materiales()
+        self.assertEqual(demanda['TUB-1'], {'cantidad': D(22), 'cotizaciones': 2, 'importe': D(55)})
+        self.assertEqual(demanda['AIS'], {'cantidad': D('4.5'), 'cotizaciones': 1, 'importe': D(9)})
+        self.assertEqual(
+            lineas.demanda_de_materiales(cotizaciones=[revision.pk], materiales=Material.objects.filter(codigo='SOP')),
+            {'SOP': {'cantidad': D(1), 'cotizaciones': 1, 'importe': D(8)}},
+        )
+
+
+class RegenerarCotizacionesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for codigo, costo in (('TUB-1', '12.50'), ('AIS', '3.10'), ('SOP', '7.00'), ('TOR', '0.35')):
+            Material.objects.create(codigo=codigo, nombre=codigo, familia='F', unidad='u', costo_unitario=D(costo))
+        Equipo.objects.create(nombre='Condensadora', modelo='E1', capacidad=10, mca=1, mfa=1)
+        Equipo.objects.create(nombre='Evaporadora', modelo='E2', capacidad=2, mca=1, mfa=1)
+        ReglaEquipoMaterial.objects.create(
+            equipo_origen_id='E1', materiales_requeridos=[{'codigo': 'TUB-1', 'cantidad': 3}, {'codigo': 'SOP', 'cantidad': 2}]
+        )
+        ReglaEquipoMaterial.objects.create(
+            equipo_origen_id='E2', materiales_requeridos=[{'codigo': 'SOP', 'cantidad': 1}, {'codigo': 'AIS', 'cantidad': -1}]
+        )
+        ReglaMaterialMaterial.objects.create(
+            material_origen_id='TUB-1', materiales_requeridos=[{'codigo': 'AIS', 'cantidad': 1.1}]
+        )
+        ReglaMaterialMaterial.objects.create(
+            material_origen_id='SOP', materiales_requeridos=[{'codigo': 'TOR', 'cantidad': 4}]
+        )
+        cls.corridas = [
+            Corrida.objects.create(correlativo=f'C-{i}', nombre=f'Corrida {i}', datos=datos)
+            for i, datos in enumerate([
+                {'cliente': 'A', 'equipos': {'E1': 2}, 'tuberias': {'TUB-1': 15}},
+                {'cliente': 'B', 'equipos': {'E1': 1, 'E2': 4}},
+                {'cliente': 'C', 'tuberias': {'TUB-1': 3, 'SOP': 2}},
+            ])
+        ]
+
+    def test_usa_la_explosion_en_lote(self):
+        original = reglas.GrafoReglas.explotar_corridas
+        with mock.patch.object(
+            reglas.GrafoReglas, 'explotar_corridas', autospec=True, side_effect=original
+        ) as explotar_corridas:
+            call_command('regenerar_cotizaciones', procesos=1, stdout=StringIO(), stderr=StringIO())
+        explotar_corridas.assert_called_once()
+
+        for corrida in self.corridas:
+            with self.subTest(corrida=corrida.nombre):
+                cotizacion = Cotizacion.objects.get(corrida=corrida, revision_de__isnull=True)
+                self.assertEqual(cotizacion.datos, calcular_datos_cotizacion(corrida.datos))
+
+
+class GenerarCotizacionTests(TestCase):
+
+    def test_renombrar_corrida_actualiza_nombre_sin_recalcular(self):
+        Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=D('2.00'))
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={'tuberias': {'TUB-1': 5}})
+        cotizacion, cambios = generar_cotizacion(corrida)
+        self.assertIsNone(cambios)
+        self.assertEqual(cotizacion.nombre, 'Torre A')
+        modificada = cotizacion.fecha_modificacion
+
+        corrida.nombre = 'Torre B'
+        corrida.save()
+        cotizacion, cambios = generar_cotizacion(corrida)
+        self.assertEqual(cambios, [])
+        cotizacion.refresh_from_db()
+        self.assertEqual(cotizacion.nombre, 'Torre B')
+        self.assertGreater(cotizacion.fecha_modificacion, modificada)
+
+
+class NumeracionTests(TestCase):
+
+    def setUp(self):
+        self.anio = date.today().year
+        Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=D('2.00'))
+
+    def generar(self, nombre):
+        corrida = Corrida.objects.create(correlativo=f'C-{nombre}', nombre=nombre, datos={'tuberias': {'TUB-1': 1}})
+        return generar_cotizacion(corrida)[0]
+
+    def test_siguiente_del_anio_por_max(self):
+        vieja = Corrida.objects.create(correlativo='C-vieja', nombre='Vieja', datos={})
+        Cotizacion.objects.create(
+            correlativo=f'COT-{self.anio - 1}-GS-I-040-vieja', corrida=vieja, nombre='Vieja', datos={},
+            anio=self.anio - 1, numero=40,
+        )
+        primera = self.generar('Torre A')
+        segunda = self.generar('Torre B')
+        revisiones.crear_revision(segunda, 'Torre B rev 1', {})
+        self.assertEqual((primera.numero, segunda.numero), (1, 2))
+        self.assertEqual(primera.correlativo, f'COT-{self.anio}-GS-I-001-torre_a')
+
+        # Borrar una cotización no hace repetir números (antes se contaban filas)
+        primera.corrida.delete()
+        tercera = self.generar('Torre C')
+        self.assertEqual((tercera.anio, tercera.numero), (self.anio, 3))
+
+    def test_migracion_lee_los_correlativos(self):
+        migracion = importlib.import_module('app.migrations.0010_numeracion_correlativos')
+        corrida = Corrida.objects.create(correlativo='CORR-2024-GS-I-007-torre', nombre='Torre', datos={})
+        base = Cotizacion.objects.create(correlativo='COT-2024-GS-I-012-torre', corrida=corrida, nombre='T', datos={})
+        revision = Cotizacion.objects.create(
+            correlativo='COT-2024-GS-I-012-torre_rev_3', corrida=corrida, nombre='T', datos={}, revision_de=base,
+        )
+        otra = Cotizacion.objects.create(correlativo='importada', corrida=corrida, nombre='T', datos={})
+
+        migracion.poblar_numeracion(django_apps, None)
+        for objeto in (corrida, base, revision, otra):
+            objeto.refresh_from_db()
+        self.assertEqual((corrida.anio, corrida.numero), (2024, 7))
+        self.assertEqual(
+            [(c.anio, c.numero, c.revision) for c in (base, revision, otra)],
+            [(2024, 12, 0), (2024, 12, 3), (None, None, 0)],
+        )
+
+
+class AnaliticaTests(TestCase):
+
+    def setUp(self):
+        Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=D('2.00'))
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.base = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A',
+            datos={'materiales': {'TUB-1': {'cantidad': 10, 'costo_unitario': 3.0}}},
+        )
+        self.rev_1 = revisiones.crear_revision(
+            self.base, 'Torre A rev 1', {'materiales': {'TUB-1': {'cantidad': 20, 'costo_unitario': 3.0}}}
+        )
+        self.rev_2 = revisiones.crear_revision(
+            self.base, 'Torre A rev 2', {'materiales': {'TUB-1': {'cantidad': 30, 'costo_unitario': 3.0}}}
+        )
+
+    def test_revisiones_no_cuentan_como_cotizaciones(self):
+        totales = analitica.informe()['totales']
+        self.assertEqual(totales['cotizaciones'], 1)
+        self.assertEqual(totales['convertidas'], 0)
+        self.assertEqual(totales['valor_cotizado'], D('30.00'))
+
+    def test_importes_redondeados_por_linea_como_el_presupuesto(self):
+        for codigo in ('A', 'B', 'C'):
+            Material.objects.create(codigo=codigo, nombre=codigo, familia='F', unidad='u', costo_unitario=1)
+        materiales = {
+            'A': {'cantidad': 0.5, 'costo_unitario': 0.01},
+            'B': {'cantidad': 0.5, 'costo_unitario': 0.01},
+            'C': {'cantidad': 1.5, 'costo_unitario': 0.335},
+        }
+        otra = Cotizacion.objects.create(
+            correlativo='COT-2', corrida=self.base.corrida, nombre='Torre B', datos={'materiales': materiales},
+        )
+        presupuesto = precios.Presupuesto.desde_materiales(materiales)
+        # Sin redondear por línea la suma daría 0.5125 -> 0.51
+        self.assertEqual(presupuesto.total, 53)
+
+        demanda = lineas.demanda_de_materiales(cotizaciones=[otra.pk])
+        self.assertEqual(sum(m['importe'] for m in demanda.values()), precios.a_decimal(presupuesto.total))
+        self.assertEqual(demanda['C']['importe'], D('0.51'))
+        datos = analitica.informe()
+        self.assertEqual(datos['totales']['valor_cotizado'], D('30.00') + precios.a_decimal(presupuesto.total))
+        self.assertEqual(
+            {m['codigo']: m['importe'] for m in datos['materiales'] if m['codigo'] in materiales},
+            {'A': D('0.01'), 'B': D('0.01'), 'C': D('0.51')},
+        )
+
+    def test_obra_de_una_revision_convierte_la_base(self):
+        analitica.informe()
+        Obra.objects.create(
+            nombre='Obra', direccion='x', fecha_inicio=date(2025, 1, 1), fecha_fin_estimada=date(2025, 2, 1),
+            presupuesto_inicial=1000, cotizacion=self.rev_2,
+        )
+        datos = analitica.informe()
+        self.assertTrue(datos['meses_recalculados'])
+        self.assertEqual(datos['totales']['cotizaciones'], 1)
+        self.assertEqual(datos['totales']['convertidas'], 1)
+        self.assertEqual(datos['totales']['tasa_conversion'], 100)
+
+
+class DeltaRevisionesTests(SimpleTestCase):
+
+    BASE = {
+        'cliente': 'ACME',
+        'descripcion': 'Torre A',
+        'utilidades': {'TUBERIA': 0.3},
+        'materiales': {
+            'TUB-1': {'cantidad': 10.0, 'costo_unitario': 3.0},
+            'AIS': {'cantidad': 4.0, 'costo_unitario': 1.5},
+            'SOP': {'cantidad': 2.0, 'costo_unitario': 7.0},
+        },
+    }
+
+    def test_ida_y_vuelta(self):
+        casos = {
+            'sin_cambios': self.BASE,
+            'campo_modificado': {**self.BASE, 'cliente': 'Otro'},
+            'campo_agregado': {**self.BASE, 'ingeniero_encargado': 'Ana'},
+            'campo_quitado': {clave: valor for clave, valor in self.BASE.items() if clave != 'descripcion'},
+            'campo_a_none': {**self.BASE, 'descripcion': None},
+            'linea_quitada': {**self.BASE, 'materiales': {
+                codigo: info for codigo, info in self.BASE['materiales'].items() if codigo != 'AIS'
+            }},
+            'lineas_mezcladas': {**self.BASE, 'utilidades': {'TUBERIA': 0.0}, 'materiales': {
+                'TUB-1': {'cantidad': 12.0, 'costo_unitario': 3.0},
+                'COD': {'cantidad': 1.0, 'costo_unitario': 0.5},
+            }},
+            'sin_lineas': {'cliente': 'ACME', 'materiales': {}},
+        }
+        for nombre, datos in casos.items():
+            with self.subTest(caso=nombre):
+                delta = revisiones.calcular_delta(self.BASE, datos)
+                self.assertEqual(revisiones.aplicar_delta(self.BASE, delta), datos)
+
+    def test_delta_registra_quitados(self):
+        datos = {'cliente': 'ACME', 'materiales': {'TUB-1': self.BASE['materiales']['TUB-1']}}
+        delta = revisiones.calcular_delta(self.BASE, datos)
+        self.assertEqual(delta, {'campos_quitados': ['descripcion', 'utilidades'], 'eliminados': ['AIS', 'SOP']})
+
+    def test_aplicar_no_modifica_la_base(self):
+        base = {'materiales': {'TUB-1': {'cantidad': 1.0}}}
+        datos = revisiones.aplicar_delta(base, {'modificados': {'TUB-1': {'cantidad': 2.0}}})
+        datos['materiales']['TUB-1']['cantidad'] = 5.0
+        self.assertEqual(base, {'materiales': {'TUB-1': {'cantidad': 1.0}}})
+
+
+class RebasarTests(TestCase):
+
+    def test_revision_materializa_igual_tras_rebasar(self):
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        base = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A', datos=DeltaRevisionesTests.BASE,
+        )
+        editada = {
+            'cliente': 'ACME',
+            'utilidades': {'TUBERIA': 0.25},
+            'materiales': {
+                'TUB-1': {'cantidad': 11.0, 'costo_unitario': 3.0},
+                'COD': {'cantidad': 3.0, 'costo_unitario': 0.5},
+            },
+        }
+        revision = revisiones.crear_revision(base, 'Torre A rev 1', editada)
+
+        nuevos = {
+            'cliente': 'ACME S.A.',
+            'descripcion': 'Torre A',
+            'materiales': {
+                'TUB-1': {'cantidad': 10.0, 'costo_unitario': 3.5},
+                'COD': {'cantidad': 3.0, 'costo_unitario': 0.5},
+                'VAL': {'cantidad': 1.0, 'costo_unitario': 20.0},
+            },
+        }
+        revisiones.rebasar(base, nuevos)
+        base.datos = nuevos
+        base.save()
+
+        revision = Cotizacion.objects.select_related('revision_de').get(pk=revision.pk)
+        self.assertEqual(revisiones.aplicar_delta(revision.revision_de.datos, revision.delta), editada)
+
+
+class CrearRevisionTests(TestCase):
+
+    def setUp(self):
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.base = Cotizacion.objects.create(
+            correlativo='COT-2025-GS-I-001-torre_a', corrida=corrida, nombre='Torre A',
+            datos=DeltaRevisionesTests.BASE, anio=2025, numero=1,
+        )
+
+    def test_numeracion(self):
+        rev_1 = revisiones.crear_revision(self.base, 'rev 1', {**DeltaRevisionesTests.BASE, 'cliente': 'X'})
+        rev_2 = revisiones.crear_revision(rev_1, 'rev 2', DeltaRevisionesTests.BASE)
+        self.assertEqual(
+            [(c.revision, c.correlativo, c.anio, c.numero) for c in (rev_1, rev_2)],
+            [(1, 'COT-2025-GS-I-001-torre_a_rev_1', 2025, 1), (2, 'COT-2025-GS-I-001-torre_a_rev_2', 2025, 1)],
+        )
+        self.assertEqual(rev_1.documento['cliente'], 'X')
+        self.assertEqual(rev_2.delta, {})
+
+    def test_reintenta_si_otro_guardado_tomo_el_numero(self):
+        revisiones.crear_revision(self.base, 'rev 1', DeltaRevisionesTests.BASE)
+        # Simula que el MAX se leyó antes de que otra petición guardara la rev 1
+        with mock.patch.object(revisiones, '_siguiente_revision', side_effect=[1, 2]):
+            revision = revisiones.crear_revision(self.base, 'rev 2', DeltaRevisionesTests.BASE)
+        self.assertEqual(revision.revision, 2)
+
+        with mock.patch.object(revisiones, '_siguiente_revision', return_value=1):
+            with self.assertRaises(IntegrityError):
+                revisiones.crear_revision(self.base, 'rev 3', DeltaRevisionesTests.BASE)
+        self.assertEqual(self.base.revisiones.count(), 2)
+
+
+class CotizacionEditFormTests(TestCase):
+
+    def test_utilidad_cero_no_se_muestra_como_30(self):
+        Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='TUBERIA', unidad='m', costo_unitario=D('2.00'))
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        cotizacion = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A', datos={
+                'utilidades': {'TUBERIA': 0.0},
+                'materiales': {'TUB-1': {'cantidad': 1.0, 'costo_unitario': 2.0}},
+            },
+        )
+        respuesta = self.client.get(reverse('cotizacion-edit', args=[cotizacion.pk]))
+        self.assertContains(respuesta, 'name="utilidad-TUBERIA"')
+        self.assertContains(respuesta, 'value="0.0"')
+
+
+class PreciosTests(SimpleTestCase):
+
+    def test_dividir_redondea_mitades_lejos_de_cero(self):
+        casos = [
+            (10, 4, 3), (-10, 4, -3),      # 2.5
+            (9, 4, 2), (-9, 4, -2),        # 2.25
+            (11, 4, 3), (-11, 4, -3),      # 2.75
+            (1, 2, 1), (-1, 2, -1),        # 0.5
+            (1, 3, 0), (-1, 3, 0),
+            (0, 7, 0), (15, 5, 3), (-15, 5, -3),
+        ]
+        for numerador, divisor, esperado in casos:
+            with self.subTest(numerador=numerador, divisor=divisor):
+                self.assertEqual(precios._dividir(numerador, divisor), esperado)
+
+    def test_precio_con_utilidad(self):
+        self.assertEqual(precios.precio_con_utilidad(1000), 1300)
+        self.assertEqual(precios.precio_con_utilidad(1000, 0), 1000)
+        self.assertEqual(precios.precio_con_utilidad(999, 2500), 1249)   # 1248.75
+        self.assertEqual(precios.precio_con_utilidad(333, 1500), 383)    # 382.95
+        self.assertEqual(precios.precio_con_utilidad(10, 500), 11)       # 10.5
+        self.assertEqual(precios.precio_con_utilidad(-10, 500), -11)
+        self.assertEqual(precios.precio_con_utilidad(precios.a_centavos('12.345')), 1606)  # 1235 x 1.3 = 1605.5
+
+    def test_presupuesto_subtotales_y_total(self):
+        presupuesto = precios.Presupuesto.desde_materiales(
+            {
+                'TUB-1': {'cantidad': 2.5, 'costo_unitario': 12.99},
+                'TUB-2': {'cantidad': '0.3333', 'costo_unitario': 10},
+                'AIS': {'cantidad': 3, 'costo_unitario': 0.105},
+                'SIN': {'cantidad': None, 'costo_unitario': 5},
+                'X': {'cantidad': 1, 'costo_unitario': 7.5},
+            },
+            familias={'TUB-1': 'TUBERIA', 'TUB-2': 'TUBERIA', 'AIS': 'AISLANTE'},
+        )
+        self.assertEqual(len(presupuesto), 5)
+        # 3247.5 -> 3248, 333.3 -> 333, 11 x 3 = 33, 0, 750
+        self.assertEqual(list(presupuesto.importes), [3248, 333, 33, 0, 750])
+        self.assertEqual(presupuesto.subtotales, {'TUBERIA': 3581, 'AISLANTE': 33, 'OTRO': 750})
+        self.assertEqual(presupuesto.total, 4364)
+        self.assertEqual(precios.a_decimal(presupuesto.total), D('43.64'))
+
+
+class CotizacionUpdateViewTests(TestCase):
+
+    def setUp(self):
+        Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='TUBERIA', unidad='m', costo_unitario=D('10.00'))
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.cotizacion = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A',
+            datos={'materiales': {'TUB-1': {'cantidad': 1.0, 'costo_unitario': 13.0}}},
+        )
+
+    def editar(self, **campos):
+        respuesta = self.client.post(
+            reverse('cotizacion-edit', args=[self.cotizacion.pk]), {'nombre': 'Torre A rev', **campos}
+        )
+        self.assertEqual(respuesta.status_code, 302)
+        return self.cotizacion.revisiones.get().documento
+
+    def test_utilidad_vacia_usa_la_de_por_defecto(self):
+        documento = self.editar(**{'utilidad-TUBERIA': '', 'material-quantity-TUB-1': '2'})
+        self.assertEqual(documento['utilidades'], {'TUBERIA': 0.3})
+        self.assertEqual(documento['materiales'], {'TUB-1': {'cantidad': 2.0, 'costo_unitario': 13.0}})
+
+    def test_valores_no_finitos_se_rechazan(self):
+        documento = self.editar(**{
+            'utilidad-TUBERIA': 'inf',
+            'material-quantity-TUB-1': 'Infinity',
+        })
+        self.assertEqual(documento['utilidades'], {'TUBERIA': 0.3})
+        self.assertEqual(documento['materiales'], {})
+
+    def test_utilidad_y_cantidad_con_coma(self):
+        documento = self.editar(**{'utilidad-TUBERIA': '12,5', 'material-quantity-TUB-1': '1,5'})
+        self.assertEqual(documento['utilidades'], {'TUBERIA': 0.125})
+        self.assertEqual(documento['materiales'], {'TUB-1': {'cantidad': 1.5, 'costo_unitario': 11.25}})
+
+
+class CachePdfTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.enterContext(override_settings(PDF_CACHE_DIR=directorio.name))
+        self.tubo = Material.objects.create(codigo='TUB-1', nombre='Tubo', familia='F', unidad='m', costo_unitario=2)
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.cotizacion = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A',
+            datos={'materiales': {'TUB-1': {'cantidad': 3, 'costo_unitario': 2.6}}},
+        )
+        self.url = reverse('detalle_cotizacion', args=[self.cotizacion.pk])
+
+    def archivos(self):
+        return sorted(ruta.name for ruta in pdf._directorio().glob('*.pdf'))
+
+    def test_se_genera_una_vez_por_version(self):
+        with mock.patch.object(pdf, 'renderizar_cotizacion', wraps=pdf.renderizar_cotizacion) as renderizar:
+            primera = self.client.get(self.url)
+            self.assertTrue(b''.join(primera.streaming_content).startswith(b'%PDF'))
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=primera['ETag']).status_code, 304)
+            self.assertEqual(renderizar.call_count, 1)
+
+            self.cotizacion.nombre = 'Torre A editada'
+            self.cotizacion.save()
+            segunda = self.client.get(self.url)
+            b''.join(segunda.streaming_content)
+            self.assertEqual(renderizar.call_count, 2)
+        self.assertNotEqual(segunda['ETag'], primera['ETag'])
+        # El PDF anterior se borra al generar el nuevo
+        self.assertEqual(self.archivos(), [pdf.nombre_en_cache(self.cotizacion)])
+
+    def test_cambios_de_material_impreso(self):
+        pdf.ruta_en_cache(self.cotizacion)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tubo.costo_unitario = 5
+            self.tubo.stock = 10
+            self.tubo.save()
+        self.assertEqual(len(self.archivos()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tubo.nombre = 'Tubo de cobre'
+            self.tubo.save(update_fields=['nombre'])
+        self.assertEqual(self.archivos(), [])
+
+        pdf.ruta_en_cache(self.cotizacion)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tubo.delete()
+        self.assertEqual(self.archivos(), [])
+
+    def test_borrar_la_cotizacion(self):
+        pdf.ruta_en_cache(self.cotizacion)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cotizacion.delete()
+        self.assertEqual(self.archivos(), [])
+
+
+class RenderizarPdfTests(TestCase):
+
+    def setUp(self):
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.materiales = {f'M-{i:03d}': {'cantidad': i + 1, 'costo_unitario': 1.5} for i in range(400)}
+        self.cotizacion = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A', datos={'materiales': self.materiales},
+        )
+        self.catalogo = {
+            codigo: (f'Material {codigo}', 'tuberia' if i % 2 else 'anclaje') for i, codigo in enumerate(self.materiales)
+        }
+
+    def test_tramos_se_piden_a_medida_que_se_maquetan(self):
+        producidos = []
+        por_pagina = []
+        tramos_de_tabla = pdf._tramos_de_tabla
+        show_page_original = pdf.NumberedCanvas.showPage
+
+        def contar(filas):
+            for tramo in tramos_de_tabla(filas):
+                producidos.append(tramo)
+                yield tramo
+
+        def show_page(canvas):
+            por_pagina.append(len(producidos))
+            show_page_original(canvas)
+
+        with mock.patch.object(pdf, '_tramos_de_tabla', contar), \
+                mock.patch.object(pdf.NumberedCanvas, 'showPage', show_page):
+            contenido = pdf.renderizar_cotizacion(self.cotizacion, self.catalogo)
+
+        # 400 materiales + 2 familias (título y subtotal) + separador y total
+        self.assertEqual(len(producidos), -(-406 // pdf.FILAS_POR_TRAMO))
+        # Al cerrar la primera página solo se armaron los tramos que cabían en ella y uno más
+        self.assertLess(por_pagina[0], len(producidos) // 2)
+        self.assertEqual(por_pagina, sorted(por_pagina))
+        paginas = len(por_pagina)
+        self.assertGreater(paginas, 3)
+        self.assertEqual(contenido.count(b'/Type /Page\n'), paginas)
+        for pagina in (1, paginas):
+            self.assertIn(f'numero_pagina_{pagina}'.encode(), contenido)
+
+    def test_catalogo_de_la_bd_igual_al_dado(self):
+        for codigo, (nombre, familia) in self.catalogo.items():
+            Material.objects.create(codigo=codigo, nombre=nombre, familia=familia, unidad='u', costo_unitario=1)
+        with mock.patch.object(pdf, 'Paragraph', wraps=pdf.Paragraph) as desde_bd:
+            pdf.renderizar_cotizacion(self.cotizacion)
+        with mock.patch.object(pdf, 'Paragraph', wraps=pdf.Paragraph) as dado:
+            pdf.renderizar_cotizacion(self.cotizacion, self.catalogo)
+        self.assertEqual(
+            [llamada.args[0] for llamada in desde_bd.call_args_list], [llamada.args[0] for llamada in dado.call_args_list]
+        )
+
+
+class ExportarPdfZipTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        self.enterContext(override_settings(PDF_CACHE_DIR=directorio.name))
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        self.base = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A', datos={'cliente': 'ACME', 'descripcion': 'x'},
+            anio=2025, numero=1,
+        )
+        self.hereda = revisiones.crear_revision(self.base, 'rev 1', {'cliente': 'ACME', 'descripcion': 'y'})
+        self.cambia = revisiones.crear_revision(self.base, 'rev 2', {'cliente': 'Otro', 'descripcion': 'x'})
+        self.quita = revisiones.crear_revision(self.base, 'rev 3', {'descripcion': 'x'})
+        self.otra = Cotizacion.objects.create(
+            correlativo='COT-2', corrida=Corrida.objects.create(correlativo='C-2', nombre='Torre B', datos={}),
+            nombre='Torre B', datos={'cliente': 'Otro S.A.'}, anio=2025, numero=2,
+        )
+        self.todas = [self.base, self.hereda, self.cambia, self.quita, self.otra]
+
+    def exportar(self, procesos=1):
+        salida = BytesIO()
+        queryset = Cotizacion.objects.filter(pk__in=[c.pk for c in self.todas]).order_by('anio', 'numero', 'revision')
+        pasos = list(pdf.exportar_zip(queryset, salida, procesos))
+        with zipfile.ZipFile(salida) as archivo_zip:
+            return archivo_zip.namelist(), [en_cache for _, en_cache in pasos]
+
+    def test_orden_de_las_cotizaciones(self):
+        esperado = [pdf.nombre_en_zip(c) for c in self.todas]
+        pdf.ruta_en_cache(self.cambia)
+        pdf.ruta_en_cache(self.otra)
+        for procesos in (1, 2):
+            with self.subTest(procesos=procesos):
+                for ruta in self.directorio.glob('*.pdf'):
+                    if ruta.name not in {pdf.nombre_en_cache(self.cambia), pdf.nombre_en_cache(self.otra)}:
+                        ruta.unlink()
+                nombres, en_cache = self.exportar(procesos)
+                self.assertEqual(nombres, esperado)
+                self.assertEqual(en_cache, [False, False, True, False, True])
+        self.assertEqual(self.exportar()[1], [True] * 5)
+
+    def test_sin_fork_genera_en_este_proceso(self):
+        with mock.patch.object(pdf.multiprocessing, 'get_all_start_methods', return_value=['spawn']), \
+                mock.patch.object(pdf, 'ProcessPoolExecutor') as pool:
+            nombres, _ = self.exportar(procesos=4)
+        pool.assert_not_called()
+        self.assertEqual(nombres, [pdf.nombre_en_zip(c) for c in self.todas])
+
+    def test_filtro_por_cliente_respeta_las_revisiones(self):
+        for cliente, esperadas in (('acme', [self.base, self.hereda]), ('otro', [self.cambia, self.otra])):
+            with self.subTest(cliente=cliente):
+                salida = self.directorio / f'{cliente}.zip'
+                call_command(
+                    'exportar_pdf_cotizaciones', cliente=cliente, salida=str(salida), procesos=1, stdout=StringIO()
+                )
+                with zipfile.ZipFile(salida) as archivo_zip:
+                    self.assertEqual(archivo_zip.namelist(), [pdf.nombre_en_zip(c) for c in esperadas])
+                self.assertEqual(
+                    [revisiones.campo(c, 'cliente') for c in esperadas],
+                    ['ACME', 'ACME'] if cliente == 'acme' else ['Otro', 'Otro S.A.'],
+                )
+
+
+class ExportarListadosTests(TestCase):
+
+    def setUp(self):
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        base = Cotizacion.objects.create(
+            correlativo='COT-1', corrida=corrida, nombre='Torre A',
+            datos={'descripcion': 'Torre A, "norte"', 'materiales': {'TUB-1': {'cantidad': 1, 'costo_unitario': 1}}},
+        )
+        revisiones.crear_revision(base, 'Torre A rev 1', {'descripcion': 'Torre A, "norte"', 'materiales': {}})
+        revisiones.crear_revision(base, 'Torre A rev 2', {'descripcion': 'Torre A & sur', 'materiales': {}})
+        revisiones.crear_revision(base, 'Torre A rev 3', {'materiales': {}})
+        self.url = reverse('cotizacion-list')
+        self.filas = [
+            ['Correlativo', 'Proyecto', 'Descripción'],
+            ['COT-1', 'Torre A', 'Torre A, "norte"'],
+            ['COT-1_rev_1', 'Torre A rev 1', 'Torre A, "norte"'],
+            ['COT-1_rev_2', 'Torre A rev 2', 'Torre A & sur'],
+            ['COT-1_rev_3', 'Torre A rev 3', ''],
+        ]
+
+    def descargar(self, formato):
+        respuesta = self.client.get(self.url, {'exportar': formato})
+        self.assertIn(f'.{formato}"', respuesta['Content-Disposition'])
+        return b''.join(respuesta.streaming_content)
+
+    def test_csv(self):
+        contenido = self.descargar('csv').decode('utf-8')
+        self.assertTrue(contenido.startswith('\ufeff'))
+        self.assertEqual(sorted(csv.reader(StringIO(contenido[1:]))), sorted(self.filas))
+
+    def test_xlsx(self):
+        with zipfile.ZipFile(BytesIO(self.descargar('xlsx'))) as libro:
+            hoja = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        filas = [
+            [''.join(celda.itertext()) for celda in fila.findall('x:c', ns)]
+            for fila in hoja.iterfind('x:sheetData/x:row', ns)
+        ]
+        self.assertEqual(sorted(filas), sorted(self.filas))
+
+    def test_listado_no_materializa_las_revisiones(self):
+        with mock.patch.object(revisiones, 'aplicar_delta') as aplicar_delta:
+            respuesta = self.client.get(self.url)
+        aplicar_delta.assert_not_called()
+        self.assertContains(respuesta, 'Torre A &amp; sur')
+        self.assertContains(respuesta, 'Torre A, &quot;norte&quot;', count=2)
+        self.assertNotContains(respuesta, 'None')
+
+
+class ExportarPdfZipAdminTests(TestCase):
+
+    def test_accion_genera_en_el_proceso_web(self):
+        corrida = Corrida.objects.create(correlativo='C-1', nombre='Torre A', datos={})
+        cotizacion = Cotizacion.objects.create(correlativo='COT-1', corrida=corrida, nombre='Torre A', datos={})
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        with mock.patch('app.pdf.zip_en_streaming', return_value=iter([b'PK'])) as zip_en_streaming:
+            respuesta = self.client.post(reverse('admin:app_cotizacion_changelist'), {
+                'action': 'exportar_pdf_zip', '_selected_action': [cotizacion.pk],
+            })
+            self.assertEqual(b''.join(respuesta.streaming_content), b'PK')
+        self.assertEqual(zip_en_streaming.call_args.kwargs, {'procesos': 1})
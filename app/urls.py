@@ -5,8 +5,9 @@ from .views import (
     FaseCreateView, TareaCreateView, TareaUpdateView, ObraMedicionesView,
     MaterialListView, MaterialCreateView, PersonalCreateView, 
     PersonalListView, CorridaWizard, ObraWizard, CorridaListView, CotizacionListView, CotizacionUpdateView,
-    CotizacionCreateView, gantt_data_view, gantt_chart_view, detalle_cotizacion, generar_obra_desde_cotizacion,
-    calculadora_tornilleria, calculadora_velumoide,
+    CotizacionCreateView, gantt_data_view, gantt_chart_view, gantt_svg_view, informe_obra, detalle_cotizacion, generar_obra_desde_cotizacion,
+    calculadora_tornilleria, calculadora_velumoide, sincronizar_mediciones, buscar_materiales_view,
+    vista_previa_corrida, analitica_cotizaciones, diferencias_cotizacion,
     FORMS, FASES_WIZARD_FORMS
 )
 
@@ -18,6 +19,7 @@ urlpatterns = [
     path('obra/<int:pk>/edit/', ObraUpdateView.as_view(), name='obra-update'),
     path('obra/<int:pk>/', ObraDetailView.as_view(), name='obra-detail'),
     path('obra/<int:pk>/mediciones/', ObraMedicionesView.as_view(), name='obra-mediciones'),
+    path('api/obra/<int:pk>/mediciones/sync/', sincronizar_mediciones, name='obra-mediciones-sync'),
 
     # Fases y Tareas
     path('obra/<int:pk>/fase/new/', FaseCreateView.as_view(), name='fase-create'),
@@ -28,6 +30,7 @@ urlpatterns = [
     path('materiales/', MaterialListView.as_view(), name='material-list'),
     path('materiales/<str:sistema>/', MaterialListView.as_view(), name='material-list-filter'),
     path('materiales/new/', MaterialCreateView.as_view(), name='material-create'),
+    path('api/materiales/buscar/', buscar_materiales_view, name='material-buscar'),
 
     # Personal
     path('personal/', PersonalListView.as_view(), name='personal-list'),
@@ -39,6 +42,8 @@ urlpatterns = [
     # Diagrama de Gantt
     path('gantt/<int:pk>/', gantt_chart_view, name='gantt_chart'),
     path('api/gantt_data/<int:pk>/', gantt_data_view, name='gantt_data'),
+    path('gantt/<int:pk>/svg/', gantt_svg_view, name='gantt_svg'),
+    path('obra/<int:pk>/informe/', informe_obra, name='obra-informe'),
 
     # Herramientas
     path('calculadora/velumoide', calculadora_velumoide, name='calculadora_velumoide'),
@@ -47,9 +52,12 @@ urlpatterns = [
     # Cotizaciones 
     path('cotizacion/', CorridaWizard.as_view(FORMS), name='corrida_wizard'),
     path('corridas/', CorridaListView.as_view(), name='corrida-list'),
+    path('api/corrida/vista-previa/', vista_previa_corrida, name='corrida-vista-previa'),
     path('cotizacion/generar/<int:corrida_id>/', CotizacionCreateView, name='generar_cotizacion'),
     path('cotizacion/editar/<int:pk>/', CotizacionUpdateView.as_view(), name='cotizacion-edit'),
+    path('cotizacion/<int:pk>/diferencias/', diferencias_cotizacion, name='cotizacion-diferencias'),
     path('cotizaciones/', CotizacionListView.as_view(), name='cotizacion-list'),
+    path('cotizaciones/analitica/', analitica_cotizaciones, name='cotizacion-analitica'),
     path('cotizacion/<int:pk>/pdf/', detalle_cotizacion, name='detalle_cotizacion'),
     path('cotizacion/<int:cotizacion_id>/generar-obra/', generar_obra_desde_cotizacion, name='generar_obra'),
 
@@ -1,46 +1,49 @@
 import json
-import re
+import logging
 import datetime
 from datetime import datetime
 from datetime import timedelta
 from decimal import Decimal
-from collections import defaultdict
 
 
 # Django
-from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.views import LoginView
 from django.db import transaction
-from django.db.models import F
-from django.http import JsonResponse, HttpResponse
+from django.core.paginator import Paginator
+from django.db.models import DecimalField, F, Max, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
 from django.views.generic import (
     ListView,
     CreateView,
     UpdateView,
     DetailView
 )
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import condition, require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.utils.text import slugify
 
 # Terceros
 from formtools.wizard.views import SessionWizardView
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_RIGHT
-from reportlab.pdfgen import canvas
-   
-
-from io import BytesIO
 
 # Locales (tu app)
+from . import analitica, avance, catalogo, gantt, informes, pdf, precios, reglas, revisiones
+from .exportacion import ExportarListadoMixin
+from .cotizaciones import ENTRADAS, ErrorVistaPrevia, generar_cotizacion, linea_cotizacion, vista_previa
+from .mediciones import (
+    ErrorSincronizacion, aplicar_envio, borrar_mediciones, cambios_desde, leer_token, registrar_mediciones
+)
+from .requerimientos import (
+    PREFIJO_CAMPO, ErrorRequerimientos, guardar_requerimientos, leer_cantidades
+)
 from .models import (
     Obra,
     Fase,
@@ -52,8 +55,6 @@ from .models import (
     Corrida, 
     Equipo,
     Cotizacion,
-    ReglaEquipoMaterial,
-    ReglaMaterialMaterial
 )
 from .forms import (
     ObraForm,
@@ -68,10 +69,29 @@ from .forms import (
     Pagina3Form
 )
 
-class ObraListView(ListView):
+logger = logging.getLogger(__name__)
+
+class ObraListView(ExportarListadoMixin, ListView):
     model = Obra
     template_name = 'project_app/obra_list.html'
     context_object_name = 'obras'
+    nombre_exportacion = 'obras'
+    columnas_exportacion = [
+        ('Proyecto', lambda obra: obra.nombre),
+        ('Descripción', lambda obra: obra.descripcion),
+        ('Ejecutado', lambda obra: obra.presupuesto_ejecutado),
+        ('Avance Total', lambda obra: obra.avance_total),
+    ]
+
+    def get_queryset(self):
+        # Avance y costo ejecutado se leen de ResumenObra en la misma consulta
+        # (LEFT JOIN), así la página cuesta una sola consulta sin importar el
+        # número de obras, fases o tareas.
+        cero = Value(Decimal('0'), output_field=DecimalField(max_digits=18, decimal_places=4))
+        return super().get_queryset().annotate(
+            presupuesto_ejecutado=Coalesce(F('resumen__costo_ejecutado'), cero),
+            avance_total=Coalesce(F('resumen__porcentaje_avance'), cero),
+        )
 
 class ObraCreateView(CreateView):
     model = Obra
@@ -90,8 +110,18 @@ class ObraDetailView(DetailView):
     template_name = 'project_app/obra_detail.html'
     context_object_name = 'obra'
 
+    def get_queryset(self):
+        # Solo obra y fases con sus resúmenes; el árbol de tareas se carga
+        # (en un número fijo de consultas) si algún fragmento no está en caché
+        return super().get_queryset().select_related(
+            'ingeniero_encargado', 'centro_servicio', 'resumen'
+        ).prefetch_related(
+            Prefetch('fase_set', queryset=Fase.objects.select_related('resumen'))
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['avance'] = avance.CalculadoraAvance(self.object)
         return context
 
 class FaseCreateView(CreateView):
@@ -107,93 +137,81 @@ class FaseCreateView(CreateView):
     def get_success_url(self):
         return reverse_lazy('obra-detail', kwargs={'pk': self.object.obra.pk})
 
-class TareaCreateView(CreateView):
-    model = Tarea
-    form_class = TareaForm
-    template_name = 'project_app/tarea_form.html'
-    
+class RequerimientosTareaMixin:
+    """
+    Tabla de cantidades por material de los formularios de tarea. Los
+    requerimientos se validan antes de guardar la tarea y se persisten como
+    un diff contra los existentes (ver app.requerimientos).
+    """
+
+    def get_requerimientos(self):
+        return {}
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        fase = get_object_or_404(Fase, pk=self.kwargs['pk'])
-        context['fase'] = fase
-        # Obtener todos los materiales disponibles para la tabla
-        context['materiales'] = Material.objects.all().order_by('nombre')
-        context['requerimientos'] = {} 
+        if self.request.method == 'POST':
+            # Formulario con errores: se conserva lo que el usuario escribió
+            requerimientos = {
+                int(clave[len(PREFIJO_CAMPO):]): valor
+                for clave, valor in self.request.POST.items()
+                if clave.startswith(PREFIJO_CAMPO) and clave[len(PREFIJO_CAMPO):].isdigit()
+            }
+        else:
+            requerimientos = self.get_requerimientos()
+        context['requerimientos'] = requerimientos
+        # Solo los materiales de la tarea; el resto se agrega con el buscador
+        context['materiales'] = Material.objects.filter(pk__in=requerimientos.keys()).order_by('nombre')
+        context['sistemas'] = Material.SISTEMA_CHOICES
+        context['familias_busqueda'] = catalogo.familias()
         return context
 
     def form_valid(self, form):
+        try:
+            cantidades = leer_cantidades(self.request.POST)
+        except ErrorRequerimientos as e:
+            for error in e.errores:
+                form.add_error(None, error)
+            return self.form_invalid(form)
+
         with transaction.atomic():
-            fase = get_object_or_404(Fase, pk=self.kwargs['pk'])
-            form.instance.fase = fase
             self.object = form.save()
+            guardar_requerimientos(self.object, cantidades)
+        return redirect('obra-detail', pk=self.object.fase.obra_id)
 
-            # Procesar los datos de la tabla de materiales
-            for key, value in self.request.POST.items():
-                if key.startswith('material-quantity-'):
-                    try:
-                        material_pk = int(key.split('-')[-1])
-                        cantidad = float(value) if value else 0
-                        
-                        if cantidad > 0:
-                            material = get_object_or_404(Material, pk=material_pk)
-                            RequerimientoMaterial.objects.create(
-                                tarea=self.object,
-                                material=material,
-                                cantidad_requerida=cantidad
-                            )
-                    except (ValueError, IndexError, Material.DoesNotExist):
-                        continue
-            
-            return redirect('obra-detail', pk=self.object.fase.obra.pk)
 
-class TareaUpdateView(UpdateView):
+class TareaCreateView(RequerimientosTareaMixin, CreateView):
     model = Tarea
-    # Cambiamos la clase del formulario para que incluya todos los campos de la Tarea
     form_class = TareaForm
     template_name = 'project_app/tarea_form.html'
 
+    def get_fase(self):
+        if not hasattr(self, '_fase'):
+            self._fase = get_object_or_404(Fase, pk=self.kwargs['pk'])
+        return self._fase
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        tarea = self.object
-        context['fase'] = tarea.fase
-        context['materiales'] = Material.objects.all().order_by('nombre')
-        
-        # Cargar las cantidades requeridas existentes para rellenar la tabla
-        requerimientos_actuales = {
-            req.material.pk: req.cantidad_requerida 
-            for req in tarea.requerimientomaterial_set.all()
-        }
-        context['requerimientos'] = requerimientos_actuales
+        context['fase'] = self.get_fase()
         return context
 
     def form_valid(self, form):
-        with transaction.atomic():
-            # 1. Guardar la información principal de la Tarea
-            self.object = form.save()
+        form.instance.fase = self.get_fase()
+        return super().form_valid(form)
 
-            # 2. Eliminar los requerimientos de material existentes
-            # Esto simplifica el proceso de actualización (se borra todo y se vuelve a crear)
-            RequerimientoMaterial.objects.filter(tarea=self.object).delete()
-            
-            # 3. Procesar los nuevos datos de la tabla de materiales (similar a TareaCreateView)
-            for key, value in self.request.POST.items():
-                if key.startswith('material-quantity-'):
-                    try:
-                        material_pk = int(key.split('-')[-1])
-                        # Usar float() para validar la entrada y permitir decimales
-                        cantidad = float(value) if value else 0
-                        
-                        if cantidad > 0:
-                            material = get_object_or_404(Material, pk=material_pk)
-                            RequerimientoMaterial.objects.create(
-                                tarea=self.object,
-                                material=material,
-                                cantidad_requerida=cantidad
-                            )
-                    except (ValueError, IndexError, Material.DoesNotExist):
-                        continue
-            
-            return redirect('obra-detail', pk=self.object.fase.obra.pk)
+class TareaUpdateView(RequerimientosTareaMixin, UpdateView):
+    model = Tarea
+    # Cambiamos la clase del formulario para que incluya todos los campos de la Tarea
+    form_class = TareaForm
+    template_name = 'project_app/tarea_form.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fase'] = self.object.fase
+        return context
+
+    def get_requerimientos(self):
+        # Cantidades requeridas existentes para rellenar la tabla
+        return dict(self.object.requerimientomaterial_set.values_list('material_id', 'cantidad_requerida'))
 
     def get_success_url(self):
         return reverse_lazy('obra-detail', kwargs={'pk': self.object.fase.obra.pk})
@@ -203,113 +221,267 @@ class ObraMedicionesView(DetailView):
     template_name = 'project_app/obra_mediciones.html'
     context_object_name = 'obra'
 
+    # Número de fechas visibles por defecto, máximo que se puede pedir y
+    # tareas por página
+    fechas_por_ventana = 10
+    max_fechas = 31
+    tareas_por_pagina = 20
+
+    def get_ventana(self, mediciones_obra):
+        """
+        Devuelve (fechas visibles, fecha de corte). La ventana se pide con
+        ?ultimas=N (últimas N fechas con mediciones) o con ?desde=&hasta=,
+        y nunca pasa de max_fechas columnas: con ?desde= se muestran las
+        primeras desde esa fecha y con solo ?hasta= las últimas hasta ella.
+        Todo lo medido antes de la fecha de corte se acumula en una columna.
+        """
+        desde = parse_date(self.request.GET.get('desde') or '')
+        hasta = parse_date(self.request.GET.get('hasta') or '')
+        fechas = mediciones_obra.values_list('fecha_medicion', flat=True).distinct()
+        if hasta:
+            fechas = fechas.filter(fecha_medicion__lte=hasta)
+
+        if desde:
+            fechas = list(fechas.filter(fecha_medicion__gte=desde).order_by('fecha_medicion')[:self.max_fechas])
+            return fechas, desde
+
+        if hasta:
+            ultimas = self.max_fechas
+        else:
+            try:
+                ultimas = int(self.request.GET.get('ultimas', self.fechas_por_ventana))
+            except ValueError:
+                ultimas = self.fechas_por_ventana
+        ultimas = min(max(ultimas, 1), self.max_fechas)
+        fechas = sorted(fechas.order_by('-fecha_medicion')[:ultimas])
+        return fechas, (fechas[0] if fechas else None)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        obra = self.get_object()
-
-        # Obtener todos los requerimientos de la obra
-        requerimientos = RequerimientoMaterial.objects.filter(tarea__fase__obra=obra).select_related('tarea', 'material', 'tarea__fase').order_by('tarea__fase', 'tarea')
+        obra = self.object
+        mediciones_obra = MedicionMaterial.objects.filter(tarea__fase__obra=obra)
+
+        # 1. Paginación por tarea (ordenadas por fase y tarea): cada página
+        # trae completas las filas de requerimientos de sus tareas
+        tarea_ids = (
+            RequerimientoMaterial.objects.filter(tarea__fase__obra=obra)
+            .order_by('tarea__fase', 'tarea')
+            .values_list('tarea', flat=True)
+            .distinct()
+        )
+        pagina = Paginator(tarea_ids, self.tareas_por_pagina).get_page(self.request.GET.get('page'))
+        tareas_pagina = list(pagina.object_list)
+
+        # 2. Ventana de fechas
+        fechas, corte = self.get_ventana(mediciones_obra)
+        posicion = {fecha: i for i, fecha in enumerate(fechas)}
+
+        mediciones_pagina = mediciones_obra.filter(tarea__in=tareas_pagina)
+        en_ventana = (
+            mediciones_pagina.filter(fecha_medicion__in=fechas)
+            .values('tarea', 'material', 'fecha_medicion')
+            .annotate(total=Sum('cantidad'))
+        )
+        antes = {}
+        if corte is not None:
+            antes = {
+                (m['tarea'], m['material']): m['total']
+                for m in mediciones_pagina.filter(fecha_medicion__lt=corte)
+                .values('tarea', 'material')
+                .annotate(total=Sum('cantidad'))
+            }
 
+        # 3. Estructura compacta: una lista de valores por fila, alineada con
+        # `fechas`, en lugar de diccionarios por fecha
+        requerimientos = (
+            RequerimientoMaterial.objects.filter(tarea__in=tareas_pagina)
+            .select_related('tarea', 'material', 'tarea__fase')
+            .order_by('tarea__fase', 'tarea')
+        )
+        filas = {}
         tabla_mediciones = []
-        fechas_medicion_set = set()
-
-        # Cargar las mediciones existentes en un diccionario para acceso rápido
-        mediciones_data = MedicionMaterial.objects.filter(tarea__fase__obra=obra).values('tarea', 'material', 'cantidad', 'fecha_medicion')
-        mediciones_dict = {}
-        for med in mediciones_data:
-            key = (med['tarea'], med['material'])
-            if key not in mediciones_dict:
-                mediciones_dict[key] = {}
-            fecha_str = med['fecha_medicion'].strftime('%Y-%m-%d')
-            mediciones_dict[key][fecha_str] = med['cantidad']
-            fechas_medicion_set.add(fecha_str)
-
-        # Crear la estructura de la tabla
         for req in requerimientos:
-            tarea_pk = req.tarea.pk
-            material_pk = req.material.pk
-            
-            mediciones_historicas = mediciones_dict.get((tarea_pk, material_pk), {})
-            
+            clave = (req.tarea_id, req.material_id)
             row = {
                 'fase_nombre': req.tarea.fase.nombre,
                 'tarea_nombre': req.tarea.nombre,
-                'tarea_pk': tarea_pk,
+                'tarea_pk': req.tarea_id,
                 'material_nombre': req.material.nombre,
                 'material_unidad': req.material.unidad,
-                'material_pk': material_pk,
+                'material_pk': req.material_id,
                 'cantidad_requerida': req.cantidad_requerida,
-                'mediciones': mediciones_historicas
+                'antes': antes.get(clave, 0),
+                'valores': [0] * len(fechas),
             }
+            filas[clave] = row
             tabla_mediciones.append(row)
 
-        fechas_medicion_list = sorted(list(fechas_medicion_set))
+        for med in en_ventana:
+            row = filas.get((med['tarea'], med['material']))
+            if row is not None:
+                row['valores'][posicion[med['fecha_medicion']]] = med['total']
 
         context['tabla_mediciones'] = tabla_mediciones
-        context['fechas_medicion'] = fechas_medicion_list
+        context['fechas_medicion'] = [fecha.strftime('%Y-%m-%d') for fecha in fechas]
+        context['fecha_corte'] = corte
+        context['page_obj'] = pagina
+        context['ventana'] = self.request.GET.copy()
+        context['ventana'].pop('page', None)
         return context
 
-    def post(self, request, *args, **kwargs):
-        print("Datos recibidos en el POST:", request.POST) # <-- LÍNEA PARA DEPURAR
+    def volver(self, obra):
+        # De vuelta a la misma ventana y página desde la que se envió el formulario
+        url = reverse('obra-mediciones', kwargs={'pk': obra.pk})
+        if self.request.GET:
+            url += '?' + self.request.GET.urlencode()
+        return redirect(url)
 
+    def post(self, request, *args, **kwargs):
         obra = self.get_object()
-        fecha_medicion = request.POST.get('fecha_medicion')
+        fecha_medicion = parse_date(request.POST.get('fecha_medicion') or '')
         if not fecha_medicion:
-            return redirect('obra-mediciones', pk=obra.pk)
-        
-        with transaction.atomic():
-            for key, value in request.POST.items():
-                if key.startswith('medicion-'):
-                    try:
-                        _, tarea_id, material_id = key.split('-')
-                        cantidad_str = value.replace(',', '.')  # Manejar comas si es necesario
-                        cantidad = Decimal(cantidad_str)
-
-                        if cantidad > 0:
-                            MedicionMaterial.objects.create(
-                                tarea_id=int(tarea_id),
-                                material_id=int(material_id),
-                                cantidad=cantidad,
-                                fecha_medicion=fecha_medicion
-                            )
-                            print(f"Medición guardada: Tarea={tarea_id}, Material={material_id}, Cantidad={cantidad}")
-                    except (ValueError, IndexError) as e:
-                        print(f"Error al procesar la clave '{key}': {e}")
-                        continue
+            messages.error(request, "Debe indicar una fecha de medición válida.")
+            return self.volver(obra)
+
+        # 1. Validar todas las entradas antes de escribir nada. Un campo vacío
+        # no cambia nada; 0 es una medición de 0 (como en la sincronización)
+        # y solo la casilla borrar-<tarea>-<material> elimina la del día
+        requeridos = set(
+            RequerimientoMaterial.objects.filter(tarea__fase__obra=obra)
+            .values_list('tarea_id', 'material_id')
+        )
+        cantidades = {}
+        borrar = set()
+        errores = []
+        for key, value in request.POST.items():
+            prefijo = key.split('-', 1)[0]
+            if prefijo not in ('medicion', 'borrar'):
+                continue
+            try:
+                _, tarea_id, material_id = key.split('-')
+                clave = (int(tarea_id), int(material_id))
+            except ValueError:
+                errores.append(f"Campo inválido: '{key}'")
+                continue
+            if clave not in requeridos:
+                errores.append(f"'{key}' no corresponde a un requerimiento de esta obra")
+                continue
+            if prefijo == 'borrar':
+                borrar.add(clave)
+                continue
+            if not value.strip():
+                continue
+            try:
+                cantidad = Decimal(value.replace(',', '.'))
+            except (ValueError, ArithmeticError):
+                errores.append(f"Valor inválido en '{key}': {value!r}")
+                continue
+            if not cantidad.is_finite() or cantidad < 0:
+                errores.append(f"Cantidad inválida en '{key}': {value!r}")
+            else:
+                cantidades[clave] = cantidad
+        for tarea_id, material_id in borrar & cantidades.keys():
+            errores.append(f"medicion-{tarea_id}-{material_id}: no se puede medir y borrar a la vez")
+
+        if errores:
+            logger.warning("Mediciones rechazadas para obra %s: %s", obra.pk, errores)
+            for error in errores:
+                messages.error(request, error)
+            return self.volver(obra)
+
+        # 2. Un solo INSERT ... ON CONFLICT: volver a enviar el mismo día
+        # reemplaza las cantidades de ese día en lugar de duplicarlas
+        with transaction.atomic(), avance.efectos_diferidos():
+            registrar_mediciones({
+                (tarea_id, material_id, fecha_medicion): cantidad
+                for (tarea_id, material_id), cantidad in cantidades.items()
+            })
+            borradas = borrar_mediciones({
+                (tarea_id, material_id, fecha_medicion) for tarea_id, material_id in borrar
+            })
 
-        return redirect('obra-mediciones', pk=obra.pk)
-        obra = self.get_object()
-        fecha_medicion = request.POST.get('fecha_medicion')
-        if not fecha_medicion:
-            return redirect('obra-mediciones', pk=obra.pk)
-        
-        with transaction.atomic():
-            for key, value in request.POST.items():
-                if key.startswith('medicion-'):
-                    try:
-                        # Extrae los IDs de la clave 'medicion-tarea_id-material_id'
-                        # El split devuelve una lista: ['medicion', 'tarea_id', 'material_id']
-                        # Usamos la desestructuración para asignar los valores directamente
-                        _, tarea_id, material_id = key.split('-')
-                        cantidad = Decimal(value)
+        logger.info(
+            "Obra %s: %d mediciones registradas y %d borradas para %s",
+            obra.pk, len(cantidades), borradas, fecha_medicion,
+        )
+        mensaje = f"{len(cantidades)} mediciones guardadas para el {fecha_medicion}."
+        if borradas:
+            mensaje += f" {borradas} eliminadas."
+        messages.success(request, mensaje)
+        return self.volver(obra)
+
+@require_http_methods(["GET", "POST"])
+@ensure_csrf_cookie
+def sincronizar_mediciones(request, pk):
+    """
+    Sincronización por deltas para la captura de mediciones en campo.
+
+    GET ?token=<token>: requerimientos y mediciones de la obra cambiados desde
+    el token (todo si no se envía), los ids eliminados y un token nuevo.
+    Con "completo": true el cliente reemplaza sus datos locales (primera
+    sincronización o token más viejo que mediciones.RETENCION).
+    POST {"token": ..., "mediciones": [{"clave", "tarea", "material",
+    "cantidad", "fecha_medicion"}, ...]}: aplica el lote (las claves ya
+    procesadas se ignoran) y responde con el resultado de cada item más los
+    cambios desde el token, en una sola ida y vuelta.
+
+    Las tabletas usan la misma sesión que la aplicación web: inician sesión
+    con un POST a la vista de login ('/') y conservan las cookies sessionid
+    y csrftoken. Cada GET de este endpoint renueva la cookie csrftoken, y el
+    POST la devuelve en la cabecera X-CSRFToken (protección CSRF estándar
+    de Django).
+    """
+    obra = get_object_or_404(Obra, pk=pk)
+    try:
+        if request.method == 'GET':
+            return JsonResponse(cambios_desde(obra, request.GET.get('token')))
 
-                        if cantidad > 0:
-                            MedicionMaterial.objects.create(
-                                tarea_id=int(tarea_id),
-                                material_id=int(material_id),
-                                cantidad=cantidad,
-                                fecha_medicion=fecha_medicion
-                            )
-                    except (ValueError, IndexError):
-                        # Ignora las claves que no tengan el formato correcto
-                        continue
+        try:
+            payload = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            raise ErrorSincronizacion("El cuerpo debe ser JSON válido.")
+        if not isinstance(payload, dict):
+            raise ErrorSincronizacion("El cuerpo debe ser un objeto JSON.")
+        token = payload.get('token')
+        # Se valida el token antes de escribir nada
+        leer_token(token)
+        resultados = aplicar_envio(obra, payload.get('mediciones', []))
+        logger.info(
+            "Obra %s: sincronización de %d mediciones (%d aplicadas)",
+            obra.pk, len(resultados), sum(r.get('estado') == 'aplicada' for r in resultados),
+        )
+        respuesta = cambios_desde(obra, token)
+        respuesta['resultados'] = resultados
+        return JsonResponse(respuesta)
+    except ErrorSincronizacion as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
 
-        return redirect('obra-mediciones', pk=obra.pk)
+@require_http_methods(["GET"])
+def buscar_materiales_view(request):
+    """
+    Autocompletado de materiales: ?q=texto&familia=&sistema=&page=N.
+    Resultados paginados en JSON para los formularios de tarea y cotización.
+    """
+    materiales = catalogo.buscar_materiales(
+        request.GET.get('q', '').strip(),
+        familia=request.GET.get('familia') or None,
+        sistema=request.GET.get('sistema') or None,
+    )
+    return JsonResponse(catalogo.pagina_de_resultados(materiales, request.GET.get('page')))
 
-class MaterialListView(ListView):
+class MaterialListView(ExportarListadoMixin, ListView):
     model = Material
     template_name = 'project_app/material_list.html'
     context_object_name = 'materiales'
+    nombre_exportacion = 'materiales'
+    columnas_exportacion = [
+        ('Código', lambda material: material.codigo),
+        ('Nombre', lambda material: material.nombre),
+        ('Unidad', lambda material: material.unidad),
+        ('Categoría', lambda material: material.familia),
+        ('Stock', lambda material: material.stock),
+        ('Precio', lambda material: material.costo_unitario),
+    ]
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -330,15 +502,19 @@ class MaterialListView(ListView):
         # Actualización de costos
         if 'update_costs' in request.POST:
             with transaction.atomic():
+                materiales_actualizados = []
                 for key, value in request.POST.items():
                     if key.startswith('cost-'):
                         try:
                             material_pk = int(key.split('-')[-1])
                             costo = float(value.replace(',', '.')) if value else 0.0
                             if costo >= 0:
-                                Material.objects.filter(pk=material_pk).update(costo_unitario=costo)
+                                if Material.objects.filter(pk=material_pk).update(costo_unitario=costo):
+                                    materiales_actualizados.append(material_pk)
                         except (ValueError, IndexError):
                             continue
+                # .update() no emite señales: refrescamos los resúmenes de avance aquí
+                avance.recalcular_por_materiales(materiales_actualizados)
 
         # Actualización de stock
         if 'update_stock' in request.POST:
@@ -378,91 +554,69 @@ class PersonalListView(ListView):
 class CustomLoginView(LoginView):
     template_name = 'project_app/login.html'
 
-def gantt_data_view(request, pk):
-    obra = get_object_or_404(Obra, pk=pk)
-    
-    # 1. Obtener y ordenar las tareas por fecha de inicio
-    # (ya lo tienes correctamente)
-    tareas = Tarea.objects.filter(fase__obra=obra).order_by('fecha_inicio', 'fase__id',)
-    
-    # Obtener las fases de la obra, el orden inicial no es crítico aquí
-    fases_obra = Fase.objects.filter(obra=obra).order_by('id')
-    
-    # Lista para almacenar los objetos del diagrama de Gantt
-    gantt_data_fases = [] # Usaremos una lista temporal para fases
-    gantt_data_tareas = [] # Usaremos una lista temporal para tareas
-
-    tareas_por_fase = {}
-    for tarea in tareas:
-        fase_id = tarea.fase.id
-        if fase_id not in tareas_por_fase:
-            tareas_por_fase[fase_id] = []
-        tareas_por_fase[fase_id].append(tarea)
-
-    for fase in fases_obra:
-        tareas_en_fase = tareas_por_fase.get(fase.id, [])
-        
-        if not tareas_en_fase:
-            continue
+def _version_gantt(request, pk):
+    """Sello de versión del Gantt de la obra (ver app.gantt.version), una vez por petición."""
+    if not hasattr(request, '_version_gantt'):
+        request._version_gantt = gantt.version(pk)
+    return request._version_gantt
 
-        # Calcular la fecha de inicio y fin de la FASE
-        fecha_inicio_fase = min(t.fecha_inicio for t in tareas_en_fase)
-        fecha_fin_fase = max(t.fecha_fin_estimada for t in tareas_en_fase)
-
-        total_avance = sum(t.porcentaje_avance for t in tareas_en_fase)
-        promedio_avance = total_avance / len(tareas_en_fase) if tareas_en_fase else Decimal('0.00')
-
-        # 1. Objeto de la FASE (el padre)
-        gantt_data_fases.append({
-            'id': f'fase-{fase.id}',
-            'name': fase.nombre,
-            'start': fecha_inicio_fase.strftime('%Y-%m-%d'),
-            'end': fecha_fin_fase.strftime('%Y-%m-%d'), 
-            'progress': float(promedio_avance),
-            'dependencies': '',
-            'custom_class': 'gantt-phase',
-            'fecha_inicio_orden': fecha_inicio_fase # Clave temporal para ordenar
-        })
+def _gantt_etag(request, pk):
+    version = _version_gantt(request, pk)
+    if version['ultima'] is None:
+        return None
+    return f"gantt-{pk}-{version['fases']}-{version['ultima'].timestamp():.6f}"
 
-        # 2. Objetos de las Tareas (los hijos)
-        for tarea in tareas_en_fase:
-            start = tarea.fecha_inicio.strftime('%Y-%m-%d')
-            end = tarea.fecha_fin_estimada.strftime('%Y-%m-%d')
-            
-            gantt_data_tareas.append({
-                'id': f'tarea-{tarea.id}',
-                'name': tarea.nombre,
-                'start': start,
-                'end': end,
-                'progress': float(tarea.porcentaje_avance),
-                'dependencies': f'fase-{tarea.fase.id}',
-            })
+def _gantt_svg_etag(request, pk):
+    etag = _gantt_etag(request, pk)
+    return etag and f"{etag}-svg-v{gantt.VERSION_DISENO}"
 
-    # 3. ORDENAR CRONOLÓGICAMENTE las fases
-    # Las fases se ordenan por la 'fecha_inicio_orden' temporal
-    gantt_data_fases.sort(key=lambda x: x['fecha_inicio_orden'])
-    
-    # 4. Combinar las fases y las tareas.
-    # El diagrama de Gantt (como el JSGanttImproved) generalmente espera 
-    # que la tarea vaya inmediatamente después de su fase padre en la lista 
-    # para asegurar la correcta anidación en la interfaz.
+def _gantt_last_modified(request, pk):
+    return _version_gantt(request, pk)['ultima']
+
+@condition(etag_func=_gantt_etag, last_modified_func=_gantt_last_modified)
+def gantt_data_view(request, pk):
+    get_object_or_404(Obra.objects.only('pk'), pk=pk)
+    # Cada fase (el padre) va seguida inmediatamente de sus tareas, como
+    # espera el diagrama de Gantt para anidarlas correctamente
     gantt_data_final = []
-    
-    # Volvemos a iterar sobre las fases ya ORDENADAS
-    for fase_data in gantt_data_fases:
-        # Eliminar la clave temporal de ordenamiento antes de añadir al JSON
-        fecha_inicio_orden = fase_data.pop('fecha_inicio_orden')
-        gantt_data_final.append(fase_data)
-
-        # Buscar y añadir las tareas que dependen de esta fase
-        fase_id = fase_data['id']
-        tareas_de_esta_fase = [t for t in gantt_data_tareas if t['dependencies'] == fase_id]
-        
-        # Las tareas ya estaban ordenadas cronológicamente en la consulta inicial
-        gantt_data_final.extend(tareas_de_esta_fase)
-            
+    for fila in gantt.filas(pk):
+        elemento = {
+            'id': fila['id'],
+            'name': fila['nombre'],
+            'start': fila['inicio'].strftime('%Y-%m-%d'),
+            'end': fila['fin'].strftime('%Y-%m-%d'),
+            'progress': fila['avance'],
+            'dependencies': fila['padre'] or '',
+        }
+        if fila['tipo'] == 'fase':
+            elemento['custom_class'] = 'gantt-phase'
+        gantt_data_final.append(elemento)
+
     return JsonResponse(gantt_data_final, safe=False)
 
+@condition(etag_func=_gantt_svg_etag, last_modified_func=_gantt_last_modified)
+def gantt_svg_view(request, pk):
+    """Gantt de la obra como SVG, dibujado en el servidor y guardado en caché (ver app.gantt)."""
+    obra = get_object_or_404(Obra.objects.only('pk', 'nombre'), pk=pk)
+    archivo, tamano = gantt.abrir_svg(pk, _version_gantt(request, pk))
+    respuesta = FileResponse(archivo, content_type='image/svg+xml')
+    respuesta['Content-Length'] = tamano
+    disposicion = 'attachment' if request.GET.get('descargar') else 'inline'
+    respuesta['Content-Disposition'] = f'{disposicion}; filename="gantt-{slugify(obra.nombre) or pk}.svg"'
+    return respuesta
+
+@require_http_methods(["GET"])
+def informe_obra(request, pk):
+    """Informe de estado de la obra en PDF: resumen, fases y Gantt."""
+    obra = get_object_or_404(
+        Obra.objects.select_related('ingeniero_encargado', 'resumen'), pk=pk
+    )
+    respuesta = HttpResponse(informes.renderizar_informe_obra(obra), content_type='application/pdf')
+    respuesta['Content-Disposition'] = (
+        f'inline; filename="informe-{slugify(obra.nombre) or pk}-{timezone.localdate():%Y%m%d}.pdf"'
+    )
+    return respuesta
+
 def gantt_chart_view(request, pk):
     obra = get_object_or_404(Obra, pk=pk)
     return render(request, 'project_app/gantt_chart.html', {
@@ -586,6 +740,7 @@ class ObraWizard(SessionWizardView):
             return redirect('obra-list')
 
 # --- Wizard para el cálculo de Cotizaciones ---
+SESION_VISTA_PREVIA = 'corrida_vista_previa'
 FORMS = [("1", Pagina1Form), ("2", Pagina2Form), ("3", Pagina3Form)]
 TEMPLATES = {
     "1": "project_app/corrida1.html",
@@ -597,6 +752,21 @@ class CorridaWizard(SessionWizardView):
     def get_template_names(self):
         return [TEMPLATES[self.steps.current]]
 
+    def get_context_data(self, form, **kwargs):
+        context = super().get_context_data(form=form, **kwargs)
+        # La vista previa de los pasos 2 y 3 incluye lo cargado en el otro paso
+        if self.steps.current in ('2', '3'):
+            otro_paso = '3' if self.steps.current == '2' else '2'
+            grupo = 'tuberias' if otro_paso == '3' else 'equipos'
+            datos = self.get_cleaned_data_for_step(otro_paso) or {}
+            context['vista_previa'] = {
+                'url': str(reverse_lazy('corrida-vista-previa')),
+                'paso': self.steps.current,
+                'grupo': 'equipos' if self.steps.current == '2' else 'tuberias',
+                'otras_entradas': {grupo: {k: v for k, v in datos.items() if v}},
+            }
+        return context
+
     def done(self, form_list, **kwargs):
         form_data = [form.cleaned_data for form in form_list]
         
@@ -637,14 +807,11 @@ class CorridaWizard(SessionWizardView):
 
         # 4. Finaliza el guardado con correlativo anual reiniciable
         with transaction.atomic():
-            ahora = datetime.now()
-            año_actual = ahora.strftime("%Y")
+            año_actual = datetime.now().year
             
-            # Calculamos el número correlativo contando registros de este año
-            # Nota: Se asume que el modelo tiene un campo de fecha 'created_at' o similar.
-            # Si no lo tiene, filtramos por el campo 'correlativo' que contenga el año.
-            conteo_año = Corrida.objects.filter(correlativo__contains=f"-{año_actual}-").count()
-            nuevo_numero = conteo_año + 1
+            # Siguiente número del año: MAX indexado sobre (anio, numero)
+            ultimo_numero = Corrida.objects.filter(anio=año_actual).aggregate(ultimo=Max('numero'))['ultimo']
+            nuevo_numero = (ultimo_numero or 0) + 1
             
             # Formateamos el nombre (snake_case)
             nombre_slug = slugify(nombre).replace('-', '_')
@@ -656,340 +823,123 @@ class CorridaWizard(SessionWizardView):
             Corrida.objects.create(
                 nombre=nombre, 
                 datos=datos_finales,
-                correlativo=correlativo_final
+                correlativo=correlativo_final,
+                anio=año_actual,
+                numero=nuevo_numero,
             )
 
         return redirect('corrida-list')
 
-class CorridaListView(ListView):
+@require_http_methods(["POST"])
+def vista_previa_corrida(request):
+    """
+    Vista previa del asistente de corridas. Recibe {"equipos": {modelo: n},
+    "tuberias": {codigo: n}} y responde con los materiales expandidos, los
+    subtotales por familia y el total. La sesión guarda el último cálculo
+    para recalcular solo lo que cambió.
+    """
+    try:
+        entradas = json.loads(request.body or b'{}')
+        respuesta, estado = vista_previa(entradas, request.session.get(SESION_VISTA_PREVIA))
+    except (json.JSONDecodeError, ErrorVistaPrevia) as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    except reglas.ErrorReglas as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+    request.session[SESION_VISTA_PREVIA] = estado
+    return JsonResponse(respuesta)
+
+class CorridaListView(ExportarListadoMixin, ListView):
     model = Corrida
     template_name = 'project_app/corrida_list.html'
     context_object_name = 'corridas'
-
-def aplicar_reglas_equipo_material(equipos_dict):
-    """Aplica las reglas de equipo a material y retorna un diccionario de materiales."""
-    materiales_requeridos = defaultdict(Decimal)
-
-    codigos_equipo = equipos_dict.keys()
-    reglas = ReglaEquipoMaterial.objects.filter(
-        equipo_origen__modelo__in=codigos_equipo
-    ).select_related('equipo_origen')
-
-    for regla in reglas:
-        cantidad_equipo = equipos_dict.get(regla.equipo_origen.modelo)
-        if cantidad_equipo is not None:
-            for item in regla.materiales_requeridos:
-                codigo_material = item['codigo']
-                cantidad_por_equipo = Decimal(str(item['cantidad']))
-                cantidad_total = cantidad_por_equipo * Decimal(str(cantidad_equipo))
-                materiales_requeridos[codigo_material] += cantidad_total
-
-    return materiales_requeridos
-
-def aplicar_reglas_material_material(materiales_base_dict):
-    materiales_requeridos = defaultdict(Decimal, {k: Decimal(str(v)) for k, v in materiales_base_dict.items()})
-    materiales_pendientes = set(materiales_requeridos.keys())
-
-    while materiales_pendientes:
-        material_origen_codigo = materiales_pendientes.pop()
-        reglas = ReglaMaterialMaterial.objects.filter(
-            material_origen__codigo=material_origen_codigo
-        )
-
-        for regla in reglas:
-            cantidad_origen = materiales_requeridos[material_origen_codigo]
-            for item in regla.materiales_requeridos:
-                codigo_material_req = item['codigo']
-                cantidad_a_agregar = Decimal(str(item['cantidad'])) * cantidad_origen
-                if cantidad_a_agregar > 0:
-                    if codigo_material_req not in materiales_requeridos:
-                        materiales_pendientes.add(codigo_material_req)
-                    materiales_requeridos[codigo_material_req] += cantidad_a_agregar
-
-    return {k: float(v) for k, v in materiales_requeridos.items() if v > 0}
-
-def obtener_costos_materiales(materiales_dict):
-    """
-    Obtiene los costos unitarios de los materiales requeridos.
-    Retorna un diccionario mapeando código de material a su costo unitario.
-    """
-    codigos_materiales = materiales_dict.keys()
-    
-    # Realiza una sola consulta para obtener los costos de todos los materiales
-    # Asume que 'Material' tiene un campo 'codigo' que coincide con las claves del JSON
-    materiales_info = Material.objects.filter(
-        codigo__in=codigos_materiales
-    ).values('codigo', 'costo_unitario')
-    
-    costos_map = {
-        item['codigo']: Decimal(str(item['costo_unitario'])) 
-        for item in materiales_info
-    }
-    return costos_map
+    nombre_exportacion = 'corridas'
+    columnas_exportacion = [
+        ('Correlativo', lambda corrida: corrida.correlativo),
+        ('Proyecto', lambda corrida: corrida.nombre),
+        ('Descripción', lambda corrida: (corrida.datos or {}).get('descripcion')),
+    ]
 
 @require_http_methods(["GET"])
 def CotizacionCreateView(request, corrida_id):
     """
     Toma una Corrida por su ID, aplica las reglas y genera una Cotizacion
-    con un correlativo anual reiniciable.
+    con un correlativo anual reiniciable (ver app.cotizaciones). Si los datos
+    de la corrida, las reglas y los precios no cambiaron desde la última vez,
+    devuelve la cotización guardada sin recalcularla.
     """
     try:
         corrida = get_object_or_404(Corrida, id=corrida_id)
     except Exception as e:
         return JsonResponse({"error": f"Corrida no encontrada o error: {e}"}, status=404)
 
-    # 1. Obtener los datos de la Corrida
-    datos_corrida = corrida.datos
-    
-    materiales_totales = defaultdict(Decimal, {
-        k: Decimal(str(v)) for k, v in datos_corrida.get('tuberias', {}).items()
-    })
-    
-    # 2. Aplicar Reglas Equipo a Material
-    equipos_corrida = datos_corrida.get('equipos', {})
-    if equipos_corrida:
-        materiales_por_equipo = aplicar_reglas_equipo_material(equipos_corrida)
-        for codigo, cantidad in materiales_por_equipo.items():
-            materiales_totales[codigo] += cantidad
-
-    # 3. Aplicar Reglas Material a Material
-    materiales_requeridos_con_decimales = aplicar_reglas_material_material(materiales_totales)
-
-    # 4. Obtener Costos Unitarios
-    costos_unitarios = obtener_costos_materiales(materiales_requeridos_con_decimales)
-    
-    utilidad = 0.30  # 30% de utilidad
-    materiales_finales = {}
-    for codigo, cantidad_dec in materiales_requeridos_con_decimales.items():
-        costo_unitario = costos_unitarios.get(codigo, Decimal('0.00'))
-        materiales_finales[codigo] = {
-            'cantidad': float(cantidad_dec),
-            'costo_unitario': float(costo_unitario)*(1 + utilidad)
-        }
-
-    # 5. Preparar el JSON de salida
-    datos_cotizacion = {
-        'cliente': datos_corrida.get('cliente', ''),
-        'direccion_proyecto': datos_corrida.get('direccion_proyecto', ''),
-        'descripcion': datos_corrida.get('descripcion', ''),
-        'ingeniero_encargado': datos_corrida.get('ingeniero_encargado', ''),
-        'materiales': materiales_finales
-    }
-
     try:
-        with transaction.atomic():
-            # 1. Intentamos obtener una cotización existente para esta corrida
-            cotizacion_existente = Cotizacion.objects.filter(corrida=corrida).first()
-
-            if cotizacion_existente:
-                # Si ya existe, mantenemos su correlativo
-                correlativo_final = cotizacion_existente.correlativo
-            else:
-                # 2. Si es nueva, generamos el correlativo siguiendo la lógica anual
-                ahora = datetime.now()
-                año_actual = ahora.strftime("%Y")
-                
-                ultimo_ref = Cotizacion.objects.filter(
-                    correlativo__contains=f"-{año_actual}-"
-                ).order_by('-correlativo').first()
-
-                if ultimo_ref and ultimo_ref.correlativo:
-                    try:
-                        partes = ultimo_ref.correlativo.split('-')
-                        nuevo_numero = int(partes[4]) + 1
-                    except (IndexError, ValueError):
-                        nuevo_numero = Cotizacion.objects.filter(correlativo__contains=f"-{año_actual}-").count() + 1
-                else:
-                    nuevo_numero = 1
-                
-                nombre_slug = slugify(corrida.nombre).replace('-', '_')
-                correlativo_final = f"COT-{año_actual}-GS-I-{nuevo_numero:03d}-{nombre_slug}"
-
-            # 3. Guardamos
-            cotizacion, created = Cotizacion.objects.update_or_create(
-                corrida=corrida,
-                defaults={
-                    'nombre': corrida.nombre,
-                    'correlativo': correlativo_final,
-                    'datos': datos_cotizacion,
-                }
-            )
-        
-        return redirect('cotizacion-list')
-    
+        cotizacion, cambios = generar_cotizacion(corrida)
+    except reglas.ErrorReglas as e:
+        logger.error("Corrida %s: %s", corrida.pk, e)
+        return JsonResponse({"error": str(e)}, status=500)
     except Exception as e:
         return JsonResponse({
             "status": "error",
             "message": f"Error al generar la Cotización: {e}"
         }, status=500)
-    
-class CotizacionListView(ListView):
+
+    if cambios is None:
+        messages.success(request, f"Cotización {cotizacion.correlativo} generada.")
+    elif not cambios:
+        messages.info(request, f"Cotización {cotizacion.correlativo} sin cambios: se muestra la ya generada.")
+    else:
+        verbo = "cambió" if len(cambios) == 1 else "cambiaron"
+        messages.info(request, (
+            f"Cotización {cotizacion.correlativo} regenerada porque {verbo} "
+            + ", ".join(ENTRADAS[campo] for campo in cambios) + "."
+        ))
+    return redirect('cotizacion-list')
+
+class CotizacionListView(ExportarListadoMixin, ListView):
     model = Cotizacion
     template_name = 'project_app/cotizacion_list.html'
     context_object_name = 'cotizaciones'
-
-class NumberedCanvas(canvas.Canvas):
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
-
-    def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.draw_page_number(num_pages)
-            canvas.Canvas.showPage(self)
-        canvas.Canvas.save(self)
-
-    def draw_page_number(self, page_count):
-        self.setFont("Helvetica", 9)
-        # Dibujar en la parte inferior derecha
-        text = f"Página {self._pageNumber} de {page_count}"
-        self.drawRightString(550, 30, text)
-
-def detalle_cotizacion(request, pk):
-    cotizacion = get_object_or_404(Cotizacion, pk=pk)
-    datos = cotizacion.datos
-
-    buffer = BytesIO()
-    
-    doc = SimpleDocTemplate(
-        buffer, 
-        pagesize=letter, 
-        leftMargin=50, 
-        rightMargin=50, 
-        topMargin=160, 
-        bottomMargin=50
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    style_material = ParagraphStyle('MatStyle', parent=styles['Normal'], fontSize=9, leading=10)
-    style_familia = ParagraphStyle('FamStyle', parent=styles['Normal'], fontSize=10, fontName='Helvetica-Bold')
-
-    def membrete(canvas, doc):
-        canvas.saveState()
-        logo_path = f"{settings.BASE_DIR}/app/static/img/logo.jpeg"
-        try:
-            canvas.drawImage(logo_path, 50, 710, width=100, height=50, preserveAspectRatio=True, mask='auto')
-        except:
-            pass 
-
-        canvas.setFont("Helvetica", 7)
-        fecha_gen = cotizacion.fecha_generacion.strftime('%d/%m/%Y')
-        canvas.drawRightString(550, 755, f"Fecha generación: {fecha_gen}")
-        fecha_mod = cotizacion.fecha_modificacion.strftime('%d/%m/%Y')
-        canvas.drawRightString(550, 745, f"Fecha modificación: {fecha_mod}")
-        
-        y_pos = 690
-        canvas.setFont("Helvetica-Bold", 10)
-        canvas.drawString(60, y_pos, f"Cotización: {cotizacion.nombre}")
-        y_pos -= 15
-        canvas.setFont("Helvetica", 10)
-        canvas.drawString(60, y_pos, f"Cliente: {datos.get('cliente', 'N/A')}")
-        y_pos -= 15
-        canvas.drawString(60, y_pos, f"Dirección del Proyecto: {datos.get('direccion_proyecto', 'N/A')}")
-        y_pos -= 15
-        canvas.drawString(60, y_pos, f"Ingeniero Encargado: {datos.get('ingeniero_encargado', 'N/A')}")
-        canvas.restoreState()
-
-    # --- PROCESAMIENTO DE DATOS ---
-    materiales_json = datos.get('materiales', {})
-    codigos_materiales = list(materiales_json.keys())
-    materiales_objs = Material.objects.filter(codigo__in=codigos_materiales)
-    materiales_dict = {m.codigo: m for m in materiales_objs}
-
-    materiales_por_familia = defaultdict(list)
-    for codigo, info in materiales_json.items():
-        obj = materiales_dict.get(codigo)
-        familia_nombre = obj.familia if obj else "OTRO"
-        materiales_por_familia[familia_nombre].append({
-            'codigo': codigo,
-            'nombre': obj.nombre if obj else "Desconocido",
-            'cantidad': float(info.get('cantidad', 0)),
-            'costo': float(info.get('costo_unitario', 0))
-        })
-
-    # --- LÓGICA DE ORDENAMIENTO PERSONALIZADO ---
-    # Definimos el orden de las familias (en minúsculas para comparar)
-    orden_prioridad = ['tuberia', 'anclaje', 'electricidad', 'drenaje']
-    
-    def prioridad_familia(nombre_familia):
-        nombre_normalizado = nombre_familia.lower()
-        if nombre_normalizado in orden_prioridad:
-            return orden_prioridad.index(nombre_normalizado)
-        return len(orden_prioridad) # Las que no están en la lista van al final
-
-    familias_presentes = sorted(materiales_por_familia.keys(), key=prioridad_familia)
-
-    # --- CONSTRUCCIÓN DE LA TABLA ---
-    data = [["Código", "Material", "Cantidad", "Costo Unitario ($)", "Precio ($)"]]
-    gran_total = 0
-
-    for familia in familias_presentes:
-        # Fila de Título de Familia
-        data.append(["", Paragraph(familia.upper(), style_familia), "", "", ""])
-        
-        # Ordenar materiales internamente por código
-        lista_materiales = sorted(materiales_por_familia[familia], key=lambda x: x['codigo'])
-        
-        subtotal_familia = 0
-        for mat in lista_materiales:
-            precio_linea = mat['cantidad'] * mat['costo']
-            subtotal_familia += precio_linea
-            
-            data.append([
-                mat['codigo'],
-                Paragraph(mat['nombre'], style_material),
-                f"{mat['cantidad']}",
-                f"{mat['costo']:.2f}",
-                f"{precio_linea:.2f}"
-            ])
-        
-        # Fila de Subtotal
-        data.append(["", "", "", f"SUBTOTAL {familia.upper()}", f"{subtotal_familia:.2f}"])
-        gran_total += subtotal_familia
-
-    # Espacio y Fila de Total General
-    data.append(["", "", "", "", ""]) # Separador visual
-    data.append(["", "", "", "TOTAL GENERAL", f"{gran_total:.2f}"])
-
-    # --- ESTILOS ---
-    col_widths = [70, 250, 60, 80, 80]
-    table = Table(data, colWidths=col_widths, repeatRows=1)
-    
-    t_style = [
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
-        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+    nombre_exportacion = 'cotizaciones'
+    columnas_exportacion = [
+        ('Correlativo', lambda cotizacion: cotizacion.correlativo),
+        ('Proyecto', lambda cotizacion: cotizacion.nombre),
+        ('Descripción', lambda cotizacion: revisiones.campo(cotizacion, 'descripcion')),
     ]
 
-    for i, row in enumerate(data):
-        # Estilo para las filas de Familia (la segunda columna tiene el Paragraph)
-        if row[1] and isinstance(row[1], Paragraph) and row[1].getPlainText() in [f.upper() for f in familias_presentes]:
-            t_style.append(('BACKGROUND', (0, i), (-1, i), colors.lightgrey))
-        
-        # Estilo para Subtotales y Total
-        if "SUBTOTAL" in str(row[3]) or "TOTAL GENERAL" in str(row[3]):
-            t_style.append(('FONTNAME', (3, i), (4, i), 'Helvetica-Bold'))
-            t_style.append(('LINEABOVE', (3, i), (4, i), 0.5, colors.black))
-
-    table.setStyle(TableStyle(t_style))
-    elements.append(table)
+    def get_queryset(self):
+        # Las revisiones toman la descripción de su base
+        return super().get_queryset().select_related('revision_de')
 
-    doc.build(elements, onFirstPage=membrete, onLaterPages=membrete, canvasmaker=NumberedCanvas)
+@require_http_methods(["GET"])
+def analitica_cotizaciones(request):
+    """
+    Equipos y materiales más cotizados, valor cotizado por mes y tasa de
+    conversión a obra en el rango ?desde=AAAA-MM&hasta=AAAA-MM (ver app.analitica).
+    """
+    try:
+        desde = analitica.leer_mes(request.GET.get('desde'))
+        hasta = analitica.leer_mes(request.GET.get('hasta'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        desde = hasta = None
+    return render(request, 'project_app/analitica_cotizaciones.html', {
+        'informe': analitica.informe(desde, hasta),
+        'desde': desde,
+        'hasta': hasta,
+    })
 
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
+def detalle_cotizacion(request, pk):
+    cotizacion = get_object_or_404(Cotizacion.objects.select_related('revision_de'), pk=pk)
+    # El PDF se genera una vez por versión de la cotización (ver app.pdf)
+    archivo, tamano, etag = pdf.abrir_cotizacion(cotizacion)
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        archivo.close()
+        return no_modificado
+
+    response = FileResponse(archivo, content_type='application/pdf')
+    response['Content-Length'] = tamano
+    response['ETag'] = etag
     response['Content-Disposition'] = f'inline; filename="Cotizacion_{cotizacion.id}.pdf"'
     return response
 
@@ -999,12 +949,16 @@ class CotizacionUpdateView(UpdateView):
     template_name = 'project_app/cotizacion_edit_form.html'
     context_object_name = 'cotizacion'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('revision_de')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         cotizacion = self.object
+        documento = cotizacion.documento
         
         # 1. Obtener los códigos de los materiales que YA están en la cotización
-        materiales_actuales_dict = cotizacion.datos.get('materiales', {})
+        materiales_actuales_dict = documento.get('materiales', {})
         codigos_en_uso = materiales_actuales_dict.keys()
         
         # 2. Filtrar familias solo de esos materiales específicos
@@ -1013,76 +967,110 @@ class CotizacionUpdateView(UpdateView):
         ).values_list('familia', flat=True).distinct()
         
         context['familias'] = sorted(list(filter(None, familias_en_uso)))
-        context['todos_los_materiales'] = Material.objects.all().order_by('nombre')
+        # Utilidad (%) con que se guardó cada familia; 30 si no se registró
+        context['utilidades'] = {
+            familia: round(utilidad * 100, 2)
+            for familia, utilidad in documento.get('utilidades', {}).items()
+        }
+        # Solo los materiales de la cotización; el resto se agrega con el buscador
+        context['materiales_seleccionados'] = Material.objects.filter(
+            codigo__in=codigos_en_uso
+        ).order_by('nombre')
+        context['sistemas'] = Material.SISTEMA_CHOICES
+        context['familias_busqueda'] = catalogo.familias()
         context['materiales_actuales'] = materiales_actuales_dict
+        # Historial: qué cambió cada revisión, leído de su delta
+        context['revisiones'] = [
+            {'cotizacion': c, 'resumen': revisiones.resumen_delta(c.delta) if c.revision_de_id else None}
+            for c in revisiones.familia(cotizacion)
+        ]
         return context
 
     def form_valid(self, form):
         original = self.get_object()
         nuevo_nombre = form.cleaned_data.get('nombre', original.nombre)
 
-        # Lógica de utilidades dinámicas por familia desde el POST
+        # Utilidades por familia desde el POST, en puntos básicos (30% = 3000)
+        # (vacía o inválida: la de por defecto)
         utilidades_por_familia = {}
         for key, value in self.request.POST.items():
             if key.startswith('utilidad-'):
                 familia_nome = key.replace('utilidad-', '')
+                utilidades_por_familia[familia_nome] = precios.UTILIDAD_POR_DEFECTO
                 try:
-                    utilidades_por_familia[familia_nome] = float(value) / 100
-                except ValueError:
-                    utilidades_por_familia[familia_nome] = 0.30
+                    porcentaje = Decimal(value.replace(',', '.'))
+                except (ValueError, ArithmeticError):
+                    continue
+                if porcentaje.is_finite():
+                    utilidades_por_familia[familia_nome] = precios.porcentaje_a_puntos_basicos(porcentaje)
 
-        # Procesar nuevos materiales y asignar su utilidad correspondiente
-        nuevos_materiales = {}
+        # Cantidades de materiales del POST
+        cantidades = {}
         for key, value in self.request.POST.items():
             if key.startswith('material-quantity-'):
                 try:
-                    codigo_mat = key.replace('material-quantity-', '')
-                    cantidad = float(value) if value else 0
-                    if cantidad > 0:
-                        mat_obj = get_object_or_404(Material, codigo=codigo_mat)
-                        # Se aplica la utilidad capturada del formulario para su familia
-                        utilidad_aplicar = utilidades_por_familia.get(mat_obj.familia, 0.30)
-                        
-                        nuevos_materiales[codigo_mat] = {
-                            'cantidad': cantidad,
-                            'costo_unitario': float(mat_obj.costo_unitario) * (1 + utilidad_aplicar)
-                        }
-                except (ValueError, Material.DoesNotExist):
+                    cantidad = Decimal(value.replace(',', '.') or '0')
+                except (ValueError, ArithmeticError):
                     continue
+                if cantidad.is_finite() and cantidad > 0:
+                    cantidades[key.replace('material-quantity-', '')] = cantidad
 
-        # Lógica de creación de revisión (mantenida de tu código original)
-        m = re.match(r'^(.*?)(?:_rev_(\d+))?$', original.correlativo)
-        base_correlativo = m.group(1) if m else original.correlativo
-        correlativos_existentes = Cotizacion.objects.filter(correlativo__startswith=base_correlativo).values_list('correlativo', flat=True)
-        max_rev = 0
-        for c in correlativos_existentes:
-            mm = re.search(r'_rev_(\d+)$', c)
-            if mm:
-                try:
-                    max_rev = max(max_rev, int(mm.group(1)))
-                except ValueError: continue
-
-        nuevo_correlativo = f"{base_correlativo}_rev_{max_rev + 1}"
-
-        Cotizacion.objects.create(
-            corrida=original.corrida,
-            nombre=nuevo_nombre,
-            correlativo=nuevo_correlativo,
-            datos={'cliente': original.datos.get('cliente'), 
-                   'ingeniero_encargado': original.datos.get('ingeniero_encargado'),
-                   'direccion_proyecto': original.datos.get('direccion_proyecto'),
-                   'descripcion': original.datos.get('descripcion'),
-                   'materiales': nuevos_materiales}
-        )
+        # Precio con la utilidad de su familia, en centavos (ver app.precios)
+        nuevos_materiales = {}
+        for mat_obj in Material.objects.filter(codigo__in=cantidades.keys()):
+            utilidad_aplicar = utilidades_por_familia.get(mat_obj.familia, precios.UTILIDAD_POR_DEFECTO)
+            nuevos_materiales[mat_obj.codigo] = linea_cotizacion(
+                cantidades[mat_obj.codigo], mat_obj.costo_unitario, utilidad_aplicar
+            )
+
+        # La revisión se guarda como delta contra la cotización base (ver app.revisiones)
+        documento = original.documento
+        revisiones.crear_revision(original, nuevo_nombre, {
+            'cliente': documento.get('cliente'),
+            'ingeniero_encargado': documento.get('ingeniero_encargado'),
+            'direccion_proyecto': documento.get('direccion_proyecto'),
+            'descripcion': documento.get('descripcion'),
+            'utilidades': {
+                familia: utilidad / precios.BASE_UTILIDAD for familia, utilidad in utilidades_por_familia.items()
+            },
+            'materiales': nuevos_materiales,
+        })
         return redirect('cotizacion-list')
 
 
+@require_http_methods(["GET"])
+def diferencias_cotizacion(request, pk):
+    """
+    Diferencias entre dos versiones de la misma cotización: ?a=<pk>&b=<pk>
+    (base o revisiones). Por defecto compara la base con la cotización `pk`.
+    """
+    cotizacion = get_object_or_404(Cotizacion.objects.select_related('revision_de'), pk=pk)
+    versiones = {c.pk: c for c in revisiones.familia(cotizacion)}
+    base = revisiones.base_de(cotizacion)
+    try:
+        a = versiones[int(request.GET.get('a', base.pk))]
+        b = versiones[int(request.GET.get('b', cotizacion.pk))]
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Las versiones deben ser de la misma cotización."}, status=400)
+
+    diferencias = revisiones.diferencias(a.documento, b.documento)
+    codigos = {codigo for grupo in ('agregados', 'eliminados', 'modificados') for codigo, *_ in diferencias[grupo]}
+    return render(request, 'project_app/cotizacion_diferencias.html', {
+        'cotizacion': cotizacion,
+        'versiones': list(versiones.values()),
+        'a': a,
+        'b': b,
+        'diferencias': diferencias,
+        'materiales': Material.objects.in_bulk(codigos, field_name='codigo'),
+    })
+
+
 User = get_user_model()
 @transaction.atomic
 def generar_obra_desde_cotizacion(request, cotizacion_id):
     # 1. Obtener la cotización y sus datos
-    cotizacion = get_object_or_404(Cotizacion, id=cotizacion_id)
-    datos = cotizacion.datos
+    cotizacion = get_object_or_404(Cotizacion.objects.select_related('revision_de'), id=cotizacion_id)
+    datos = cotizacion.documento
     materiales_json = datos.get('materiales', {})
     
     # 2. Buscar al ingeniero encargado (Asumiendo que el string coincide con username o first_name)
@@ -1135,6 +1123,9 @@ def generar_obra_desde_cotizacion(request, cotizacion_id):
     codigos_materiales = list(materiales_json.keys())
     db_materiales = Material.objects.filter(codigo__in=codigos_materiales)
     material_map = {m.codigo: m for m in db_materiales}
+    importes = dict(zip(
+        materiales_json, precios.Presupuesto.desde_materiales(materiales_json).importes
+    ))
 
     for codigo, info in materiales_json.items():
         if codigo not in material_map:
@@ -1144,8 +1135,8 @@ def generar_obra_desde_cotizacion(request, cotizacion_id):
 
         material = material_map[codigo]
         cantidad = Decimal(str(info['cantidad']))
-        costo_unitario = Decimal(str(info['costo_unitario']))
-        costo_total_item = cantidad * costo_unitario
+        # Mismo importe en centavos que el PDF de la cotización (ver app.precios)
+        costo_total_item = precios.a_decimal(importes[codigo])
         
         presupuesto_total_obra += costo_total_item
         familia_upper = material.familia.upper()
@@ -1207,6 +1198,7 @@ def generar_obra_desde_cotizacion(request, cotizacion_id):
         fecha_inicio=fecha_inicio_proyecto,
         fecha_fin_estimada=fecha_fin_obra,
         presupuesto_inicial=presupuesto_total_obra,
+        cotizacion=cotizacion,
         # centro_servicio se deja null o se asigna lógica personalizada
     )
 
@@ -1321,4 +1313,6 @@ def crear_tarea_y_reqs(fase_obj, nombre_tarea, f_inicio, f_fin, items_materiales
     
     # Bulk create para mejor rendimiento
     if requerimientos:
-        RequerimientoMaterial.objects.bulk_create(requerimientos)
\ No newline at end of file
+        RequerimientoMaterial.objects.bulk_create(requerimientos)
+        # bulk_create no emite señales: actualizamos el resumen de la tarea
+        avance.recalcular_tareas([tarea.pk])
\ No newline at end of file
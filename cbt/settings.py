@@ -110,6 +110,12 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# PDF de cotizaciones ya generados (ver app.pdf)
+PDF_CACHE_DIR = BASE_DIR / 'cache' / 'pdf'
+
+# Diagramas de Gantt de las obras ya dibujados (ver app.gantt)
+GANTT_CACHE_DIR = BASE_DIR / 'cache' / 'gantt'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -2,6 +2,14 @@ import sqlite3
 import csv
 import os
 
+import django
+
+# nombre_busqueda se calcula igual que al guardar un Material desde Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cbt.settings')
+django.setup()
+
+from app.models import normalizar_busqueda
+
 def cargar_datos_masivos_sqlite(nombre_archivo_csv, ruta_bd, nombre_tabla, codificacion='utf-8'):
     """
     Carga datos masivamente desde un archivo CSV a una tabla en una base de datos SQLite.
@@ -26,13 +34,14 @@ def cargar_datos_masivos_sqlite(nombre_archivo_csv, ruta_bd, nombre_tabla, codif
                 # Se limpia el espacio en blanco al final de algunos campos.
                 fila = [x.strip() for x in fila]
                 fila.append(0)  # Agregar stock inicial como 0
+                fila.append(normalizar_busqueda(fila[1]))
                 datos_para_insertar.append(fila)
 
             # Prepara la consulta SQL para la inserción
             placeholders = ', '.join(['?'] * len(datos_para_insertar[0]))
             
-            # La consulta de inserción especifica las 5 columnas del CSV.
-            consulta_insert = f"INSERT INTO {nombre_tabla} (codigo, nombre, unidad, familia, sistema, costo_unitario, stock) VALUES ({placeholders})"
+            # La consulta de inserción especifica las columnas del CSV más stock y nombre_busqueda.
+            consulta_insert = f"INSERT INTO {nombre_tabla} (codigo, nombre, unidad, familia, sistema, costo_unitario, stock, nombre_busqueda) VALUES ({placeholders})"
             
             # Usar `executemany` para una carga masiva eficiente
             cursor.executemany(consulta_insert, datos_para_insertar)
@@ -6,10 +6,27 @@ from django.contrib.auth.views import LoginView
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 
+from app.exportacion import formato_pedido, respuesta_exportacion
+
 from .models import Reporte
 from .forms import (ReporteAdminForm)
 
 
+COLUMNAS_REPORTES = [
+    ('Referencia', lambda reporte: reporte.referencia),
+    ('Fecha', lambda reporte: reporte.fecha),
+    ('Cliente', lambda reporte: str(reporte.cliente)),
+    ('Sucursal', lambda reporte: reporte.sucursal),
+    ('Clasificación', lambda reporte: reporte.clasificacion),
+    ('Equipo', lambda reporte: str(reporte.equipo) if reporte.equipo_id else ''),
+    ('Reporte', lambda reporte: reporte.reporte),
+    ('Falla', lambda reporte: reporte.falla),
+    ('Estatus', lambda reporte: reporte.estatus),
+    ('Urgencia', lambda reporte: reporte.urgencia),
+    ('Observaciones', lambda reporte: reporte.observaciones),
+]
+
+
 def is_coordinador(user):
     return user.groups.filter(name='Coordinadores').exists()
 
@@ -64,5 +81,10 @@ def datatable(request):
         reportes = Reporte.objects.filter(sucursal=sucursal, estatus=False)
     else:
         reportes = Reporte.objects.all()
+    formato = formato_pedido(request)
+    if formato:
+        return respuesta_exportacion(
+            reportes.select_related('cliente', 'equipo'), COLUMNAS_REPORTES, 'reportes', formato
+        )
     contexto = {'reportes': reportes}
     return render(request, 'servicio/datatable.html', contexto)
\ No newline at end of file